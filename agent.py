@@ -3,11 +3,11 @@ from dataclasses import dataclass, field
 import time, importlib, inspect, os, json
 from typing import Any, Optional, Dict, TypedDict
 import uuid
-from python.helpers import extract_tools, rate_limiter, files, errors
+from python.helpers import extract_tools, rate_limiter, files, errors, tokens
 from python.helpers.print_style import PrintStyle
 from langchain.schema import AIMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.language_models.llms import BaseLLM
 from langchain_core.embeddings import Embeddings
@@ -59,18 +59,28 @@ class AgentContext:
     @staticmethod
     def remove(id: str):
         context = AgentContext._contexts.pop(id, None)
-        if context and context.process:
-            context.process.kill()
+        if context:
+            context.kill()
         return context
 
     def reset(self):
-        if self.process:
-            self.process.kill()
+        self.kill()
         self.log.reset()
         self.agent0 = Agent(0, self.config, self)
         self.streaming_agent = None
         self.paused = False
 
+    def kill(self):
+        # stops the running process and background summarization of all agents in the chain
+        if self.process:
+            self.process.kill()
+        agent = self.agent0
+        while agent:
+            if agent.compaction_task:
+                agent.compaction_task.cancel()
+                agent.compaction_task = None
+            agent = agent.data.get("subordinate", None)
+
     def communicate(self, msg: str, broadcast_level: int = 1):
         self.paused = False  # unpause if paused
 
@@ -121,12 +131,17 @@ class AgentConfig:
     prompts_subdir: str = ""
     memory_subdir: str = ""
     knowledge_subdirs: list[str] = field(default_factory=lambda: ["default", "custom"])
+    knowledge_import_workers: int = 4  # processes parsing knowledge files, 1 parses them in the agent process
+    memory_index_type: str = "flat"  # flat, hnsw, hnsw_sq8, ivf, ivf_pq, ivf_sq8
+    memory_index_threshold: int = 10000
+    memory_mmap: bool = False  # map vectors from disk and fetch documents lazily, shared between processes
     auto_memory_count: int = 3
     auto_memory_skip: int = 2
     rate_limit_seconds: int = 60
     rate_limit_requests: int = 15
     rate_limit_input_tokens: int = 0
     rate_limit_output_tokens: int = 0
+    msgs_max_tokens: int = 16000
     msgs_keep_max: int = 25
     msgs_keep_start: int = 5
     msgs_keep_end: int = 10
@@ -149,28 +164,90 @@ class AgentConfig:
     code_exec_ssh_port: int = 50022
     code_exec_ssh_user: str = "root"
     code_exec_ssh_pass: str = "toor"
+    hot_reload: bool = False
     additional: Dict[str, Any] = field(default_factory=dict)
 
 
 class Message:
-    def __init__(self):
-        self.segments: list[str]
-        self.human: bool
+    def __init__(self, human: bool, content: str):
+        self.segments: list[str] = [content]  # consecutive messages of the same type are merged
+        self.human: bool = human
+        self._output: BaseMessage | None = None
+
+    @property
+    def content(self) -> str:
+        return "\n\n".join(self.segments)
+
+    def add_segment(self, content: str):
+        self.segments.append(content)
+        self._output = None
+
+    def output(self) -> BaseMessage:
+        if self._output is None:  # cached, so token counts are cached too
+            self._output = (
+                HumanMessage(content=self.content)
+                if self.human
+                else AIMessage(content=self.content)
+            )
+        return self._output
+
+
+class Summary:
+    def __init__(self, level: int, content: str):
+        self.level = level  # 1 = summary of messages, 2 = summary of level 1 summaries...
+        self.content = content
+        self.human = True
+        self._output: BaseMessage | None = None
+
+    def output(self) -> BaseMessage:
+        if self._output is None:
+            self._output = HumanMessage(content=self.content)
+        return self._output
+
+    def serialize(self) -> dict[str, Any]:
+        return {"level": self.level, "content": self.content}
 
 
 class Monologue:
     def __init__(self):
         self.done = False
-        self.summary: str = ""
+        self.kept = 0  # number of leading messages placed before the summaries
+        self.summaries: list[Summary] = []  # summaries of older messages of this monologue
         self.messages: list[Message] = []
 
     def finish(self):
-        pass
+        self.done = True
+
+    def nodes(self) -> list["Message | Summary"]:
+        return self.messages[: self.kept] + self.summaries + self.messages[self.kept :]  # type: ignore
+
+
+class Compaction:
+    # part of history to be summarized into one summary of given level
+    def __init__(
+        self,
+        items: list["Message | Summary"],
+        level: int,
+        tier: list[Summary],
+        monologue: Monologue | None = None,
+    ):
+        self.items = items
+        self.level = level
+        self.tier = tier  # summaries list the new summary goes to
+        self.monologue = monologue  # monologue the items are taken from
+        self.sizes = [len(item.segments) if isinstance(item, Message) else 0 for item in items]
 
 
 class History:
+
+    CHUNK_SIZE = 6  # messages summarized together
+    ROLLUP_SIZE = 3  # summaries of one level rolled into a summary of the next level
+
     def __init__(self):
+        self.summaries: list[Summary] = []  # summaries of finished monologues, oldest first
         self.monologues: list[Monologue] = []
+        # merged messages of consecutive nodes, keyed by ids of the node outputs they were built from
+        self._merged: dict[tuple[int, ...], tuple[list[BaseMessage], BaseMessage]] = {}
         self.start_monologue()
 
     def current_monologue(self):
@@ -178,10 +255,180 @@ class History:
 
     def start_monologue(self):
         if self.monologues:
+            if not self.current_monologue().messages:
+                return self.current_monologue()  # reuse empty monologue
             self.current_monologue().finish()
         self.monologues.append(Monologue())
         return self.current_monologue()
 
+    def add_message(self, content: str, human: bool) -> Message:
+        messages = self.current_monologue().messages
+        if messages and messages[-1].human == human:
+            messages[-1].add_segment(content)
+        else:
+            messages.append(Message(human, content))
+        return messages[-1]
+
+    def get_last_message(self) -> Message | None:
+        for monologue in reversed(self.monologues):
+            if monologue.messages:
+                return monologue.messages[-1]
+        return None
+
+    def nodes(self) -> list[Message | Summary]:
+        result: list[Message | Summary] = list(self.summaries)
+        for monologue in self.monologues:
+            result += monologue.nodes()
+        return result
+
+    def output(self) -> list[BaseMessage]:
+        # summaries next to human messages are merged to keep alternation
+        groups: list[list[Message | Summary]] = []
+        for node in self.nodes():
+            if groups and groups[-1][0].human == node.human:
+                groups[-1].append(node)
+            else:
+                groups.append([node])
+
+        merged = {}
+        result: list[BaseMessage] = []
+        for group in groups:
+            outputs = [node.output() for node in group]
+            if len(outputs) == 1:
+                result.append(outputs[0])
+                continue
+            # node outputs are cached until the node changes, so unchanged groups reuse their message
+            key = tuple(map(id, outputs))
+            cached = self._merged.get(key)
+            if cached is None:
+                content = "\n\n".join(str(output.content) for output in outputs)
+                message = HumanMessage(content=content) if group[0].human else AIMessage(content=content)
+                cached = (outputs, message)  # outputs are kept so their ids are not reused
+            merged[key] = cached
+            result.append(cached[1])
+        self._merged = merged
+        return result
+
+    def get_compaction(self, keep_start: int, keep_end: int) -> Compaction | None:
+        # oldest material goes first, every text is summarized only once
+        compaction = History._get_rollup(self.summaries)
+        if compaction:
+            return compaction
+
+        recent = self.nodes()[-keep_end:] if keep_end > 0 else []
+
+        # messages of a finished monologue into one summary, its summaries are kept as they are
+        for monologue in self.monologues[:-1]:
+            items = monologue.messages
+            if items and not any(item in recent for item in monologue.nodes()):
+                return Compaction(list(items), 1, self.summaries, monologue)
+
+        monologue = self.current_monologue()
+        compaction = History._get_rollup(monologue.summaries, monologue)
+        if compaction:
+            return compaction
+
+        # chunk of oldest messages after the kept ones
+        start = monologue.kept if monologue.summaries else keep_start
+        items = [
+            msg
+            for msg in monologue.messages[start : start + History.CHUNK_SIZE]
+            if msg not in recent
+        ]
+        if items:
+            return Compaction(items, 1, monologue.summaries, monologue)  # type: ignore
+        return None
+
+    @staticmethod
+    def _get_rollup(tier: list[Summary], monologue: Monologue | None = None):
+        levels = [summary.level for summary in tier]
+        for level in sorted(set(levels), reverse=True):
+            if levels.count(level) > History.ROLLUP_SIZE:
+                items = [summary for summary in tier if summary.level == level]
+                return Compaction(items[: History.ROLLUP_SIZE], level + 1, tier, monologue)  # type: ignore
+        return None
+
+    def apply_compaction(self, compaction: Compaction, content: str) -> bool:
+        # check the items are still in place and unchanged
+        monologue = compaction.monologue
+        if monologue and monologue not in self.monologues:
+            return False
+        for item, size in zip(compaction.items, compaction.sizes):
+            if isinstance(item, Message):
+                if (
+                    not monologue
+                    or item not in monologue.messages
+                    or len(item.segments) != size
+                ):
+                    return False
+            elif item not in (monologue.summaries if monologue else compaction.tier):
+                return False
+
+        summary = Summary(compaction.level, content)
+        if monologue and compaction.tier is self.summaries:
+            # whole finished monologue, its summaries go to the history tier for rollups
+            self.monologues.remove(monologue)
+            self.summaries += monologue.summaries + [summary]
+        elif isinstance(compaction.items[0], Summary):
+            # rollup of summaries, new one takes the place of the first one
+            index = compaction.tier.index(compaction.items[0])
+            for item in compaction.items:
+                compaction.tier.remove(item)  # type: ignore
+            compaction.tier.insert(index, summary)
+        elif monologue:
+            # chunk of messages
+            if not monologue.summaries:
+                monologue.kept = monologue.messages.index(compaction.items[0])  # type: ignore
+            for item in compaction.items:
+                monologue.messages.remove(item)  # type: ignore
+            monologue.summaries.append(summary)
+            if monologue.done and not monologue.messages:
+                # finished while it was summarized, nothing left to summarize
+                self.monologues.remove(monologue)
+                self.summaries += monologue.summaries
+        return True
+
+    def serialize(self) -> dict[str, Any]:
+        return {
+            "summaries": [summary.serialize() for summary in self.summaries],
+            "monologues": [
+                {
+                    "done": monologue.done,
+                    "kept": monologue.kept,
+                    "summaries": [summary.serialize() for summary in monologue.summaries],
+                    "messages": [
+                        {"human": msg.human, "segments": msg.segments}
+                        for msg in monologue.messages
+                    ],
+                }
+                for monologue in self.monologues
+            ],
+        }
+
+    @staticmethod
+    def deserialize(data: dict[str, Any] | list[dict[str, Any]]) -> "History":
+        history = History()
+        if isinstance(data, list):  # older format, plain list of messages
+            for msg in data:
+                history.add_message(msg.get("content", ""), msg.get("type") == "human")
+            return history
+
+        history.summaries = [Summary(**summary) for summary in data.get("summaries", [])]
+        history.monologues = []
+        for mono in data.get("monologues", []):
+            monologue = Monologue()
+            monologue.done = mono.get("done", False)
+            monologue.kept = mono.get("kept", 0)
+            monologue.summaries = [Summary(**summary) for summary in mono.get("summaries", [])]
+            for msg in mono.get("messages", []):
+                message = Message(msg["human"], "")
+                message.segments = msg["segments"]
+                monologue.messages.append(message)
+            history.monologues.append(monologue)
+        if not history.monologues:
+            history.start_monologue()
+        return history
+
 
 class LoopData:
     def __init__(self):
@@ -208,6 +455,10 @@ class HandledException(Exception):
 
 class Agent:
 
+    COMPACTION_THRESHOLD = 0.8  # start summarizing in background at this part of the history limit
+    COMPACTION_RETRY_SECONDS = 10  # wait after a failed summary, doubled with each further failure
+    COMPACTION_RETRY_MAX_SECONDS = 600
+
     def __init__(
         self, number: int, config: AgentConfig, context: AgentContext | None = None
     ):
@@ -222,16 +473,12 @@ class Agent:
         self.number = number
         self.agent_name = f"Agent {self.number}"
 
-        self.history = []
+        self.history = History()
         self.last_message = ""
         self.intervention_message = ""
-        self.rate_limiter = rate_limiter.RateLimiter(
-            self.context.log,
-            max_calls=self.config.rate_limit_requests,
-            max_input_tokens=self.config.rate_limit_input_tokens,
-            max_output_tokens=self.config.rate_limit_output_tokens,
-            window_seconds=self.config.rate_limit_seconds,
-        )
+        self.compaction_task: asyncio.Task | None = None
+        self.compaction_failures = 0
+        self.compaction_retry_at = 0.0
         self.data = {}  # free data object all the tools can use
 
     async def monologue(self, msg: str):
@@ -240,7 +487,8 @@ class Agent:
                 # loop data dictionary to pass to extensions
                 loop_data = LoopData()
                 loop_data.message = msg
-                loop_data.history_from = len(self.history)
+                self.history.start_monologue()
+                loop_data.history_from = len(self.history.output())
 
                 # call monologue_start extensions
                 await self.call_extensions("monologue_start", loop_data=loop_data)
@@ -258,9 +506,12 @@ class Agent:
 
                     try:
 
+                        # swap in history summarized in background, if ready
+                        await self.apply_history_compaction()
+
                         # set system prompt and message history
                         loop_data.system = []
-                        loop_data.history = self.history
+                        loop_data.history = self.history.output()
 
                         # and allow extensions to edit them
                         await self.call_extensions(
@@ -268,18 +519,25 @@ class Agent:
                         )
 
                         # build chain from system prompt, message history and model
+                        system_text = "\n\n".join(loop_data.system)
                         prompt = ChatPromptTemplate.from_messages(
                             [
-                                SystemMessage(content="\n\n".join(loop_data.system)),
+                                SystemMessage(content=system_text),
                                 MessagesPlaceholder(variable_name="messages"),
                             ]
                         )
                         chain = prompt | self.config.chat_model
 
-                        # rate limiter TODO - move to extension, make per-model
-                        formatted_inputs = prompt.format(messages=self.history)
-                        tokens = int(len(formatted_inputs) / 4)
-                        self.rate_limiter.limit_call_and_input(tokens)
+                        # rate limiter TODO - move to extension
+                        # history messages are counted once and cached, only new ones get tokenized
+                        counter = tokens.get_counter(self.config.chat_model)
+                        input_tokens = counter.count(
+                            system_text
+                        ) + counter.count_messages(loop_data.history)
+                        limiter = self.get_rate_limiter(self.config.chat_model)
+                        call_record = await limiter.limit_call_and_input(
+                            input_tokens, self.context.log
+                        )
 
                         # output that the agent is starting
                         PrintStyle(
@@ -291,6 +549,7 @@ class Agent:
                         log = self.context.log.log(
                             type="agent", heading=f"{self.agent_name}: Generating"
                         )
+                        stream_parser = DirtyJson()
 
                         async for chunk in chain.astream(
                             {"messages": loop_data.history}
@@ -313,11 +572,11 @@ class Agent:
                                 agent_response += (
                                     content  # concatenate stream into the response
                                 )
-                                self.log_from_stream(agent_response, log)
+                                self.log_from_stream(content, stream_parser, log)
 
-                        self.rate_limiter.set_output_tokens(
-                            int(len(agent_response) / 4)
-                        )  # rough estimation
+                        limiter.set_output_tokens(
+                            call_record, counter.count(agent_response)
+                        )
 
                         await self.handle_intervention(agent_response)
 
@@ -404,7 +663,7 @@ class Agent:
         ):  # if agent has custom folder, use it and use default as backup
             prompt_dir = files.get_abs_path("prompts", self.config.prompts_subdir)
             backup_dir.append(files.get_abs_path("prompts/default"))
-        return files.read_file(
+        return files.read_template(
             files.get_abs_path(prompt_dir, file), backup_dirs=backup_dir, **kwargs
         )
 
@@ -415,25 +674,20 @@ class Agent:
         self.data[field] = value
 
     async def append_message(self, msg: str, human: bool = False):
-        message_type = "human" if human else "ai"
-        if self.history and self.history[-1].type == message_type:
-            self.history[-1].content += "\n\n" + msg
-        else:
-            new_message = HumanMessage(content=msg) if human else AIMessage(content=msg)
-            self.history.append(new_message)
-            await self.cleanup_history(
-                self.config.msgs_keep_max,
-                self.config.msgs_keep_start,
-                self.config.msgs_keep_end,
-            )
-        if message_type == "ai":
+        self.history.add_message(msg, human)
+        self.schedule_history_compaction()
+        if not human:
             self.last_message = msg
 
     def concat_messages(self, messages):
         return "\n".join([f"{msg.type}: {msg.content}" for msg in messages])
 
     async def call_utility_llm(
-        self, system: str, msg: str, callback: Callable[[str], None] | None = None
+        self,
+        system: str,
+        msg: str,
+        callback: Callable[[str], None] | None = None,
+        interruptible: bool = True,
     ):
         prompt = ChatPromptTemplate.from_messages(
             [SystemMessage(content=system), HumanMessage(content=msg)]
@@ -442,12 +696,14 @@ class Agent:
         chain = prompt | self.config.utility_model
         response = ""
 
-        formatted_inputs = prompt.format()
-        tokens = int(len(formatted_inputs) / 4)
-        self.rate_limiter.limit_call_and_input(tokens)
+        counter = tokens.get_counter(self.config.utility_model)
+        input_tokens = counter.count(system) + counter.count(msg)
+        limiter = self.get_rate_limiter(self.config.utility_model)
+        call_record = await limiter.limit_call_and_input(input_tokens, self.context.log)
 
         async for chunk in chain.astream({}):
-            await self.handle_intervention()  # wait for intervention and handle it, if paused
+            if interruptible:  # background calls must not consume intervention messages
+                await self.handle_intervention()  # wait for intervention and handle it, if paused
 
             if isinstance(chunk, str):
                 content = chunk
@@ -461,15 +717,26 @@ class Agent:
 
             response += content
 
-        self.rate_limiter.set_output_tokens(int(len(response) / 4))
+        limiter.set_output_tokens(call_record, counter.count(response))
 
         return response
 
+    def get_rate_limiter(self, model) -> rate_limiter.RateLimiter:
+        # one limiter per model endpoint, shared by all agents
+        return rate_limiter.get_limiter(
+            model,
+            max_calls=self.config.rate_limit_requests,
+            max_input_tokens=self.config.rate_limit_input_tokens,
+            max_output_tokens=self.config.rate_limit_output_tokens,
+            window_seconds=self.config.rate_limit_seconds,
+        )
+
     def get_last_message(self):
-        if self.history:
-            return self.history[-1]
+        message = self.history.get_last_message()
+        if message:
+            return message.output()
 
-    async def replace_middle_messages(self, middle_messages):
+    async def replace_middle_messages(self, middle_messages, interruptible: bool = True):
         cleanup_prompt = self.read_prompt("fw.msg_cleanup.md")
         log_item = self.context.log.log(
             type="util", heading="Mid messages cleanup summary"
@@ -488,35 +755,102 @@ class Agent:
             system=cleanup_prompt,
             msg=self.concat_messages(middle_messages),
             callback=log_callback,
+            interruptible=interruptible,
         )
         new_human_message = HumanMessage(content=summary)
         return [new_human_message]
 
-    async def cleanup_history(self, max: int, keep_start: int, keep_end: int):
-        if len(self.history) <= max:
-            return self.history
-
-        first_x = self.history[:keep_start]
-        last_y = self.history[-keep_end:]
-
-        # Identify the middle part
-        middle_part = self.history[keep_start:-keep_end]
-
-        # Ensure the first message in the middle is "human", if not, move one message back
-        if middle_part and middle_part[0].type != "human":
-            if len(first_x) > 0:
-                middle_part.insert(0, first_x.pop())
-
-        # Ensure the middle part has an odd number of messages
-        if len(middle_part) % 2 == 0:
-            middle_part = middle_part[:-1]
+    def get_history_compaction(
+        self,
+        max: int,
+        keep_start: int,
+        keep_end: int,
+        max_tokens: int = 0,
+        ratio: float = 1.0,
+    ) -> Compaction | None:
+        # returns the next part of history to summarize, if history is over the limit
+        output = self.history.output()
+        if max_tokens > 0:  # token budget, message count limit is not used then
+            counter = tokens.get_counter(self.config.chat_model)
+            if counter.count_messages(output) <= max_tokens * ratio:
+                return None
+            # keep only as many of the last messages as fit in half of the budget
+            end_tokens = 0
+            for i in range(1, min(keep_end, len(output)) + 1):
+                end_tokens += counter.count_message(output[-i])
+                if end_tokens > max_tokens // 2 and i > 1:
+                    keep_end = i - 1
+                    break
+        elif len(output) <= max * ratio:
+            return None
 
-        # Replace the middle part using the replacement function
-        new_middle_part = await self.replace_middle_messages(middle_part)
+        keep_end = keep_end if keep_end > 0 else 1
+        return self.history.get_compaction(keep_start, keep_end)
+
+    def schedule_history_compaction(self):
+        # start summarizing before the history limit is reached, the result is applied by apply_history_compaction
+        if self.compaction_task:
+            return  # running or waiting to be applied
+        if time.time() < self.compaction_retry_at:
+            return  # backing off after a failure
+        compaction = self._get_compaction(Agent.COMPACTION_THRESHOLD)
+        if not compaction:
+            return
+        self.compaction_task = asyncio.create_task(self._compact_history(compaction))
+        self.compaction_task.add_done_callback(self._compaction_done)
+
+    def _get_compaction(self, ratio: float) -> Compaction | None:
+        return self.get_history_compaction(
+            self.config.msgs_keep_max,
+            self.config.msgs_keep_start,
+            self.config.msgs_keep_end,
+            self.config.msgs_max_tokens,
+            ratio=ratio,
+        )
 
-        self.history = first_x + new_middle_part + last_y
+    async def _summarize(self, compaction: Compaction, interruptible: bool = True) -> str:
+        messages = [item.output() for item in compaction.items]
+        summary = await self.replace_middle_messages(messages, interruptible)
+        return str(summary[0].content)
+
+    async def _compact_history(self, compaction: Compaction):
+        summary = await self._summarize(compaction, interruptible=False)
+        return compaction, summary
+
+    def _compaction_done(self, task: asyncio.Task):
+        # failures are reported right away, not only when the next loop iteration applies the result
+        if task.cancelled() or not task.exception():
+            return
+        if self.compaction_task is task:
+            self.compaction_task = None
+        # the next attempt waits, a failing utility model is not called again on every message
+        self.compaction_failures += 1
+        self.compaction_retry_at = time.time() + min(
+            Agent.COMPACTION_RETRY_SECONDS * 2 ** (self.compaction_failures - 1),
+            Agent.COMPACTION_RETRY_MAX_SECONDS,
+        )
+        error_message = errors.format_error(task.exception())  # type: ignore
+        PrintStyle(font_color="red", padding=True).print(error_message)
+        self.context.log.log(type="error", content=error_message)
 
-        return self.history
+    async def apply_history_compaction(self):
+        # called between loop iterations, swaps finished summaries into history in one step each
+        # while history is over the limit, the loop waits for them instead of sending it
+        while True:
+            task = self.compaction_task
+            if task and not task.done() and self._get_compaction(1.0):
+                await asyncio.wait([task])
+            if not task or not task.done():
+                return
+            self.compaction_task = None
+            if task.cancelled() or task.exception():
+                return  # failure was reported by _compaction_done
+
+            compaction, summary = task.result()
+            # the summarized parts must still be in history unchanged, otherwise the summary is dropped
+            if self.history.apply_compaction(compaction, summary):
+                self.compaction_failures = 0
+            self.schedule_history_compaction()  # history may still be over the limit
 
     async def handle_intervention(self, progress: str = ""):
         while self.context.paused:
@@ -564,24 +898,22 @@ class Agent:
                 type="error", content=f"{self.agent_name}: Message misformat"
             )
 
-    def log_from_stream(self, stream: str, logItem: Log.LogItem):
-        try:
-            if len(stream) < 25:
-                return  # no reason to try
-            response = DirtyJson.parse_string(stream)
-            if isinstance(response, dict):
-                logItem.update(
-                    content=stream, kvps=response
-                )  # log if result is a dictionary already
-        except Exception as e:
-            pass
+    def log_from_stream(self, chunk: str, parser: DirtyJson, logItem: Log.LogItem):
+        # the chunk is appended to the log item, the parsed response is shared with it as it grows,
+        # so it is only changed under the log lock and copied when the item is sent
+        with logItem.log.changed:
+            try:
+                response = parser.feed(chunk)  # parser keeps its state, only the new chunk is parsed
+            except Exception:
+                response = None  # not a json response (yet)
+            logItem.stream(content=chunk, kvps=response if isinstance(response, dict) else None)
 
     def get_tool(self, name: str, args: dict, message: str, **kwargs):
         from python.tools.unknown import Unknown
         from python.helpers.tool import Tool
 
-        classes = extract_tools.load_classes_from_folder(
-            "python/tools", name + ".py", Tool
+        classes = extract_tools.get_classes_from_folder(
+            "python/tools", name + ".py", Tool, hot_reload=self.config.hot_reload
         )
         tool_class = classes[0] if classes else Unknown
         return tool_class(agent=self, name=name, args=args, message=message, **kwargs)
@@ -589,8 +921,8 @@ class Agent:
     async def call_extensions(self, folder: str, **kwargs) -> Any:
         from python.helpers.extension import Extension
 
-        classes = extract_tools.load_classes_from_folder(
-            "python/extensions/" + folder, "*", Extension
+        classes = extract_tools.get_classes_from_folder(
+            "python/extensions/" + folder, "*", Extension, hot_reload=self.config.hot_reload
         )
         for cls in classes:
             await cls(agent=self).execute(**kwargs)
@@ -33,12 +33,17 @@ def initialize():
         # prompts_subdir = "default",
         # memory_subdir = "",
         knowledge_subdirs = ["default","custom"],
+        # knowledge_import_workers = 4,
+        # memory_index_type = "flat",
+        # memory_index_threshold = 10000,
+        # memory_mmap = False,
         auto_memory_count = 0,
         # auto_memory_skip = 2,
         # rate_limit_seconds = 60,
         rate_limit_requests = 30,
         # rate_limit_input_tokens = 0,
         # rate_limit_output_tokens = 0,
+        # msgs_max_tokens = 16000,
         # msgs_keep_max = 25,
         # msgs_keep_start = 5,
         # msgs_keep_end = 10,
@@ -57,6 +62,7 @@ def initialize():
         # code_exec_ssh_port = 50022,
         # code_exec_ssh_user = "root",
         # code_exec_ssh_pass = "toor",
+        # hot_reload = False,
         # additional = {},
     )
 
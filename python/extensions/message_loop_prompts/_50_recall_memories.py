@@ -19,6 +19,14 @@ class RecallMemories(Extension):
 
     async def search_memories(self, loop_data: LoopData, **kwargs):
         # try:
+        # memory is loaded in background, recall is skipped until it is ready
+        db = Memory.get_ready(self.agent)
+        if not db:
+            self.agent.context.log.log(
+                type="info", content="Memory is still loading, skipping memories recall.", temp=True
+            )
+            return
+
         # show temp info message
         self.agent.context.log.log(
             type="info", content="Searching memories...", temp=True
@@ -32,7 +40,7 @@ class RecallMemories(Extension):
 
         # get system message and chat history for util llm
         msgs_text = self.agent.concat_messages(
-            self.agent.history[-RecallMemories.HISTORY :]
+            self.agent.history.output()[-RecallMemories.HISTORY :]
         )  # only last X messages
         system = self.agent.read_prompt(
             "memory.memories_query.sys.md", history=msgs_text
@@ -47,9 +55,6 @@ class RecallMemories(Extension):
             system=system, msg=loop_data.message, callback=log_callback
         )
 
-        # get solutions database
-        db = await Memory.get(self.agent)
-
         memories = await db.search_similarity_threshold(
             query=query,
             limit=RecallMemories.RESULTS,
@@ -1,5 +1,5 @@
 from python.helpers.extension import Extension
-from python.helpers.memory import Memory
+from python.helpers.memory import Memory, SearchFilter
 from agent import LoopData
 
 
@@ -20,6 +20,14 @@ class RecallSolutions(Extension):
 
     async def search_solutions(self, loop_data: LoopData, **kwargs):
         # try:
+        # memory is loaded in background, recall is skipped until it is ready
+        db = Memory.get_ready(self.agent)
+        if not db:
+            self.agent.context.log.log(
+                type="info", content="Memory is still loading, skipping solutions recall.", temp=True
+            )
+            return
+
         # show temp info message
         self.agent.context.log.log(
             type="info", content="Searching memory for solutions...", temp=True
@@ -33,7 +41,7 @@ class RecallSolutions(Extension):
 
         # get system message and chat history for util llm
         msgs_text = self.agent.concat_messages(
-            self.agent.history[-RecallSolutions.HISTORY :]
+            self.agent.history.output()[-RecallSolutions.HISTORY :]
         )  # only last X messages
         system = self.agent.read_prompt(
             "memory.solutions_query.sys.md", history=msgs_text
@@ -48,20 +56,23 @@ class RecallSolutions(Extension):
             system=system, msg=loop_data.message, callback=log_callback
         )
 
-        # get solutions database
-        db = await Memory.get(self.agent)
-
-        solutions = await db.search_similarity_threshold(
-            query=query,
-            limit=RecallSolutions.SOLUTIONS_COUNT,
-            threshold=RecallSolutions.THRESHOLD,
-            filter=f"area == '{Memory.Area.SOLUTIONS.value}'",
-        )
-        instruments = await db.search_similarity_threshold(
-            query=query,
-            limit=RecallSolutions.INSTRUMENTS_COUNT,
-            threshold=RecallSolutions.THRESHOLD,
-            filter=f"area == '{Memory.Area.INSTRUMENTS.value}'",
+        # solutions and instruments in one search
+        [[solutions, instruments]] = await db.search_many(
+            queries=[query],
+            per_query_filters=[
+                [
+                    SearchFilter(
+                        filter=f"area == '{Memory.Area.SOLUTIONS.value}'",
+                        limit=RecallSolutions.SOLUTIONS_COUNT,
+                        threshold=RecallSolutions.THRESHOLD,
+                    ),
+                    SearchFilter(
+                        filter=f"area == '{Memory.Area.INSTRUMENTS.value}'",
+                        limit=RecallSolutions.INSTRUMENTS_COUNT,
+                        threshold=RecallSolutions.THRESHOLD,
+                    ),
+                ]
+            ],
         )
 
         log_item.update(
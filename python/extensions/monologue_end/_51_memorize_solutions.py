@@ -30,7 +30,7 @@ class MemorizeSolutions(Extension):
     async def memorize(self, loop_data: LoopData, log_item: LogItem, **kwargs):
         # get system message and chat history for util llm
         system = self.agent.read_prompt("memory.solutions_sum.sys.md")
-        msgs_text = self.agent.concat_messages(self.agent.history)
+        msgs_text = self.agent.concat_messages(self.agent.history.output())
 
         # log query streamed by LLM
         def log_callback(content):
@@ -56,28 +56,24 @@ class MemorizeSolutions(Extension):
         # save chat history
         db = await Memory.get(self.agent)
 
-        solutions_txt = ""
-        rem = []
-        for solution in solutions:
-            # solution to plain text:
-            txt = f"# Problem\n {solution['problem']}\n# Solution\n {solution['solution']}"
-            solutions_txt += txt + "\n\n"
-
-            # remove previous solutions too similiar to this one
-            if self.REPLACE_THRESHOLD > 0:
-                rem += await db.delete_documents_by_query(
-                    query=txt,
-                    threshold=self.REPLACE_THRESHOLD,
-                    filter=f"area=='{Memory.Area.SOLUTIONS.value}'",
-                )
-                if rem:
-                    rem_txt = "\n\n".join(Memory.format_docs_plain(rem))
-                    log_item.update(replaced=rem_txt)
-
-            # insert new solution
-            db.insert_text(text=txt, metadata={"area": Memory.Area.SOLUTIONS.value})
-
-        solutions_txt = solutions_txt.strip()
+        # solutions to plain text
+        txts = [
+            f"# Problem\n {solution['problem']}\n# Solution\n {solution['solution']}"
+            for solution in solutions
+        ]
+        solutions_txt = "\n\n".join(txts)
+
+        # insert new solutions, remove previous ones too similiar to any of them
+        _, rem = await db.upsert_batch(
+            texts=txts,
+            metadata={"area": Memory.Area.SOLUTIONS.value},
+            threshold=self.REPLACE_THRESHOLD,
+            filter=f"area=='{Memory.Area.SOLUTIONS.value}'",
+        )
+        if rem:
+            rem_txt = "\n\n".join(Memory.format_docs_plain(rem))
+            log_item.update(replaced=rem_txt)
+
         log_item.update(solutions=solutions_txt)
         log_item.update(
             result=f"{len(solutions)} solutions memorized.",
@@ -1,3 +1,18 @@
+import re
+
+# fast path patterns, runs of plain characters are sliced at once instead of char by char
+_string_stops = {quote: re.compile("[" + re.escape(quote) + r"\\]") for quote in ['"', "'", "`"]}
+_unquoted_string_stop = re.compile(r"[:,}\]]")
+_unquoted_key_stop = re.compile(r"[\s:,}\]]")
+_number_run = re.compile(r"[0-9+\-.eE]+")
+_whitespace = re.compile(r"\s+")
+
+# unfinished strings are copied to the result on every fed chunk up to this length,
+# longer ones once they grew by a fraction of their length, so streaming stays linear
+_PARTIAL_EVERY_CHUNK = 64 * 1024
+_PARTIAL_GROWTH = 64
+
+
 class DirtyJson:
     def __init__(self):
         self._reset()
@@ -7,28 +22,99 @@ class DirtyJson:
         self.index = 0
         self.current_char = None
         self.result = None
-        self.stack = []
+        self.completed = False  # no more input will be fed
+        self._root = [None]  # holder of the top level value
+        self._targets: list[tuple[dict | list, str | int]] = []  # where the value being parsed goes
+        self._scan_pos = 0
+        self._parser = None
+        self._error: Exception | None = None
+        self._partial: tuple[dict | list, str | int, list[str], bool] | None = None  # string being parsed
+        self._published: list[str] | None = None  # parts whose first item is in the result already
 
     @staticmethod
     def parse_string(json_string):
         parser = DirtyJson()
         return parser.parse(json_string)
-    
+
     def parse(self, json_string):
         self._reset()
         self.json_string = json_string
-        self.index = self.get_start_pos(self.json_string) #skip any text up to the first brace
-        self.current_char = self.json_string[self.index]
-        self._parse()
-        return self.result
-        
+        return self.finish()
+
     def feed(self, chunk):
+        # streaming mode - the parser state is kept between chunks, so each chunk is only parsed once
+        # returns the partial result, containers are updated in place by following calls
+        if self.index > 0:
+            self.json_string = self.json_string[self.index :]  # drop what has been parsed already
+            self._scan_pos = max(0, self._scan_pos - self.index)
+            self.index = 0
         self.json_string += chunk
-        if not self.current_char and self.json_string:
-            self.current_char = self.json_string[0]
-        self._parse()
+        self._resume()
         return self.result
 
+    def finish(self):
+        # mark the input as complete and parse whatever is left
+        self.completed = True
+        self._resume()
+        return self.result
+
+    def _resume(self):
+        if self._error:
+            raise self._error
+        if self.index < len(self.json_string):
+            self.current_char = self.json_string[self.index]
+        if self._parser is None:
+            self._parser = self._parse()
+        try:
+            next(self._parser)  # runs until more input is needed or parsing is done
+        except StopIteration:
+            pass
+        except Exception as e:
+            self._error = e
+            raise
+        finally:
+            self._publish_partial()
+            self.result = self._root[0]
+
+    def _publish_partial(self):
+        # an unfinished string is joined when the result is handed back, not on every step of the parser
+        if self._partial is None:
+            return
+        container, key, parts, strip = self._partial
+        self._partial = None
+        size = sum(map(len, parts))
+        published = len(parts[0]) if self._published is parts else 0
+        if size > _PARTIAL_EVERY_CHUNK and (size - published) * _PARTIAL_GROWTH < size:
+            return
+        if len(parts) > 1:
+            parts[:] = ["".join(parts)]  # collapsed in place, the parser keeps appending to the same list
+        self._published = parts
+        value = parts[0] if parts else ""
+        container[key] = value.strip() if strip else value  # type: ignore
+
+    def _eof(self):
+        # wait for more input, returns True if the input is complete instead
+        while self.current_char is None:
+            if self.completed:
+                return True
+            yield
+        return False
+
+    def _wait(self, count):
+        # wait until count characters from the current position are available
+        while not self.completed and self.index + count > len(self.json_string):
+            yield
+
+    def _assign(self, value):
+        # place a value (possibly partial) where the currently parsed value belongs
+        container, key = self._targets[-1]
+        container[key] = value  # type: ignore
+
+    def _assign_partial(self, parts: list[str], strip: bool = False):
+        # the partial string is only joined when the parser hands back the result
+        container, key = self._targets[-1]
+        self._partial = (container, key, parts, strip)
+
     def _advance(self, count=1):
         self.index += count
         if self.index < len(self.json_string):
@@ -37,48 +123,52 @@ class DirtyJson:
             self.current_char = None
 
     def _skip_whitespace(self):
-        while self.current_char is not None and self.current_char.isspace():
-            self._advance()
+        while True:
+            if self.current_char is None and (yield from self._eof()):
+                return
+            match = _whitespace.match(self.json_string, self.index)
+            if not match:
+                return
+            self._jump(match.end())
 
     def _parse(self):
-        if self.result is None:
-            self.result = self._parse_value()
-        else:
-            self._continue_parsing()
-
-    def _continue_parsing(self):
-        while self.current_char is not None:
-            if isinstance(self.result, dict):
-                self._parse_object_content()
-            elif isinstance(self.result, list):
-                self._parse_array_content()
-            elif isinstance(self.result, str):
-                self.result = self._parse_string()
-            else:
+        # skip any text up to the first brace, wait for it when streaming
+        while True:
+            start = self._find_start_pos(self.json_string, self._scan_pos)
+            if start != -1 or self.completed:
                 break
+            self._scan_pos = len(self.json_string)
+            yield
+        self.index = max(start, 0)
+        if self.index < len(self.json_string):
+            self.current_char = self.json_string[self.index]
+        self._targets.append((self._root, 0))
+        self._root[0] = yield from self._parse_value()
 
     def _parse_value(self):
-        self._skip_whitespace()
+        yield from self._skip_whitespace()
+        yield from self._wait(3)  # lookahead for {{ and triple quotes
         if self.current_char == '{':
             if self._peek(1) == '{':  # Handle {{
                 self._advance(2)
-            return self._parse_object()
+            return (yield from self._parse_object())
         elif self.current_char == '[':
-            return self._parse_array()
+            return (yield from self._parse_array())
         elif self.current_char in ['"', "'", "`"]:
             if self._peek(2) == self.current_char * 2:  # type: ignore
-                return self._parse_multiline_string()
-            return self._parse_string()
+                return (yield from self._parse_multiline_string())
+            return (yield from self._parse_string())
         elif self.current_char and (self.current_char.isdigit() or self.current_char in ['-', '+']):
-            return self._parse_number()
-        elif self._match("true"):
+            return (yield from self._parse_number())
+        yield from self._wait(10)  # lookahead for literals
+        if self._match("true"):
             return True
         elif self._match('false'):
             return False
         elif self._match('null') or self._match("undefined"):
             return None
         elif self.current_char:
-            return self._parse_unquoted_string()
+            return (yield from self._parse_unquoted_string())
         return None
 
     def _match(self, text: str) -> bool:
@@ -87,131 +177,162 @@ class DirtyJson:
             self._advance(cnt)
             return True
         return False
-    
+
     def _parse_object(self):
         obj = {}
         self._advance()  # Skip opening brace
-        self.stack.append(obj)
-        self._parse_object_content()
+        self._assign(obj)
+        yield from self._parse_object_content(obj)
         return obj
 
-    def _parse_object_content(self):
-        while self.current_char is not None:
-            self._skip_whitespace()
+    def _parse_object_content(self, obj: dict):
+        while self.current_char is not None or not (yield from self._eof()):
+            yield from self._skip_whitespace()
             if self.current_char == '}':
+                yield from self._wait(2)
                 if self._peek(1) == '}':  # Handle }}
                     self._advance(2)
                 else:
                     self._advance()
-                self.stack.pop()
                 return
             if self.current_char is None:
-                self.stack.pop()
                 return  # End of input reached while parsing object
-            
-            key = self._parse_key()
+
+            key = yield from self._parse_key()
             value = None
-            self._skip_whitespace()
-            
+            obj[key] = value
+            self._targets.append((obj, key))
+            yield from self._skip_whitespace()
+
             if self.current_char == ':':
                 self._advance()
-                value = self._parse_value()
+                value = yield from self._parse_value()
             elif self.current_char is None:
                 value = None  # End of input reached after key
             else:
-                value = self._parse_value()
-                
-            self.stack[-1][key] = value
-            
-            self._skip_whitespace()
+                value = yield from self._parse_value()
+
+            self._targets.pop()
+            obj[key] = value
+
+            yield from self._skip_whitespace()
             if self.current_char == ',':
                 self._advance()
                 continue
             elif self.current_char != '}':
                 if self.current_char is None:
-                    self.stack.pop()
                     return  # End of input reached after value
                 continue
 
     def _parse_key(self):
-        self._skip_whitespace()
+        yield from self._skip_whitespace()
         if self.current_char in ['"', "'"]:
-            return self._parse_string()
+            return (yield from self._parse_string(partial=False))
         else:
-            return self._parse_unquoted_key()
+            return (yield from self._parse_unquoted_key())
 
     def _parse_unquoted_key(self):
-        result = ""
-        while self.current_char is not None and not self.current_char.isspace() and self.current_char not in [':', ',', '}', ']']:
-            result += self.current_char
-            self._advance()
-        return result
+        parts = []
+        while True:
+            parts.append(self._scan(_unquoted_key_stop))
+            if self.current_char is not None or (yield from self._eof()):
+                break
+        return "".join(parts)
 
     def _parse_array(self):
         arr = []
         self._advance()  # Skip opening bracket
-        self.stack.append(arr)
-        self._parse_array_content()
+        self._assign(arr)
+        yield from self._parse_array_content(arr)
         return arr
 
-    def _parse_array_content(self):
-        while self.current_char is not None:
-            self._skip_whitespace()
+    def _parse_array_content(self, arr: list):
+        while self.current_char is not None or not (yield from self._eof()):
+            yield from self._skip_whitespace()
             if self.current_char == ']':
                 self._advance()
-                self.stack.pop()
                 return
-            value = self._parse_value()
-            self.stack[-1].append(value)
-            self._skip_whitespace()
+            arr.append(None)
+            self._targets.append((arr, len(arr) - 1))
+            value = yield from self._parse_value()
+            self._targets.pop()
+            arr[-1] = value
+            yield from self._skip_whitespace()
             if self.current_char == ',':
                 self._advance()
             elif self.current_char != ']':
-                self.stack.pop()
                 return
 
-    def _parse_string(self):
-        result = ""
+    def _parse_string(self, partial=True):
+        parts = []
         quote_char = self.current_char
+        stop = _string_stops[quote_char]  # type: ignore
         self._advance()  # Skip opening quote
-        while self.current_char is not None and self.current_char != quote_char:
-            if self.current_char == '\\':
-                self._advance()
-                if self.current_char in ['"', "'", '\\', '/', 'b', 'f', 'n', 'r', 't']:
-                    result += {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}.get(self.current_char, self.current_char)
-                elif self.current_char == 'u':
-                    unicode_char = ""
-                    for _ in range(4):
-                        if self.current_char is None:
-                            return result
-                        unicode_char += self.current_char
-                        self._advance()
-                    result += chr(int(unicode_char, 16))
-                    continue
-            else:
-                result += self.current_char
+        while True:
+            parts.append(self._scan(stop))  # plain run up to the closing quote or an escape
+            if self.current_char is None:
+                if partial:
+                    self._assign_partial(parts)
+                if (yield from self._eof()):
+                    break
+                continue
+            if self.current_char == quote_char:
+                break
+            # escape sequence, char by char
+            self._advance()
+            if self.current_char is None:
+                yield from self._eof()
+            if self.current_char in ['"', "'", '\\', '/', 'b', 'f', 'n', 'r', 't']:
+                parts.append({'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}.get(self.current_char, self.current_char))  # type: ignore
+            elif self.current_char == 'u':
+                unicode_char = ""
+                for _ in range(4):
+                    if self.current_char is None and (yield from self._eof()):
+                        return "".join(parts)
+                    unicode_char += self.current_char  # type: ignore
+                    self._advance()
+                parts.append(chr(int(unicode_char, 16)))
+                continue
             self._advance()
         if self.current_char == quote_char:
             self._advance()  # Skip closing quote
-        return result
+        return "".join(parts)
 
     def _parse_multiline_string(self):
-        result = ""
-        quote_char = self.current_char
+        parts = []
+        end_quote = self.current_char * 3  # type: ignore
         self._advance(3)  # Skip first quote
-        while self.current_char is not None:
-            if self.current_char == quote_char and self._peek(2) == quote_char * 2: # type: ignore
-                self._advance(3)  # Skip first quote
+        while True:
+            end = self.json_string.find(end_quote, self.index)
+            if end != -1:
+                parts.append(self.json_string[self.index : end])
+                self._jump(end + 3)  # Skip closing quotes
                 break
-            result += self.current_char
-            self._advance()
-        return result.strip()
+            if self.completed:
+                parts.append(self.json_string[self.index :])
+                self._jump(len(self.json_string))
+                break
+            # keep the last two characters, they may be the start of closing quotes
+            safe_end = max(self.index, len(self.json_string) - 2)
+            parts.append(self.json_string[self.index : safe_end])
+            self._jump(safe_end)
+            self._assign_partial(parts, strip=True)
+            yield
+        return "".join(parts).strip()
 
     def _parse_number(self):
-        number_str = ""
-        while self.current_char is not None and (self.current_char.isdigit() or self.current_char in ['-', '+', '.', 'e', 'E']):
-            number_str += self.current_char
-            self._advance()
+        parts = []
+        while self.current_char is not None or not (yield from self._eof()):
+            match = _number_run.match(self.json_string, self.index)
+            if match:
+                parts.append(match.group())
+                self._jump(match.end())
+            elif self.current_char.isdigit():  # type: ignore
+                parts.append(self.current_char)  # other unicode digits
+                self._advance()
+            else:
+                break
+        number_str = "".join(parts)
         try:
             return int(number_str)
         except ValueError:
@@ -242,26 +363,41 @@ class DirtyJson:
         return None
 
     def _parse_unquoted_string(self):
-        result = ""
-        while self.current_char is not None and self.current_char not in [':', ',', '}', ']']:
-            result += self.current_char
-            self._advance()
+        parts = []
+        while True:
+            parts.append(self._scan(_unquoted_string_stop))
+            if self.current_char is None:
+                self._assign_partial(parts, strip=True)
+                if (yield from self._eof()):
+                    break
+                continue
+            break
         self._advance()
-        return result.strip()
+        return "".join(parts).strip()
+
+    def _scan(self, stop: re.Pattern) -> str:
+        # consume plain characters up to the first one matching the stop pattern or the end of input
+        start = self.index
+        match = stop.search(self.json_string, start)
+        end = match.start() if match else len(self.json_string)
+        if end > start:
+            self._jump(end)
+        return self.json_string[start:end]
+
+    def _jump(self, index):
+        self.index = index
+        if index < len(self.json_string):
+            self.current_char = self.json_string[index]
+        else:
+            self.current_char = None
 
     def _peek(self, n):
-        peek_index = self.index + 1
-        result = ''
-        for _ in range(n):
-            if peek_index < len(self.json_string):
-                result += self.json_string[peek_index]
-                peek_index += 1
-            else:
-                break
-        return result
+        return self.json_string[self.index + 1 : self.index + 1 + n]
 
     def get_start_pos(self, input_str: str) -> int:
-        chars = ["{", "[", '"']
-        indices = [input_str.find(char) for char in chars if input_str.find(char) != -1]
-        return min(indices) if indices else 0
+        return max(self._find_start_pos(input_str), 0)
 
+    def _find_start_pos(self, input_str: str, start: int = 0) -> int:
+        chars = ["{", "[", '"']
+        indices = [input_str.find(char, start) for char in chars if input_str.find(char, start) != -1]
+        return min(indices) if indices else -1
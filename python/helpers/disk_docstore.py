@@ -0,0 +1,82 @@
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+from python.helpers.embedding_cache import SQLiteByteStore
+
+
+class DiskDocstore(Docstore, AddableMixin):
+    # documents stay in an sqlite file and are fetched when a search hits them,
+    # only a small LRU of recently used documents is kept in memory
+
+    CACHE_SIZE = 1000
+
+    def __init__(self, path: str | Path, cache_size: int = CACHE_SIZE):
+        self.path = Path(path)
+        self.store = SQLiteByteStore(self.path, durable=True)
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, Document] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        self.store.mset([(id, pickle.dumps(doc)) for id, doc in texts.items()])
+        with self._lock:
+            for id, doc in texts.items():
+                self._put(id, doc)
+
+    def delete(self, ids: List) -> None:
+        self.store.mdelete(ids)
+        with self._lock:
+            for id in ids:
+                self._cache.pop(id, None)
+
+    def search(self, search: str) -> Union[str, Document]:
+        doc = self.mget([search])[0]
+        return doc if doc is not None else f"ID {search} not found."
+
+    def mget(self, ids: List[str]) -> List[Optional[Document]]:
+        with self._lock:
+            docs = {id: self._cache[id] for id in ids if id in self._cache}
+            for id in docs:
+                self._cache.move_to_end(id)
+        missing = [id for id in dict.fromkeys(ids) if id not in docs]
+        if missing:
+            loaded = {
+                id: pickle.loads(data)
+                for id, data in zip(missing, self.store.mget(missing))
+                if data is not None
+            }
+            with self._lock:
+                for id, doc in loaded.items():
+                    self._put(id, doc)
+            docs.update(loaded)
+        return [docs.get(id) for id in ids]
+
+    def all(self) -> Dict[str, Document]:
+        ids = list(self.store.yield_keys())
+        return {id: doc for id, doc in zip(ids, self.mget(ids)) if doc is not None}
+
+    def close(self):
+        self.store.close()
+
+    def _put(self, id: str, doc: Document):
+        self._cache[id] = doc
+        self._cache.move_to_end(id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # the snapshot only records that documents are on disk, the file is reopened when loading
+    def __getstate__(self):
+        return {"path": self.path.name}
+
+    def __setstate__(self, state):
+        self.path = Path(state["path"])
+        self.store = None  # type: ignore
+        self.cache_size = DiskDocstore.CACHE_SIZE
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.stores import ByteStore
+
+
+class SQLiteByteStore(ByteStore):
+    # all cached embeddings packed in a single sqlite file instead of one file per key
+
+    BATCH_SIZE = 500  # keys per statement, stays under sqlite's variable limit
+
+    def __init__(self, path: str | Path, durable: bool = False):
+        self.path = Path(path)
+        self._lock = threading.Lock()  # one connection shared by executor threads
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # a cache can lose the last writes on power loss, durable stores sync every commit
+        self._conn.execute(f"PRAGMA synchronous={'FULL' if durable else 'NORMAL'}")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS store (key TEXT PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID")
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        found: dict[str, bytes] = {}
+        with self._lock:
+            for batch in _batches(list(keys), self.BATCH_SIZE):
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM store WHERE key IN ({','.join('?' * len(batch))})", batch
+                )
+                found.update(rows)
+        return [found.get(key) for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[tuple[str, bytes]]) -> None:
+        with self._lock:
+            with self._conn:  # one transaction for the whole batch
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT OR REPLACE INTO store (key, value) VALUES (?, ?)", key_value_pairs)
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("DELETE FROM store WHERE key = ?", [(key,) for key in keys])
+
+    def yield_keys(self, *, prefix: Optional[str] = None) -> Iterator[str]:
+        with self._lock:
+            if prefix:
+                rows = self._conn.execute(
+                    "SELECT key FROM store WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+                ).fetchall()
+            else:
+                rows = self._conn.execute("SELECT key FROM store").fetchall()
+        for (key,) in rows:
+            yield key
+
+    def migrate_dir(self, directory: str | Path):
+        # import files written by LocalFileStore (key = relative path), then remove the directory
+        directory = Path(directory)
+        if not directory.is_dir():
+            return
+        pairs: list[tuple[str, bytes]] = []
+        for root, _, names in os.walk(directory):
+            for name in names:
+                file = Path(root, name)
+                pairs.append((file.relative_to(directory).as_posix(), file.read_bytes()))
+                if len(pairs) >= self.BATCH_SIZE:
+                    self.mset(pairs)
+                    pairs = []
+        if pairs:
+            self.mset(pairs)
+        shutil.rmtree(directory)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _batches(items: list, size: int) -> Iterator[list]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class QueryEmbeddingCache:
+    # in-process LRU of query embeddings with TTL, optionally backed by a persistent byte store
+
+    MAX_SIZE = 1000
+    TTL_SECONDS = 24 * 60 * 60
+
+    def __init__(
+        self,
+        namespace: str = "",
+        store: Optional[ByteStore] = None,
+        max_size: int = MAX_SIZE,
+        ttl_seconds: float = TTL_SECONDS,
+    ):
+        self.namespace = namespace
+        self.store = store
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[str, tuple[float, List[float]]] = OrderedDict()
+        self._pending: dict[str, bytes] = {}  # not yet written to the store
+        self._lock = threading.Lock()  # searches run in executor threads too
+
+    def get_key(self, text: str) -> str:
+        # same query with different whitespace or unicode form hits the same entry
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return f"{self.namespace}query-{hashlib.sha1(normalized.encode('utf-8')).hexdigest()}"
+
+    def get(self, text: str, load: bool = True) -> Optional[List[float]]:
+        # without load only the in-process entries are checked and a miss is not counted
+        key = self.get_key(text)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and now - entry[0] < self.ttl_seconds:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        if not load:
+            return None
+
+        entry = self._load(key)
+        with self._lock:
+            if entry and now - entry[0] < self.ttl_seconds:
+                self._put(key, entry)
+                self.hits += 1
+                return entry[1]
+            self._cache.pop(key, None)
+            self.misses += 1
+        return None
+
+    def set(self, text: str, embedding: List[float], flush: bool = True):
+        # without flush the entry is written to the store by the next flush call
+        key = self.get_key(text)
+        entry = (time.time(), embedding)
+        with self._lock:
+            self._put(key, entry)
+            if self.store:
+                self._pending[key] = struct.pack("d", entry[0]) + np.array(embedding, dtype=np.float32).tobytes()
+        if flush:
+            self.flush()
+
+    def flush(self):
+        # all pending entries in one write
+        with self._lock:
+            pending, self._pending = list(self._pending.items()), {}
+        if pending:
+            self.store.mset(pending)  # type: ignore
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
+
+    def _put(self, key: str, entry: tuple[float, List[float]]):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[tuple[float, List[float]]]:
+        if not self.store:
+            return None
+        with self._lock:
+            data = self._pending.get(key)
+        data = data or self.store.mget([key])[0]
+        if not data:
+            return None
+        timestamp = struct.unpack("d", data[:8])[0]
+        return timestamp, np.frombuffer(data[8:], dtype=np.float32).tolist()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    # documents go to the wrapped embeddings (with their own cache), queries through QueryEmbeddingCache
+
+    def __init__(self, embeddings: Embeddings, cache: QueryEmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        embedding = self.cache.get(text)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(text)
+            self.cache.set(text, embedding)
+        return embedding
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # the store is read and written in a thread, concurrent queries are written in one batch
+        embedding = self.cache.get(text, load=False)
+        if embedding is None:
+            embedding = await asyncio.to_thread(self.cache.get, text)
+        if embedding is None:
+            embedding = await self.embeddings.aembed_query(text)
+            self.cache.set(text, embedding, flush=False)
+            await asyncio.to_thread(self.cache.flush)
+        return embedding
@@ -8,7 +8,8 @@ def handle_error(e: Exception):
         raise e
     
 def format_error(e: Exception, max_entries=2):
-    traceback_text = traceback.format_exc()
+    # from the exception itself, also works outside of the except block (e.g. task callbacks)
+    traceback_text = "".join(traceback.format_exception(type(e), e, e.__traceback__))
     # Split the traceback into lines
     lines = traceback_text.split('\n')
     
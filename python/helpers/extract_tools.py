@@ -1,7 +1,8 @@
-import re, os, importlib, inspect
+import re, os, sys, importlib, inspect
 from typing import Any, Type, TypeVar
 from .dirty_json import DirtyJson
 from .files import get_abs_path
+from .print_style import PrintStyle
 import regex
 from fnmatch import fnmatch
 
@@ -70,13 +71,107 @@ def load_classes_from_folder(folder: str, name_pattern: str, base_class: Type[T]
         module_name = file_name[:-3]  # remove .py extension
         module_path = folder.replace("/", ".") + "." + module_name
         module = importlib.import_module(module_path)
+        classes += _get_module_classes(module, base_class)
 
-        # Get all classes in the module
-        class_list = inspect.getmembers(module, inspect.isclass)
+    return classes
 
-        # Filter for classes that are subclasses of the given base_class
-        for cls in class_list:
-            if cls[1] is not base_class and issubclass(cls[1], base_class):
-                classes.append(cls[1])
 
-    return classes
+def _get_module_classes(module, base_class: Type[T]) -> list[Type[T]]:
+    # Get all classes in the module
+    class_list = inspect.getmembers(module, inspect.isclass)
+
+    # Filter for classes that are subclasses of the given base_class
+    return [cls[1] for cls in class_list if cls[1] is not base_class and issubclass(cls[1], base_class)]
+
+
+class _FolderEntry:
+    def __init__(self):
+        self.folder_mtime: int = 0
+        self.file_mtimes: dict[str, int] = {}  # file name -> mtime_ns of the imported version
+        self.file_classes: dict[str, list[type]] = {}  # file name -> classes found in it
+        self.failed: dict[str, int] = {}  # file name -> mtime_ns of the version that failed to import
+        self.matches: dict[str, list[type]] = {}  # name pattern -> resolved classes
+
+
+_class_registry: dict[tuple[str, type], _FolderEntry] = {}
+
+
+def get_classes_from_folder(folder: str, name_pattern: str, base_class: Type[T], hot_reload: bool = False) -> list[Type[T]]:
+    """Cached version of load_classes_from_folder.
+    The folder is scanned and imported only once, subsequent calls are a dictionary lookup.
+    With hot_reload enabled, file modification times are checked on each call and changed modules are reloaded.
+    Modules that fail to import are skipped, reported once and tried again when their file changes."""
+    key = (folder, base_class)
+    entry = _class_registry.get(key)
+    if entry is None:
+        entry = _class_registry[key] = _FolderEntry()
+        _refresh_folder(folder, base_class, entry)
+    elif hot_reload:
+        _refresh_folder(folder, base_class, entry)
+    elif entry.failed:
+        _refresh_folder(folder, base_class, entry, list(entry.failed))  # only the broken files are checked
+
+    classes = entry.matches.get(name_pattern)
+    if classes is None:
+        classes = []
+        for file_name in sorted(entry.file_classes):
+            if fnmatch(file_name, name_pattern):
+                classes += entry.file_classes[file_name]
+        entry.matches[name_pattern] = classes
+    return classes  # type: ignore
+
+
+def clear_class_registry():
+    _class_registry.clear()
+
+
+def _refresh_folder(folder: str, base_class: type, entry: _FolderEntry, py_files: list[str] | None = None):
+    # py_files limits the check to these files, otherwise the whole folder is checked
+    abs_folder = get_abs_path(folder)
+    changed = False
+
+    if py_files is None:
+        # new or removed files change the folder mtime, only list the folder then
+        folder_mtime = os.stat(abs_folder).st_mtime_ns
+        if folder_mtime != entry.folder_mtime:
+            entry.folder_mtime = folder_mtime
+            importlib.invalidate_caches()  # the import system caches folder listings too
+            py_files = [file_name for file_name in os.listdir(abs_folder) if file_name.endswith(".py")]
+            for file_name in list(entry.file_classes):
+                if file_name not in py_files:
+                    del entry.file_classes[file_name]
+                    del entry.file_mtimes[file_name]
+                    changed = True
+            for file_name in list(entry.failed):
+                if file_name not in py_files:
+                    del entry.failed[file_name]
+        else:
+            py_files = list(entry.file_classes) + list(entry.failed)
+
+    for file_name in py_files:
+        try:
+            mtime = os.stat(os.path.join(abs_folder, file_name)).st_mtime_ns
+        except FileNotFoundError:
+            entry.failed.pop(file_name, None)
+            continue
+        if mtime in (entry.file_mtimes.get(file_name), entry.failed.get(file_name)):
+            continue
+
+        module_path = folder.replace("/", ".") + "." + file_name[:-3]
+        if file_name in entry.file_mtimes:
+            sys.modules.pop(module_path, None)  # file has changed since the last import, import a fresh module
+        try:
+            module = importlib.import_module(module_path)
+        except Exception as e:
+            # a broken module must not hide the classes of the others, previous version is kept
+            PrintStyle.error(f"Failed to import {module_path}: {e}")
+            entry.failed[file_name] = mtime
+            continue
+
+        entry.failed.pop(file_name, None)
+        entry.file_mtimes[file_name] = mtime
+        entry.file_classes[file_name] = _get_module_classes(module, base_class)
+        changed = True
+
+    if changed:
+        entry.matches = {}
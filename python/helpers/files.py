@@ -1,5 +1,5 @@
 from fnmatch import fnmatch
-import os, re
+import os, re, time
 
 import re
 
@@ -41,6 +41,95 @@ def process_includes(content, base_path, backup_dirs, **kwargs):
     # Replace all includes with the file content
     return re.sub(include_pattern, replace_include, content)
 
+class _Template:
+    def __init__(self, segments: list[str], placeholders: dict[int, str], dependencies: dict[str, int]):
+        self.segments = segments  # literal text and placeholders, includes already inlined
+        self.placeholders = placeholders  # segment index -> placeholder name
+        self.dependencies = dependencies  # files and folders used -> mtime_ns
+
+    def is_outdated(self) -> bool:
+        return any(_get_mtime(path) != mtime for path, mtime in self.dependencies.items())
+
+    def render(self, **kwargs) -> str:
+        parts = self.segments.copy()
+        for index, name in self.placeholders.items():
+            if name in kwargs:
+                parts[index] = str(kwargs[name])
+        return "".join(parts)
+
+
+_templates: dict[tuple[str, tuple[str, ...]], _Template] = {}
+_mtimes: dict[str, tuple[float, int | None]] = {}  # path -> time checked, mtime_ns or None if missing
+TEMPLATE_CHECK_SECONDS = 1.0  # files of compiled templates are checked for changes at most this often
+_template_pattern = re.compile(r"{{\s*include\s*['\"](.*?)['\"]\s*}}|{{(\w+)}}")
+
+
+def read_template(relative_path, backup_dirs=None, **kwargs):
+    """
+    Same result as read_file, but the file is parsed only once into a compiled template
+    with includes inlined. The template is recompiled when any of the files it was built from,
+    or the folders they were looked up in, are modified. Changes are noticed within TEMPLATE_CHECK_SECONDS.
+    """
+    key = (relative_path, tuple(backup_dirs or []))
+    template = _templates.get(key)
+    if template is None or template.is_outdated():
+        template = _compile_template(relative_path, list(backup_dirs or []), {})
+        _templates[key] = template
+    return template.render(**kwargs)
+
+
+def _compile_template(relative_path, backup_dirs, dependencies: dict[str, int]) -> _Template:
+    absolute_path = _find_file_tracked(relative_path, backup_dirs, dependencies)
+    with open(absolute_path, 'r', encoding="utf-8") as f:
+        content = remove_code_fences(f.read())
+    base_path = os.path.dirname(relative_path)
+
+    segments: list[str] = []
+    placeholders: dict[int, str] = {}
+    pos = 0
+    for match in _template_pattern.finditer(content):
+        segments.append(content[pos:match.start()])
+        pos = match.end()
+        include_path, placeholder = match.group(1), match.group(2)
+        if placeholder is not None:
+            placeholders[len(segments)] = placeholder
+            segments.append(match.group(0))
+        else:
+            # inline the compiled include, shifting its placeholder indexes
+            full_include_path = _find_file_tracked(os.path.join(base_path, include_path), backup_dirs, dependencies)
+            included = _compile_template(full_include_path, backup_dirs, dependencies)
+            for index, name in included.placeholders.items():
+                placeholders[len(segments) + index] = name
+            segments += included.segments
+    segments.append(content[pos:])
+
+    return _Template(segments, placeholders, dependencies)
+
+
+def _find_file_tracked(file_path, backup_dirs, dependencies: dict[str, int]):
+    # folders are tracked too so that a newly added override file is noticed
+    for dir in [os.path.dirname(get_abs_path(file_path))] + [get_abs_path(dir) for dir in backup_dirs]:
+        if dir not in dependencies and os.path.isdir(dir):
+            dependencies[dir] = _get_mtime(dir, fresh=True)  # type: ignore
+    absolute_path = find_file_in_dirs(file_path, backup_dirs)
+    dependencies[absolute_path] = _get_mtime(absolute_path, fresh=True)  # type: ignore
+    return absolute_path
+
+
+def _get_mtime(path: str, fresh: bool = False) -> int | None:
+    # a prompt renders many templates from the same folders, their stats are shared for TEMPLATE_CHECK_SECONDS
+    now = time.monotonic()
+    checked = _mtimes.get(path)
+    if checked and not fresh and now - checked[0] < TEMPLATE_CHECK_SECONDS:
+        return checked[1]
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    _mtimes[path] = (now, mtime)
+    return mtime
+
+
 def find_file_in_dirs(file_path, backup_dirs):
     """
     This function tries to find the file first in the given file_path,
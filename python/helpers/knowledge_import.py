@@ -2,7 +2,11 @@ import glob
 import os
 import hashlib
 import json
-from typing import Any, Dict, Literal, TypedDict
+import multiprocessing
+import pickle
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, Literal, TypedDict
 from langchain_community.document_loaders import (
     CSVLoader,
     JSONLoader,
@@ -11,115 +15,204 @@ from langchain_community.document_loaders import (
     UnstructuredHTMLLoader,
     UnstructuredMarkdownLoader,
 )
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 from python.helpers import files
 from python.helpers.log import LogItem
 
 text_loader_kwargs = {"autodetect_encoding": True}
 
+# Mapping file extensions to corresponding loader classes
+file_types_loaders = {
+    "txt": TextLoader,
+    "pdf": PyPDFLoader,
+    "csv": CSVLoader,
+    "html": UnstructuredHTMLLoader,
+    "json": JSONLoader,
+    # "md": UnstructuredMarkdownLoader,
+    "md": TextLoader,
+}
+
+DEFAULT_WORKERS = 4  # parsing is mostly i/o and library bound, more processes rarely help
+QUEUE_PER_WORKER = 2  # files parsed ahead of the consumer, bounds memory of finished documents
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
 
 class KnowledgeImport(TypedDict):
     file: str
     checksum: str
+    mtime_ns: int
+    size: int
     ids: list[str]
+    chunks: list[str]  # content hash of each chunk, same order as ids
     state: Literal["changed", "original", "removed"]
-    documents: list[Any]
+    documents: Iterator[Document]  # chunks of a changed file, streamed from disk
 
 
-def calculate_checksum(file_path: str) -> str:
-    hasher = hashlib.md5()
+def calculate_checksum(file_path: str, algorithm: str = "blake2b") -> str:
+    # streamed in chunks, blake2b is faster than md5 on 64 bit cpus
+    hasher = hashlib.new(algorithm)
     with open(file_path, "rb") as f:
-        buf = f.read()
-        hasher.update(buf)
+        while chunk := f.read(CHECKSUM_CHUNK_SIZE):
+            hasher.update(chunk)
     return hasher.hexdigest()
 
 
+def calculate_chunk_hash(doc: Document) -> str:
+    data = json.dumps([doc.page_content, doc.metadata], sort_keys=True, default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
 def load_knowledge(
     log_item: LogItem | None,
-    knowledge_dir: str,
+    sources: list[tuple[str, dict[str, Any], str]],
     index: Dict[str, KnowledgeImport],
-    metadata: dict[str, Any] = {},
-    filename_pattern: str = "**/*",
-) -> Dict[str, KnowledgeImport]:
-
-    # from python.helpers.memory import Memory
-
-    # Mapping file extensions to corresponding loader classes
-    file_types_loaders = {
-        "txt": TextLoader,
-        "pdf": PyPDFLoader,
-        "csv": CSVLoader,
-        "html": UnstructuredHTMLLoader,
-        "json": JSONLoader,
-        # "md": UnstructuredMarkdownLoader,
-        "md": TextLoader,
-    }
+    workers: int = DEFAULT_WORKERS,
+) -> Iterator[tuple[str, KnowledgeImport]]:
+    # sources are (knowledge dir, metadata, filename pattern)
+    # files are checksummed, loaded and split in worker processes,
+    # entries are yielded as they finish, so documents can be embedded while other files are parsed
+
+    tasks: list[tuple[str, str, str, bool, dict[str, Any]]] = []
+    seen = set()
+    for knowledge_dir, metadata, filename_pattern in sources:
+        # Fetch all files in the directory with specified extensions
+        kn_files = glob.glob(knowledge_dir + "/" + filename_pattern, recursive=True)
+        kn_files = [f for f in kn_files if os.path.isfile(f)]
+
+        if kn_files:
+            print(
+                f"Found {len(kn_files)} knowledge files in {knowledge_dir}, processing..."
+            )
+            if log_item:
+                log_item.stream(
+                    progress=f"\nFound {len(kn_files)} knowledge files in {knowledge_dir}, processing...",
+                )
+
+        for file_path in kn_files:
+            ext = file_path.split(".")[-1].lower()
+            if ext in file_types_loaders:
+                file_key = file_path  # os.path.relpath(file_path, knowledge_dir)
+                seen.add(file_key)
+                file_data = index.get(file_key, {})
+
+                # same modification time and size, the file is not even read
+                stat = os.stat(file_path)
+                if (
+                    file_data.get("mtime_ns") == stat.st_mtime_ns
+                    and file_data.get("size") == stat.st_size
+                ):
+                    file_data["state"] = "original"
+                    yield file_key, file_data  # type: ignore
+                    continue
+
+                # entries without mtime have md5 checksums from older versions
+                legacy = "mtime_ns" not in file_data
+                tasks.append((file_path, ext, file_data.get("checksum", ""), legacy, metadata))
 
     cnt_files = 0
     cnt_docs = 0
 
-    # for area in Memory.Area:
-    #     subdir = files.get_abs_path(knowledge_dir, area.value)
-
-    # if not os.path.exists(knowledge_dir):
-    #     os.makedirs(knowledge_dir)
-    #     continue
+    for file_path, checksum, mtime_ns, size, spool in _process_files(tasks, workers):
+        file_key = file_path
 
-    # Fetch all files in the directory with specified extensions
-    kn_files = glob.glob(knowledge_dir + "/" + filename_pattern, recursive=True)
-    kn_files = [f for f in kn_files if os.path.isfile(f)]
+        # Load existing data from the index or create a new entry
+        file_data = index.get(file_key, {})
+        file_data["checksum"] = checksum
+        file_data["mtime_ns"] = mtime_ns
+        file_data["size"] = size
 
-    if kn_files:
-        print(
-            f"Found {len(kn_files)} knowledge files in {knowledge_dir}, processing..."
-        )
-        if log_item:
-            log_item.stream(
-                progress=f"\nFound {len(kn_files)} knowledge files in {knowledge_dir}, processing...",
-            )
-
-    for file_path in kn_files:
-        ext = file_path.split(".")[-1].lower()
-        if ext in file_types_loaders:
-            checksum = calculate_checksum(file_path)
-            file_key = file_path  # os.path.relpath(file_path, knowledge_dir)
-
-            # Load existing data from the index or create a new entry
-            file_data = index.get(file_key, {})
-
-            if file_data.get("checksum") == checksum:
-                file_data["state"] = "original"
-            else:
-                file_data["state"] = "changed"
-
-            if file_data["state"] == "changed":
-                file_data["checksum"] = checksum
-                loader_cls = file_types_loaders[ext]
-                loader = loader_cls(
-                    file_path,
-                    **(
-                        text_loader_kwargs
-                        if ext in ["txt", "csv", "html", "md"]
-                        else {}
-                    ),
-                )
-                file_data["documents"] = loader.load_and_split()
-                for doc in file_data["documents"]:
-                    doc.metadata = {**doc.metadata, **metadata}
-                cnt_files += 1
-                cnt_docs += len(file_data["documents"])
-                # print(f"Imported {len(file_data['documents'])} documents from {file_path}")
+        if spool is None:
+            file_data["state"] = "original"
+        else:
+            file_data["state"] = "changed"
+            file_data["documents"] = _read_spool(*spool)
+            cnt_files += 1
+            cnt_docs += spool[1]
 
-            # Update the index
-            index[file_key] = file_data  # type: ignore
+        yield file_key, file_data  # type: ignore
 
-    # loop index where state is not set and mark it as removed
-    for file_key, file_data in index.items():
-        if not file_data.get("state", ""):
-            index[file_key]["state"] = "removed"
+    # files in the index that were not found anymore
+    for file_key, file_data in list(index.items()):
+        if file_key not in seen:
+            file_data["state"] = "removed"
+            yield file_key, file_data
 
     print(f"Processed {cnt_docs} documents from {cnt_files} files.")
     if log_item:
         log_item.stream(
             progress=f"\nProcessed {cnt_docs} documents from {cnt_files} files."
         )
-    return index
+
+
+def _process_files(
+    tasks: list[tuple[str, str, str, bool, dict[str, Any]]], workers: int
+) -> Iterator[tuple[str, str, int, int, tuple[str, int] | None]]:
+    workers = min(workers, os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        for task in tasks:
+            yield _process_file(*task)
+        return
+
+    # at most QUEUE_PER_WORKER files per worker are done ahead of the consumer, the rest waits
+    # spawned, forking copies the locks and threads of the running agent into the workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = set()
+        for task in tasks:
+            if len(pending) >= workers * QUEUE_PER_WORKER:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(pool.submit(_process_file, *task))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def _process_file(
+    file_path: str,
+    ext: str,
+    previous_checksum: str,
+    legacy: bool,
+    metadata: dict[str, Any],
+) -> tuple[str, str, int, int, tuple[str, int] | None]:
+    # runs in a worker process, returns spool file and number of chunks, None when the file did not change
+    stat = os.stat(file_path)  # before reading, a change while hashing is caught next time
+    checksum = calculate_checksum(file_path)
+    if previous_checksum and previous_checksum == (
+        calculate_checksum(file_path, "md5") if legacy else checksum
+    ):
+        return file_path, checksum, stat.st_mtime_ns, stat.st_size, None
+
+    loader_cls = file_types_loaders[ext]
+    loader = loader_cls(
+        file_path,
+        **(text_loader_kwargs if ext in ["txt", "csv", "html", "md"] else {}),
+    )
+
+    # pages or rows are loaded and split one by one and written to a spool file,
+    # neither the worker nor the consumer holds the whole file in memory
+    splitter = RecursiveCharacterTextSplitter()  # same as load_and_split
+    count = 0
+    with tempfile.NamedTemporaryFile("wb", suffix=".chunks", delete=False) as spool:
+        try:
+            for page in loader.lazy_load():
+                for doc in splitter.split_documents([page]):
+                    doc.metadata = {**doc.metadata, **metadata}
+                    pickle.dump(doc, spool)
+                    count += 1
+        except BaseException:
+            spool.close()
+            os.unlink(spool.name)
+            raise
+    return file_path, checksum, stat.st_mtime_ns, stat.st_size, (spool.name, count)
+
+
+def _read_spool(path: str, count: int) -> Iterator[Document]:
+    try:
+        with open(path, "rb") as f:
+            for _ in range(count):
+                yield pickle.load(f)
+    finally:
+        os.unlink(path)
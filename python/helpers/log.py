@@ -1,8 +1,8 @@
-from dataclasses import dataclass, field
 import json
-from typing import Any, Literal, Optional, Dict
+import threading
+from typing import Any, Iterable, Iterator, Literal, Optional, Dict
 import uuid
-from collections import OrderedDict  # Import OrderedDict
+from collections import OrderedDict, deque  # Import OrderedDict
 
 
 Type = Literal[
@@ -19,20 +19,117 @@ Type = Literal[
     "warning",
 ]
 
+STREAM_MARKS = 64  # lengths kept per streamed text, clients further behind get the whole text
+
+
+class _Text:
+    # one text of a log item, fragments appended by streaming are joined only when the whole text is read
+    def __init__(self, version: int, text: str):
+        self.replaced = version  # log version the text was last replaced
+        self.text = text
+        self.parts: list[str] = []  # appended after text
+        self.length = len(text)
+        self.marks: deque[tuple[int, int]] = deque([(version, self.length)], maxlen=STREAM_MARKS)
+
+    def append(self, version: int, fragment: str):
+        self.parts.append(fragment)
+        self.length += len(fragment)
+        self.marks.append((version, self.length))
+
+    def extend(self, version: int, text: str):
+        # replaced by a longer text starting with this one, clients still get only the new part
+        self.text = text
+        self.parts = []
+        self.length = len(text)
+        self.marks.append((version, self.length))
+
+    def value(self) -> str:
+        if self.parts:
+            self.text += "".join(self.parts)
+            self.parts = []
+        return self.text
+
+    def offset(self, since: int) -> int:
+        # length at version since, 0 if it was replaced afterwards or is too old
+        if self.replaced > since:
+            return 0
+        for version, length in reversed(self.marks):
+            if version <= since:
+                return length
+        return 0
+
+    def tail(self, offset: int) -> str:
+        # text after offset, only the fragments after it are joined
+        if offset < len(self.text):
+            return self.value()[offset:]
+        parts = []
+        length = self.length
+        for part in reversed(self.parts):
+            if length <= offset:
+                break
+            parts.append(part)
+            length -= len(part)
+        return "".join(reversed(parts))[offset - length :]
+
+
+def _leaves(value: Any, path: tuple) -> Iterator[tuple[tuple, Any]]:
+    # values in nested dicts and lists with their paths
+    if isinstance(value, dict):
+        for k, v in value.items():
+            yield from _leaves(v, path + (k,))
+    elif isinstance(value, list):
+        for i, v in enumerate(value):
+            yield from _leaves(v, path + (i,))
+    else:
+        yield path, value
+
 
-@dataclass
 class LogItem:
-    log: "Log"
-    no: int
-    type: str
-    heading: str
-    content: str
-    temp: bool
-    kvps: Optional[OrderedDict] = None  # Use OrderedDict for kvps
-    guid: str = ""
-
-    def __post_init__(self):
-        self.guid = self.log.guid
+    def __init__(
+        self,
+        log: "Log",
+        no: int,
+        type: str,
+        heading: str,
+        content: str,
+        temp: bool,
+        kvps: Optional[OrderedDict] = None,
+    ):
+        self.log = log
+        self.no = no
+        self.type = type
+        self.temp = temp
+        self.guid = log.guid
+        self.version = 0  # log version of the last change of this item
+        self._heading = heading
+        self._content = content
+        self._kvps = kvps  # Use OrderedDict for kvps, nested values are shared with their producer
+        # path of each text -> its streaming state, ("heading",), ("content",) and ("kvps", key, ...)
+        self.texts: dict[tuple, _Text] = {}
+
+    # texts are kept by their streaming state, streamed fragments are joined when the value is read
+    @property
+    def heading(self) -> str:
+        text = self.texts.get(("heading",))
+        if text:
+            self._heading = text.value()
+        return self._heading
+
+    @property
+    def content(self) -> str:
+        text = self.texts.get(("content",))
+        if text:
+            self._content = text.value()
+        return self._content
+
+    @property
+    def kvps(self) -> Optional[OrderedDict]:
+        if self._kvps:
+            for k in self._kvps:
+                text = self.texts.get(("kvps", k))
+                if text:
+                    self._kvps[k] = text.value()
+        return self._kvps
 
     def update(
         self,
@@ -54,35 +151,90 @@ class LogItem:
                 **kwargs,
             )
 
-    def stream(self, heading: str | None = None, content: str | None = None, **kwargs):
-        if heading is not None:
-            self.update(heading=self.heading + heading)
-        if content is not None:
-            self.update(content=self.content + content)
+    def stream(self, heading: str | None = None, content: str | None = None, kvps: dict | None = None, **kwargs):
+        # heading, content and kwargs are fragments appended to the texts, sent to the web ui as they are,
+        # kvps replaces the key-value pairs, their nested texts that grew are sent as fragments too
+        if self.guid == self.log.guid:
+            fragments = {("kvps", k): v for k, v in kwargs.items()}
+            if heading is not None:
+                fragments[("heading",)] = heading
+            if content is not None:
+                fragments[("content",)] = content
+            self.log.stream_item(self.no, fragments, kvps)
 
-        for k, v in kwargs.items():
-            prev = self.kvps.get(k, "") if self.kvps else ""
-            self.update(**{k: prev + v})
+    def output(self, since: int = 0):
+        # since is the log version the client has, texts then only contain the part after
+        # the offset the client already has, offsets mirror the structure of the item
+        with self.log.changed:  # kvps may be shared with a producer that changes them under the lock
+            out: dict[str, Any] = {"no": self.no, "type": self.type, "temp": self.temp}
+            offsets: dict[str, Any] = {}
+            for name in ("heading", "content", "kvps"):
+                value = getattr(self, "_" + name)
+                out[name], offset = self._output_value(value, (name,), since)
+                if offset:
+                    offsets[name] = offset
+            if offsets:
+                out["offsets"] = offsets
+            return out
 
-    def output(self):
-        return {
-            "no": self.no,
-            "type": self.type,
-            "heading": self.heading,
-            "content": self.content,
-            "temp": self.temp,
-            "kvps": self.kvps,
-        }
+    def _output_value(self, value: Any, path: tuple, since: int) -> tuple[Any, Any]:
+        # copy of the value with texts cut at the client offsets, and the offsets
+        if isinstance(value, dict):
+            out, offsets = OrderedDict(), {}
+            for k, v in value.items():
+                out[k], offset = self._output_value(v, path + (k,), since)
+                if offset:
+                    offsets[k] = offset
+            return out, offsets
+        if isinstance(value, list):
+            out, offsets = [], {}
+            for i, v in enumerate(value):
+                v, offset = self._output_value(v, path + (i,), since)
+                out.append(v)
+                if offset:
+                    offsets[i] = offset
+            return out, offsets
+        text = self.texts.get(path) if isinstance(value, str) else None
+        if not text:
+            return value, 0
+        offset = text.offset(since) if since else 0
+        return text.tail(offset), offset
+
+    def _sync_texts(self, version: int, fields: Iterable[str]):
+        # fields were set to new values, texts that were replaced get a new state,
+        # longer ones starting with the previous text are extended,
+        # nested texts are compared by identity first, only the ones a producer replaced are compared
+        for name in fields:
+            field = getattr(self, "_" + name)
+            paths = set()
+            for path, value in _leaves(field, (name,)) if field else [((name,), field)]:
+                if not isinstance(value, str):
+                    continue
+                paths.add(path)
+                text = self.texts.get(path)
+                if text is None:
+                    pass
+                elif value is text.text and not text.parts:
+                    continue
+                elif len(value) > text.length and value.startswith(text.value()):
+                    text.extend(version, value)
+                    continue
+                self.texts[path] = _Text(version, value)
+            for path in [path for path in self.texts if path[0] == name and path not in paths]:
+                del self.texts[path]
 
 
 class Log:
 
     def __init__(self):
         self.guid: str = str(uuid.uuid4())
-        self.updates: list[int] = []
+        self.version = 0  # incremented on every change
+        # item no -> version, ordered by last change, one entry per item however often it changes
+        self.updates: OrderedDict[int, int] = OrderedDict()
         self.logs: list[LogItem] = []
         self.progress = ""
         self.progress_no = 0
+        self.changed = threading.Condition()  # notified on every change, push clients wait on it
 
     def log(
         self,
@@ -95,20 +247,21 @@ class Log:
         # Use OrderedDict if kvps is provided
         if kvps is not None:
             kvps = OrderedDict(kvps)
-        item = LogItem(
-            log=self,
-            no=len(self.logs),
-            type=type,
-            heading=heading or "",
-            content=content or "",
-            kvps=kvps,
-            temp=temp or False,
-        )
-        self.logs.append(item)
-        self.updates += [item.no]
-        if heading and item.no >= self.progress_no:
-            self.progress = heading
-            self.progress_no = item.no
+        with self.changed:
+            item = LogItem(
+                log=self,
+                no=len(self.logs),
+                type=type,
+                heading=heading or "",
+                content=content or "",
+                kvps=kvps,
+                temp=temp or False,
+            )
+            self.logs.append(item)
+            if heading and item.no >= self.progress_no:
+                self.progress = heading
+                self.progress_no = item.no
+            self.mark_updated(item)
         return item
 
     def update_item(
@@ -121,48 +274,100 @@ class Log:
         temp: bool | None = None,
         **kwargs,
     ):
-        item = self.logs[no]
-        if type is not None:
-            item.type = type
-        if heading is not None:
-            item.heading = heading
-            if no >= self.progress_no:
-                self.progress = heading
-                self.progress_no = no
-        if content is not None:
-            item.content = content
-        if kvps is not None:
-            item.kvps = OrderedDict(kvps)  # Use OrderedDict to keep the order
+        with self.changed:
+            item = self.logs[no]
+            item._heading, item._content, item._kvps = item.heading, item.content, item.kvps
+            fields = []
+            if type is not None:
+                item.type = type
+            if heading is not None:
+                item._heading = heading
+                fields.append("heading")
+                if no >= self.progress_no:
+                    self.progress = heading
+                    self.progress_no = no
+            if content is not None:
+                item._content = content
+                fields.append("content")
+            if kvps is not None:
+                item._kvps = OrderedDict(kvps)  # Use OrderedDict to keep the order
+                fields.append("kvps")
 
-        if temp is not None:
-            item.temp = temp
+            if temp is not None:
+                item.temp = temp
 
-        if kwargs:
-            if item.kvps is None:
-                item.kvps = OrderedDict()  # Ensure kvps is an OrderedDict
-            for k, v in kwargs.items():
-                item.kvps[k] = v
+            if kwargs:
+                if item._kvps is None:
+                    item._kvps = OrderedDict()  # Ensure kvps is an OrderedDict
+                for k, v in kwargs.items():
+                    item._kvps[k] = v
+                fields.append("kvps")
 
-        self.updates += [item.no]
+            self.mark_updated(item, set(fields))
 
-    def output(self, start=None, end=None):        
+    def stream_item(self, no: int, fragments: dict[tuple, str], kvps: dict | None = None):
+        # fragments are appended to the texts at their paths, no text is compared or joined
+        with self.changed:
+            item = self.logs[no]
+            if kvps is not None:
+                item._kvps = OrderedDict(kvps)
+            self.mark_updated(item, ["kvps"] if kvps is not None else [])
+            for path, fragment in fragments.items():
+                text = item.texts.get(path)
+                if text:
+                    if fragment:
+                        text.append(self.version, fragment)
+                    continue
+                # new key-value pair
+                if item._kvps is None:
+                    item._kvps = OrderedDict()
+                item._kvps[path[1]] = fragment
+                item.texts[path] = _Text(self.version, fragment)
+            if ("heading",) in fragments and no >= self.progress_no:
+                self.progress = item.heading
+                self.progress_no = no
+
+    def mark_updated(self, item: LogItem, fields: Iterable[str] = ("heading", "content", "kvps")):
+        # fields were set to new values, their texts are compared to the previous ones
+        with self.changed:
+            self.version += 1
+            item.version = self.version
+            self.updates[item.no] = self.version
+            self.updates.move_to_end(item.no)
+            item._sync_texts(self.version, fields)
+            self.changed.notify_all()
+
+    def output(self, start=None, end=None):
+        # items changed after version start up to version end, walks only the changed ones
         if start is None:
             start = 0
         if end is None:
-            end = len(self.updates)
+            end = self.version
 
         out = []
-        seen = set()
-        for update in self.updates[start:end]:
-            if update not in seen:
-                out.append(self.logs[update].output())
-                seen.add(update)
-
+        with self.changed:
+            for no in reversed(self.updates):
+                version = self.updates[no]
+                if version <= start:
+                    break
+                if version <= end:
+                    out.append(self.logs[no].output(since=start))
+        out.reverse()
         return out
 
+    def wait(self, guid: str, version: int, timeout: float) -> bool:
+        # blocks until the log is past version or was reset, False on timeout
+        with self.changed:
+            return self.changed.wait_for(
+                lambda: self.guid != guid or self.version != version, timeout
+            )
+
     def reset(self):
-        self.guid = str(uuid.uuid4())
-        self.updates = []
-        self.logs = []
-        self.progress = ""
-        self.progress_no = 0
+        with self.changed:
+            self.guid = str(uuid.uuid4())
+            self.version = 0
+            self.updates = OrderedDict()
+            self.logs = []
+            self.progress = ""
+            self.progress_no = 0
+            self.changed.notify_all()
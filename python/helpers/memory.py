@@ -1,6 +1,12 @@
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, List, Sequence
-from langchain.storage import InMemoryByteStore, LocalFileStore
+from pathlib import Path
+import pickle
+import threading
+from concurrent.futures import Future
+import time
+from typing import Any, List, NamedTuple, Optional, Sequence
+from langchain.storage import InMemoryByteStore
 from langchain.embeddings import CacheBackedEmbeddings
 
 # from langchain_chroma import Chroma
@@ -10,27 +16,776 @@ from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores.utils import (
     DistanceStrategy,
 )
-import os, json
+import asyncio, os, json, operator
 
 import numpy as np
 from . import files
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 import uuid
 from python.helpers import knowledge_import
+from python.helpers.memory_filter import MemoryFilter, compile_filter
+from python.helpers.write_ahead_log import WriteAheadLog
+from python.helpers.embedding_cache import CachedQueryEmbeddings, QueryEmbeddingCache, SQLiteByteStore
+from python.helpers.disk_docstore import DiskDocstore
 from python.helpers.log import Log, LogItem
+from python.helpers.print_style import PrintStyle
+from python.helpers import errors
 from enum import Enum
-from agent import Agent
+from agent import Agent, AgentConfig
+
+
+@dataclass
+class AreaIndex:
+    index: Any  # faiss index with vectors of one memory area
+    ids: list[str | None]  # docstore id for each position in index and delta, None for deleted
+    kind: str = "flat"  # index type the index was built as
+    built_size: int = 0  # number of vectors the approximate index was trained with
+    deleted: int = 0  # deleted vectors still in the index or delta
+    mapped: bool = False  # index is memory-mapped from the snapshot file and read only
+    file: str = ""  # name of the mapped snapshot file, kept on disk while mapped
+    # vectors added while the index is read by a background job, searched exactly and merged later
+    delta: Any = None
+    readers: int = 0  # background jobs reading the index, it is not changed in place meanwhile
+    rebuilding: bool = False
+    failed: int = 0  # live size at the last failed rebuild, retried once the area doubled
+
+    @property
+    def frozen(self) -> bool:
+        # mapped indexes are never written, faiss aborts when writing to them and a copy costs the whole area
+        return self.mapped or self.readers > 0
 
 
 class MyFaiss(FAISS):
+    # vectors are kept in a separate faiss index per memory area, area filtered searches only scan those
+    # self.index is an empty template the area indexes are cloned from
+
+    DEFAULT_AREA = "main"
+    INDEX_TYPES = ["flat", "hnsw", "hnsw_sq8", "ivf", "ivf_pq", "ivf_sq8"]
+    COMPACT_RATIO = 0.2  # approximate indexes are rebuilt when this part of vectors is deleted
+    # pq codebooks have 256 centroids, faiss wants 39 training points for each, smaller areas stay exact
+    MIN_TRAINING = {"ivf_pq": 39 * 256}
+    # snapshot of the index is written in background when the write-ahead log reaches any of these
+    CHECKPOINT_RECORDS = 1000
+    CHECKPOINT_BYTES = 64 * 1024 * 1024
+    CHECKPOINT_SECONDS = 300
+    # vectors of flat, hnsw and ivf indexes are mapped from the file instead of read, needs faiss 1.11+
+    MMAP_SUPPORTED = hasattr(faiss, "IO_FLAG_MMAP_IFC")
+    MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index_type = "flat"
+        self.index_threshold = 10000  # areas smaller than this use exact search
+        self.mmap = False  # areas are mapped from the snapshot files again after each checkpoint
+        self.areas: dict[str, AreaIndex] = {}
+        self._positions: dict[str, tuple[str, int]] = {}  # docstore id -> area, position
+        self._lock = threading.RLock()  # searches and deletes also run in executor threads
+        self.wal: WriteAheadLog | None = None
+        self.folder_path = ""
+        self.index_name = "index"
+        self.checkpoint_seq = 0  # last log record contained in the snapshot on disk
+        self._checkpoint_time = time.time()
+        self._checkpoint_thread: threading.Thread | None = None
+        self._rebuild_threads: dict[str, threading.Thread] = {}
+        if self.index.ntotal:
+            self._split_areas()  # single index from older versions
+
+    def _split_areas(self):
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        groups: dict[str, list[int]] = {}
+        for pos in range(self.index.ntotal):
+            doc = self.docstore.search(self.index_to_docstore_id[pos])
+            groups.setdefault(self._get_area(doc), []).append(pos)  # type: ignore
+        self.index.reset()
+        for area, positions in groups.items():
+            self._add_vectors(
+                area, vectors[positions], [self.index_to_docstore_id[p] for p in positions]
+            )
+        self.index_to_docstore_id = {}
+
+    @staticmethod
+    def _get_area(doc: Document) -> str:
+        area = doc.metadata.get("area", "") if isinstance(doc, Document) else ""
+        return area or MyFaiss.DEFAULT_AREA
+
+    def _add_vectors(self, area: str, vectors: np.ndarray, ids: list[str]):
+        area_index = self.areas.get(area)
+        if not area_index:
+            area_index = self.areas[area] = AreaIndex(faiss.clone_index(self.index), [])
+        start = len(area_index.ids)
+        if area_index.frozen or area_index.delta is not None:
+            if area_index.delta is None:
+                area_index.delta = faiss.clone_index(self.index)
+            area_index.delta.add(vectors)
+        else:
+            area_index.index.add(vectors)
+        area_index.ids += ids
+        for i, id in enumerate(ids):
+            self._positions[id] = (area, start + i)
+        self._update_area_index(area)
+
+    def configure(self, index_type: str, index_threshold: int, mmap: bool = False):
+        if index_type not in MyFaiss.INDEX_TYPES:
+            raise ValueError(
+                f"Unknown memory index type '{index_type}', use one of: {', '.join(MyFaiss.INDEX_TYPES)}"
+            )
+        if mmap and not MyFaiss.MMAP_SUPPORTED:
+            PrintStyle.hint(
+                f"faiss {faiss.__version__} cannot map indexes from disk, memory vectors are loaded into RAM. "
+                "Upgrade faiss-cpu to 1.11 or newer to map them."
+            )
+        self.index_type = index_type
+        self.index_threshold = index_threshold
+        self.mmap = mmap and MyFaiss.MMAP_SUPPORTED
+        with self._lock:
+            for area_index in self.areas.values():
+                if area_index.mapped and not self.mmap:  # read into memory once, changes are merged again
+                    area_index.index = faiss.deserialize_index(faiss.serialize_index(area_index.index))
+                    area_index.mapped, area_index.file = False, ""
+            for area in self.areas:
+                self._update_area_index(area)
+            if mmap != isinstance(self.docstore, DiskDocstore):
+                self._move_docstore(mmap)
+
+    def _move_docstore(self, to_disk: bool):
+        # documents are moved between memory and disk, the snapshot is rewritten to point to the new docstore
+        if to_disk:
+            docstore = DiskDocstore(Path(self.folder_path) / f"{self.index_name}.docstore.db")
+            docstore.add(self.docstore._dict)  # type: ignore
+            self.docstore = docstore
+            self.checkpoint(background=False)
+        else:
+            disk: DiskDocstore = self.docstore  # type: ignore
+            self.docstore = InMemoryDocstore(disk.all())
+            self.checkpoint(background=False)
+            disk.close()
+            for file in disk.path.parent.glob(f"{disk.path.name}*"):  # with sqlite -wal and -shm files
+                file.unlink()
+
+    def _update_area_index(self, area: str):
+        # exact search for small areas, approximate index once the area is over the threshold
+        # retrained when the area doubles in size, rebuilt without deleted vectors when there are too many
+        # rebuilds run in background, the area is searched and changed meanwhile
+        area_index = self.areas[area]
+        if area_index.rebuilding:
+            return
+        if area_index.delta is not None and not area_index.frozen:
+            area_index.index.add(area_index.delta.reconstruct_n(0, area_index.delta.ntotal))
+            area_index.delta = None
+
+        size = len(area_index.ids) - area_index.deleted
+        if area_index.failed and size < 2 * area_index.failed:
+            return
+        min_size = max(self.index_threshold, MyFaiss.MIN_TRAINING.get(self.index_type, 1))
+        approximate = self.index_type != "flat" and size >= min_size
+        if approximate and (
+            area_index.kind != self.index_type or size >= 2 * area_index.built_size
+        ):
+            kind = self.index_type
+        elif (
+            not approximate
+            and area_index.kind != "flat"
+            and (self.index_type == "flat" or size < min_size // 2)
+        ):
+            kind = "flat"
+        elif area_index.deleted > MyFaiss.COMPACT_RATIO * len(area_index.ids):
+            kind = None  # same index without deleted vectors, keeps the training
+        else:
+            return
+
+        # the index is only read while rebuilding, changes meanwhile go to the delta and are replayed
+        area_index.rebuilding = True
+        area_index.readers += 1
+        live = [pos for pos, id in enumerate(area_index.ids) if id is not None]
+        delta = (
+            area_index.delta.reconstruct_n(0, area_index.delta.ntotal)
+            if area_index.delta is not None
+            else None
+        )
+        thread = threading.Thread(
+            target=self._rebuild_area,
+            args=(area, area_index, kind, live, delta, len(area_index.ids)),
+            daemon=True,
+        )
+        self._rebuild_threads[area] = thread
+        thread.start()
+
+    def _rebuild_area(
+        self,
+        area: str,
+        area_index: AreaIndex,
+        kind: str | None,
+        live: list[int],
+        delta: np.ndarray | None,
+        count: int,
+    ):
+        # live are positions of vectors to keep, count is the number of positions when it started
+        try:
+            vectors = self._get_vectors(area_index.index)
+            if delta is not None:
+                vectors = np.concatenate([vectors, delta])
+            vectors = vectors[live]
+            if kind is None:
+                index = faiss.deserialize_index(faiss.serialize_index(area_index.index))  # private copy
+                index.reset()
+                index.add(vectors)
+                kind, built_size = area_index.kind, area_index.built_size
+            elif kind == "flat":
+                index = faiss.clone_index(self.index)
+                index.add(vectors)
+                built_size = 0
+            else:
+                index = self._build_index(vectors, kind)
+                built_size = len(live)
+        except Exception as e:
+            PrintStyle.error(f"Rebuilding memory area '{area}' failed: {errors.format_error(e)}")
+            with self._lock:
+                area_index.failed = len(live)
+                area_index.rebuilding = False
+                area_index.readers -= 1
+            return
+
+        with self._lock:
+            area_index.readers -= 1
+            if self.areas.get(area) is not area_index:
+                return  # replaced meanwhile
+            # deletes made while building are marks in ids, additions went to the delta
+            ids = [area_index.ids[pos] for pos in live]
+            added = len(area_index.ids) - count
+            if added:
+                delta_index = area_index.delta
+                index.add(delta_index.reconstruct_n(delta_index.ntotal - added, added))
+                ids += area_index.ids[count:]
+            new = AreaIndex(index, ids, kind, built_size, ids.count(None))
+            self.areas[area] = new
+            for pos, id in enumerate(ids):
+                if id is not None:
+                    self._positions[id] = (area, pos)
+            self._update_area_index(area)
+
+    @staticmethod
+    def _get_vectors(index) -> np.ndarray:
+        # vectors of compressed indexes (pq, sq8) are approximations of the originals
+        if faiss.try_extract_index_ivf(index):
+            index = faiss.deserialize_index(faiss.serialize_index(index))  # direct map writes to the index
+            faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_n(0, index.ntotal)
+
+    def wait_rebuilds(self):
+        # a finished rebuild may start the next one
+        while threads := [t for t in list(self._rebuild_threads.values()) if t.is_alive()]:
+            for thread in threads:
+                thread.join()
+
+    def _build_index(self, vectors: np.ndarray, kind: str):
+        size, dim = vectors.shape
+        nlist = max(1, min(int(4 * np.sqrt(size)), size // 39))  # faiss wants ~39 training points per centroid
+        pq_m = next(m for m in (64, 32, 16, 8, 4, 2, 1) if dim % m == 0 and dim // m >= 4 or m == 1)
+        description = {
+            "hnsw": "HNSW32",
+            "hnsw_sq8": "HNSW32_SQ8",
+            "ivf": f"IVF{nlist},Flat",
+            "ivf_pq": f"IVF{nlist},PQ{pq_m}",
+            "ivf_sq8": f"IVF{nlist},SQ8",
+        }[kind]
+        index = faiss.index_factory(dim, description, self.index.metric_type)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf:
+            ivf.nprobe = min(nlist, max(8, nlist // 8))
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = 64
+        return index
+
+    # replaces FAISS.__add used by all the add methods
+    def _FAISS__add(self, texts, embeddings, metadatas=None, ids=None) -> List[str]:
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        documents = [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Duplicate ids found in the ids list.")
+
+        vectors = np.array(list(embeddings), dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        with self._lock:
+            self._write_log(("add", ids, documents, vectors))
+            self._apply_add(ids, documents, vectors)
+        return ids
+
+    def _apply_add(self, ids: list[str], documents: list[Document], vectors: np.ndarray):
+        groups: dict[str, list[int]] = {}
+        for i, (id, doc) in enumerate(zip(ids, documents)):
+            if id not in self._positions:  # replayed records may be in the snapshot already
+                groups.setdefault(self._get_area(doc), []).append(i)
+        self.docstore.add({ids[i]: documents[i] for rows in groups.values() for i in rows})  # type: ignore
+        for area, rows in groups.items():
+            self._add_vectors(area, vectors[rows], [ids[i] for i in rows])
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        with self._lock:
+            missing_ids = set(ids).difference(self._positions)
+            if missing_ids:
+                raise ValueError(
+                    f"Some specified ids do not exist in the current store. Ids not found: {missing_ids}"
+                )
+            self._write_log(("delete", list(set(ids))))
+            self._apply_delete(list(set(ids)))
+        return True
+
+    def _apply_delete(self, ids: list[str]):
+        ids = [id for id in ids if id in self._positions]
+        removed: dict[str, set[int]] = {}
+        for id in ids:
+            area, pos = self._positions.pop(id)
+            removed.setdefault(area, set()).add(pos)
+        for area, positions in removed.items():
+            area_index = self.areas[area]
+            if area_index.kind != "flat" or area_index.frozen or area_index.delta is not None:
+                # approximate indexes do not support removal or renumber vectors, deleted ones are skipped,
+                # positions of an index read in background or followed by a delta must not change either
+                for pos in positions:
+                    area_index.ids[pos] = None
+                area_index.deleted += len(positions)
+            else:
+                area_index.index.remove_ids(np.fromiter(positions, dtype=np.int64))
+                area_index.ids = [id for pos, id in enumerate(area_index.ids) if pos not in positions]
+                for pos, id in enumerate(area_index.ids):
+                    if id is not None:
+                        self._positions[id] = (area, pos)
+            self._update_area_index(area)
+        if ids:
+            self.docstore.delete(ids)
+
+    def existing_ids(self, ids: Sequence[str]) -> set[str]:
+        with self._lock:
+            return {id for id in ids if id in self._positions}
+
     # override aget_by_ids
     def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
-        # return all self.docstore._dict[id] in ids
-        return [self.docstore._dict[id] for id in ids if id in self.docstore._dict]  # type: ignore
+        return [doc for doc in self._get_documents(list(ids)) if doc is not None]
 
     async def aget_by_ids(self, ids: Sequence[str], /) -> List[Document]:
         return self.get_by_ids(ids)
 
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Any = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ):
+        return self.similarity_search_with_score_by_vectors(
+            [embedding], k=k, filter=filter, fetch_k=fetch_k, **kwargs
+        )[0]
+
+    def similarity_search_with_score_by_vectors(
+        self,
+        embeddings: Sequence[List[float]],
+        k: int = 4,
+        filter: Any = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> list[list[tuple[Document, float]]]:
+        # one faiss search per area for all query vectors, results per query
+        # search only the areas the filter allows
+        areas = list(self.areas)
+        if isinstance(filter, MemoryFilter) and filter.areas is not None:
+            areas = [area for area in areas if area in filter.areas]
+        filter_func = self._create_filter_func(filter) if filter is not None else None
+        fetch = k if filter is None else max(k, fetch_k)
+
+        results = self.search_candidates(embeddings, areas, fetch, filter_func)
+
+        score_threshold = kwargs.get("score_threshold")
+        cmp = (
+            operator.ge
+            if self.distance_strategy
+            in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+            else operator.le
+        )
+        for i, docs in enumerate(results):
+            # merge results of all areas, inner product is similarity, other metrics are distance
+            docs.sort(key=lambda doc: doc[1], reverse=self.index.metric_type == faiss.METRIC_INNER_PRODUCT)
+            if score_threshold is not None:
+                docs = [(doc, score) for doc, score in docs if cmp(score, score_threshold)]
+            results[i] = docs[:k]
+        return results
+
+    def pairwise_scores(
+        self, queries: Sequence[List[float]] | np.ndarray, embeddings: Sequence[List[float]] | np.ndarray
+    ) -> np.ndarray:
+        # scores of the stored vectors for each query vector as the index would return them
+        queries = np.array(queries, dtype=np.float32)
+        vectors = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(queries)
+            faiss.normalize_L2(vectors)
+        if self.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            return queries @ vectors.T
+        return faiss.pairwise_distances(queries, vectors, self.index.metric_type)
+
+    def search_candidates(
+        self,
+        embeddings: Sequence[List[float]] | np.ndarray,
+        areas: Sequence[str] | None = None,
+        fetch: int = 20,
+        filter_func: Any = None,
+    ) -> list[list[tuple[Document, float]]]:
+        # up to fetch nearest documents from each area for each query vector, not merged or sorted
+        vectors = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        with self._lock:
+            return self._search_areas(vectors, list(self.areas) if areas is None else areas, fetch, filter_func)
+
+    def _search_areas(self, vectors: np.ndarray, areas: Sequence[str], fetch: int, filter_func):
+        hits: list[tuple[int, str, float]] = []  # query row, docstore id, score
+        for area in areas:
+            area_index = self.areas[area]
+            hits += self._search_index(area_index, area_index.index, 0, vectors, fetch)
+            if area_index.delta is not None:
+                hits += self._search_index(
+                    area_index, area_index.delta, area_index.index.ntotal, vectors, fetch
+                )
+
+        # documents of all hits are fetched at once, a docstore on disk reads them in one query
+        documents = self._get_documents([id for _, id, _ in hits])
+        results: list[list[tuple[Document, float]]] = [[] for _ in vectors]
+        for (row, id, score), doc in zip(hits, documents):
+            if doc is None:
+                raise ValueError(f"Could not find document for id {id}")
+            if filter_func is None or filter_func(doc.metadata):
+                results[row].append((doc, score))
+        return results
+
+    @staticmethod
+    def _search_index(area_index: AreaIndex, index, offset: int, vectors: np.ndarray, fetch: int):
+        # deleted vectors are still found by the index, only as many more are fetched as are expected
+        # among the results, rows that still come short are searched again with more
+        total = index.ntotal
+        if not total:
+            return []
+        live = len(area_index.ids) - area_index.deleted
+        k = min(total, int(fetch * len(area_index.ids) / max(live, 1)) + 1)
+        hits: list[tuple[int, str, float]] = []
+        rows = list(range(len(vectors)))
+        while rows:
+            scores, positions = index.search(vectors[rows], k)
+            short = []
+            for row, row_scores, row_positions in zip(rows, scores, positions):
+                found = [
+                    (row, area_index.ids[offset + pos], score)
+                    for score, pos in zip(row_scores, row_positions)
+                    if pos != -1 and area_index.ids[offset + pos] is not None
+                ]
+                # -1 means the index has no more results in reach, a larger k would not help
+                if len(found) < fetch and k < total and row_positions[-1] != -1:
+                    short.append(row)
+                else:
+                    hits += found  # type: ignore
+            if not short:
+                break
+            rows, k = short, min(total, 2 * k)
+        return hits
+
+    def _get_documents(self, ids: list[str]) -> list[Document | None]:
+        if isinstance(self.docstore, DiskDocstore):
+            return self.docstore.mget(ids)
+        docs = [self.docstore.search(id) for id in ids]
+        return [doc if isinstance(doc, Document) else None for doc in docs]
+
+    def _write_log(self, record: tuple):
+        if self.wal:
+            self.wal.append(record)
+
+    def open_log(self, folder_path: str, index_name: str = "index"):
+        # replay mutations logged after the last snapshot, then log all further ones
+        # one process writes the folder, raises LockError while another one has it open
+        self.folder_path = folder_path
+        self.index_name = index_name
+        wal = WriteAheadLog(Path(folder_path) / f"{index_name}.wal", self.checkpoint_seq)
+        wal.lock()
+        self.wal = wal
+        with self._lock:
+            for seq, record in self.wal.replay(after=self.checkpoint_seq):
+                if record[0] == "add":
+                    self._apply_add(*record[1:])
+                elif record[0] == "delete":
+                    self._apply_delete(*record[1:])
+        if not (Path(folder_path) / f"{index_name}.areas.pkl").exists():
+            self.checkpoint(background=False)  # the log needs a snapshot to start from
+
+    def maybe_checkpoint(self):
+        wal = self.wal
+        if not wal or not wal.count:
+            return
+        if (
+            wal.count >= MyFaiss.CHECKPOINT_RECORDS
+            or wal.size >= MyFaiss.CHECKPOINT_BYTES
+            or time.time() - self._checkpoint_time >= MyFaiss.CHECKPOINT_SECONDS
+        ):
+            self.checkpoint()
+
+    def checkpoint(self, background: bool = True):
+        # only references are taken under the lock, the indexes are not changed in place until written,
+        # serializing and writing the snapshot does not block mutations
+        if self._checkpoint_thread and self._checkpoint_thread.is_alive():
+            if not background:
+                self._checkpoint_thread.join()
+            else:
+                return  # previous checkpoint still writing, records stay in the log
+        with self._lock:
+            seq = self.wal.seq if self.wal else self.checkpoint_seq
+            snapshot = self._take_snapshot(seq)
+            if self.wal:
+                self.wal.rotate()
+            self._checkpoint_time = time.time()
+
+        def write():
+            files = None
+            try:
+                files = self._write_snapshot(
+                    self.folder_path,
+                    self.index_name,
+                    *self._serialize_snapshot(snapshot),
+                    keep=self._mapped_files(snapshot),
+                )
+            finally:
+                self._release_snapshot(snapshot, files if self.mmap else None)
+            self.checkpoint_seq = seq
+            if self.wal:
+                self.wal.remove_segments(upto=seq)
+
+        if background:
+            self._checkpoint_thread = threading.Thread(target=write, daemon=True)
+            self._checkpoint_thread.start()
+        else:
+            write()
+
+    def close(self):
+        # write pending mutations into the snapshot
+        self.wait_rebuilds()
+        if self.wal and self.wal.count:
+            self.checkpoint(background=False)
+        elif self._checkpoint_thread:
+            self._checkpoint_thread.join()
+        if self.wal:
+            self.wal.close()
+        if isinstance(self.docstore, DiskDocstore):
+            self.docstore.close()
+
+    def _take_snapshot(self, seq: int) -> dict[str, Any]:
+        # cheap, under the lock: area indexes are marked as read until released, changes meanwhile go to deltas,
+        # the docstore dictionary is copied, documents themselves are not changed once added
+        areas = {}
+        for area, area_index in self.areas.items():
+            area_index.readers += 1
+            delta = area_index.delta
+            areas[area] = (
+                area_index,
+                area_index.index,
+                delta.reconstruct_n(0, delta.ntotal) if delta is not None and delta.ntotal else None,
+                list(area_index.ids),
+            )
+        docstore = self.docstore
+        if isinstance(docstore, InMemoryDocstore):
+            docstore = InMemoryDocstore(dict(docstore._dict))  # type: ignore
+        return {"seq": seq, "areas": areas, "docstore": docstore, "template": faiss.serialize_index(self.index)}
+
+    @staticmethod
+    def _serialize_snapshot(snapshot: dict[str, Any]) -> tuple[dict[str, np.ndarray], tuple]:
+        areas = snapshot["areas"]
+        indexes = {
+            area: MyFaiss._serialize_area(index, delta)
+            for area, (_, index, delta, _) in areas.items()
+        }
+        meta = (
+            snapshot["docstore"],
+            {
+                area: {
+                    "ids": ids,
+                    "kind": area_index.kind,
+                    "built_size": area_index.built_size,
+                }
+                for area, (area_index, _, _, ids) in areas.items()
+            },
+            snapshot["template"],
+            snapshot["seq"],
+        )
+        return indexes, meta
+
+    def _release_snapshot(self, snapshot: dict[str, Any], remap: dict[str, str] | None = None):
+        # remap are the written files of a checkpoint, the areas are mapped from them
+        with self._lock:
+            for area, (area_index, _, _, ids) in snapshot["areas"].items():
+                area_index.readers -= 1
+                if self.areas.get(area) is not area_index:
+                    continue
+                if remap and not area_index.readers:
+                    self._remap_area(area, area_index, len(ids), remap[area])
+                self._update_area_index(area)  # merges the delta
+
+    def _remap_area(self, area: str, area_index: AreaIndex, count: int, file: str):
+        # the written file holds the first count positions, the index is mapped from it instead of kept in memory,
+        # positions do not change, deletes since the snapshot stay marked and later additions stay in the delta
+        index = faiss.read_index(str(Path(self.folder_path) / file), MyFaiss.MMAP_FLAGS)
+        delta = None
+        added = len(area_index.ids) - count
+        if added:
+            delta = faiss.clone_index(self.index)
+            delta.add(area_index.delta.reconstruct_n(area_index.delta.ntotal - added, added))
+        self.areas[area] = AreaIndex(
+            index,
+            area_index.ids,
+            area_index.kind,
+            area_index.built_size,
+            area_index.deleted,
+            True,
+            file,
+            delta,
+            failed=area_index.failed,
+        )
+
+    def _mapped_files(self, snapshot: dict[str, Any]) -> set[str]:
+        # files of current areas and of the areas in the snapshot, their indexes may still be read
+        with self._lock:
+            areas = list(self.areas.values()) + [area_index for area_index, *_ in snapshot["areas"].values()]
+        return {area_index.file for area_index in areas if area_index.mapped}
+
+    @staticmethod
+    def _serialize_area(index, delta: np.ndarray | None) -> np.ndarray:
+        # the delta is appended to a copy of the index, so positions in the file match ids
+        if delta is None:
+            return faiss.serialize_index(index)
+        index = faiss.deserialize_index(faiss.serialize_index(index))
+        index.add(delta)
+        return faiss.serialize_index(index)
+
+    @staticmethod
+    def _write_snapshot(
+        folder_path: str,
+        index_name: str,
+        indexes: dict[str, np.ndarray],
+        meta: tuple,
+        keep: set[str] = set(),
+    ) -> dict[str, str]:
+        # index files are versioned by log sequence, the metadata file is replaced last,
+        # so a crash in between leaves the previous snapshot intact
+        # files in keep are still mapped, they are never overwritten and removed by a later snapshot
+        # returns the written index file of each area
+        path = Path(folder_path)
+        path.mkdir(exist_ok=True, parents=True)
+        docstore, areas, template, seq = meta
+        files = {}
+        for area, data in indexes.items():
+            file = f"{index_name}.{area}.{seq}.faiss"
+            version = 0
+            while file in keep:  # same sequence as the mapped snapshot, nothing was logged since
+                version += 1
+                file = f"{index_name}.{area}.{seq}-{version}.faiss"
+            data.tofile(path / file)
+            files[area] = file
+            areas[area]["file"] = file
+        tmp = path / f"{index_name}.areas.pkl.tmp"
+        with open(tmp, "wb") as f:
+            f.write(pickle.dumps((docstore, areas, template, seq)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path / f"{index_name}.areas.pkl")
+        for file in path.glob(f"{index_name}.*.faiss"):  # previous snapshots
+            if file.name in files.values() or file.name in keep:
+                continue
+            try:
+                file.unlink()
+            except OSError:
+                pass  # still open elsewhere (windows does not remove mapped files), retried next time
+        return files
+
+    def save_local(self, folder_path: str, index_name: str = "index") -> None:
+        with self._lock:
+            seq = self.wal.seq if self.wal else self.checkpoint_seq
+            snapshot = self._take_snapshot(seq)
+        try:
+            self._write_snapshot(
+                folder_path, index_name, *self._serialize_snapshot(snapshot), keep=self._mapped_files(snapshot)
+            )
+        finally:
+            self._release_snapshot(snapshot)
+
+    @classmethod
+    def load_local(
+        cls,
+        folder_path: str,
+        embeddings: Embeddings,
+        index_name: str = "index",
+        *,
+        allow_dangerous_deserialization: bool = False,
+        **kwargs: Any,
+    ) -> "MyFaiss":
+        path = Path(folder_path)
+        mmap = kwargs.pop("mmap", False)
+        if not (path / f"{index_name}.areas.pkl").exists():
+            # single index.faiss from older versions, split into areas and save in the new layout
+            db = super().load_local(
+                folder_path,
+                embeddings,
+                index_name,
+                allow_dangerous_deserialization=allow_dangerous_deserialization,
+                **kwargs,
+            )
+            db.save_local(folder_path, index_name)
+            (path / f"{index_name}.faiss").unlink()
+            (path / f"{index_name}.pkl").unlink()
+            return db  # type: ignore
+
+        if not allow_dangerous_deserialization:
+            raise ValueError("Loading the docstore requires allow_dangerous_deserialization=True.")
+        with open(path / f"{index_name}.areas.pkl", "rb") as f:
+            docstore, areas, template, *rest = pickle.load(f)
+        if isinstance(docstore, DiskDocstore):
+            docstore = DiskDocstore(path / docstore.path)
+        db = cls(embeddings, faiss.deserialize_index(template), docstore, {}, **kwargs)
+        db.checkpoint_seq = rest[0] if rest else 0
+        version = f".{db.checkpoint_seq}" if rest else ""  # snapshots before the log were not versioned
+        mmap = mmap and MyFaiss.MMAP_SUPPORTED
+        for area, meta in areas.items():
+            ids = meta["ids"]
+            file = meta.get("file", f"{index_name}.{area}{version}.faiss")
+            db.areas[area] = AreaIndex(
+                faiss.read_index(str(path / file), MyFaiss.MMAP_FLAGS if mmap else 0),
+                ids,
+                meta["kind"],
+                meta["built_size"],
+                ids.count(None),
+                mmap,
+                file if mmap else "",
+            )
+            for pos, id in enumerate(ids):
+                if id is not None:
+                    db._positions[id] = (area, pos)
+        return db
+
+    @staticmethod
+    def exists(folder_path: str, index_name: str = "index") -> bool:
+        path = Path(folder_path)
+        return (path / f"{index_name}.areas.pkl").exists() or (
+            path / f"{index_name}.faiss"
+        ).exists()
+
+
+class SearchFilter(NamedTuple):
+    filter: str = ""
+    limit: int = 10
+    threshold: float = 0.5
+
 
 class Memory:
 
@@ -41,34 +796,102 @@ class Memory:
         INSTRUMENTS = "instruments"
 
     index: dict[str, "MyFaiss"] = {}
+    embeddings_store: SQLiteByteStore | None = None  # shared by all memory subdirs
+
+    KNOWLEDGE_BATCH_SIZE = 256  # knowledge chunks embedded per call
+
+    loading: dict[str, Future] = {}  # memory subdir -> initialization running in background
+    load_failures: dict[str, tuple[int, float]] = {}  # memory subdir -> failed loads in a row, retry time
+    _loading_lock = threading.Lock()
+
+    LOAD_RETRY_SECONDS = 30  # wait before loading again after a failure, doubled with each failure
+    LOAD_RETRY_MAX_SECONDS = 600
 
     @staticmethod
     async def get(agent: Agent):
+        # waits for the memory, a failed load is retried at once and its error raised
+        memory_subdir = agent.config.memory_subdir or "default"
+        if Memory.index.get(memory_subdir) is None:
+            await asyncio.wrap_future(Memory.warmup(agent.config, agent.context.log, retry=True))
+        return Memory(
+            agent=agent,
+            db=Memory.index[memory_subdir],
+            memory_subdir=memory_subdir,
+        )
+
+    @staticmethod
+    def get_ready(agent: Agent) -> "Memory | None":
+        # memory if it is already loaded, otherwise starts loading it and returns None
+        # after a failed load it returns None until the load is retried and succeeds
         memory_subdir = agent.config.memory_subdir or "default"
         if Memory.index.get(memory_subdir) is None:
-            log_item = agent.context.log.log(
-                type="util",
-                heading=f"Initializing VectorDB in '/{memory_subdir}'",
+            Memory.warmup(agent.config, agent.context.log)
+            return None
+        return Memory(
+            agent=agent,
+            db=Memory.index[memory_subdir],
+            memory_subdir=memory_subdir,
+        )
+
+    @staticmethod
+    def warmup(config: AgentConfig, log: Log | None = None, retry: bool = False) -> Future:
+        # load the database and import knowledge in background, started at boot so the first message does not wait
+        # failed loads are retried after a delay, or at once with retry
+        memory_subdir = config.memory_subdir or "default"
+        with Memory._loading_lock:
+            future = Memory.loading.get(memory_subdir)
+            failed = future is not None and future.done() and future.exception() is not None
+            if future is None or (
+                failed and (retry or time.time() >= Memory.load_failures[memory_subdir][1])
+            ):
+                future = Memory.loading[memory_subdir] = Future()
+                threading.Thread(
+                    target=Memory._load,
+                    args=(future, config, memory_subdir, log),
+                    daemon=True,
+                ).start()
+        return future
+
+    @staticmethod
+    def _load(future: Future, config: AgentConfig, memory_subdir: str, log: Log | None):
+        # own thread and event loop, embedding knowledge files does not block running agents
+        try:
+            log_item = (
+                log.log(type="util", heading=f"Initializing VectorDB in '/{memory_subdir}'")
+                if log
+                else None
             )
             db = Memory.initialize(
                 log_item,
-                agent.config.embeddings_model,
+                config.embeddings_model,
                 memory_subdir,
                 False,
+                config.memory_index_type,
+                config.memory_index_threshold,
+                config.memory_mmap,
             )
-            Memory.index[memory_subdir] = db
-            wrap = Memory(agent, db, memory_subdir=memory_subdir)
-            if agent.config.knowledge_subdirs:
-                await wrap.preload_knowledge(
-                    log_item, agent.config.knowledge_subdirs, memory_subdir
+            if config.knowledge_subdirs:
+                wrap = Memory(None, db, memory_subdir=memory_subdir)
+                asyncio.run(
+                    wrap.preload_knowledge(
+                        log_item,
+                        config.knowledge_subdirs,
+                        memory_subdir,
+                        config.knowledge_import_workers,
+                    )
                 )
-            return wrap
-        else:
-            return Memory(
-                agent=agent,
-                db=Memory.index[memory_subdir],
-                memory_subdir=memory_subdir,
-            )
+            Memory.index[memory_subdir] = db  # ready only with knowledge imported
+            with Memory._loading_lock:
+                Memory.load_failures.pop(memory_subdir, None)
+            future.set_result(db)
+        except Exception as e:
+            with Memory._loading_lock:
+                failures = Memory.load_failures.get(memory_subdir, (0, 0))[0] + 1
+                delay = min(Memory.LOAD_RETRY_SECONDS * 2 ** (failures - 1), Memory.LOAD_RETRY_MAX_SECONDS)
+                Memory.load_failures[memory_subdir] = (failures, time.time() + delay)
+            if failures == 1:  # retries failing again are not reported again
+                PrintStyle.error(f"Memory initialization failed: {errors.format_error(e)}")
+            future.set_exception(e)
 
     @staticmethod
     def initialize(
@@ -76,6 +899,9 @@ class Memory:
         embeddings_model,
         memory_subdir: str,
         in_memory=False,
+        index_type: str = "flat",
+        index_threshold: int = 10000,
+        mmap: bool = False,
     ) -> MyFaiss:
 
         print("Initializing VectorDB...")
@@ -83,8 +909,8 @@ class Memory:
         if log_item:
             log_item.stream(progress="\nInitializing VectorDB")
 
-        em_dir = files.get_abs_path(
-            "memory/embeddings"
+        em_file = files.get_abs_path(
+            "memory/embeddings.db"
         )  # just caching, no need to parameterize
         db_dir = Memory._abs_db_dir(memory_subdir)
 
@@ -94,26 +920,30 @@ class Memory:
         if in_memory:
             store = InMemoryByteStore()
         else:
-            os.makedirs(em_dir, exist_ok=True)
-            store = LocalFileStore(em_dir)
+            os.makedirs(os.path.dirname(em_file), exist_ok=True)
+            store = Memory._get_embeddings_store(em_file)
+
+        namespace = getattr(
+            embeddings_model,
+            "model",
+            getattr(embeddings_model, "model_name", "default"),
+        )
 
         # here we setup the embeddings model with the chosen cache storage
         embedder = CacheBackedEmbeddings.from_bytes_store(
             embeddings_model,
             store,
-            namespace=getattr(
-                embeddings_model,
-                "model",
-                getattr(embeddings_model, "model_name", "default"),
-            ),
+            namespace=namespace,
         )
+        # repeated queries from recall, memorize and memory tools are served from cache
+        embedder = CachedQueryEmbeddings(embedder, QueryEmbeddingCache(namespace, store))
 
         # self.db = Chroma(
         #     embedding_function=self.embedder,
         #     persist_directory=db_dir)
 
         # if db folder exists and is not empty:
-        if os.path.exists(db_dir) and files.exists(db_dir, "index.faiss"):
+        if os.path.exists(db_dir) and MyFaiss.exists(db_dir):
             db = MyFaiss.load_local(
                 folder_path=db_dir,
                 embeddings=embedder,
@@ -121,6 +951,7 @@ class Memory:
                 distance_strategy=DistanceStrategy.COSINE,
                 # normalize_L2=True,
                 relevance_score_fn=Memory._cosine_normalizer,
+                mmap=mmap,
             )
         else:
             index = faiss.IndexFlatIP(len(embedder.embed_query("example")))
@@ -134,11 +965,13 @@ class Memory:
                 # normalize_L2=True,
                 relevance_score_fn=Memory._cosine_normalizer,
             )
+        db.open_log(db_dir)  # type: ignore
+        db.configure(index_type, index_threshold, mmap)  # type: ignore
         return db  # type: ignore
 
     def __init__(
         self,
-        agent: Agent,
+        agent: Agent | None,
         db: MyFaiss,
         memory_subdir: str,
     ):
@@ -147,7 +980,11 @@ class Memory:
         self.memory_subdir = memory_subdir
 
     async def preload_knowledge(
-        self, log_item: LogItem | None, kn_dirs: list[str], memory_subdir: str
+        self,
+        log_item: LogItem | None,
+        kn_dirs: list[str],
+        memory_subdir: str,
+        workers: int = knowledge_import.DEFAULT_WORKERS,
     ):
         # db abs path
         db_dir = Memory._abs_db_dir(memory_subdir)
@@ -164,20 +1001,17 @@ class Memory:
             with open(index_path, "r") as f:
                 index = json.load(f)
 
-        # preload knowledge folders
-        index = self._preload_knowledge_folders(log_item, kn_dirs, index)
-
-        for file in index:
-            if index[file]["state"] in ["changed", "removed"] and index[file].get(
-                "ids", []
-            ):  # for knowledge files that have been changed or removed and have IDs
-                await self.delete_documents_by_ids(
-                    index[file]["ids"]
-                )  # remove original version
-            if index[file]["state"] == "changed":
-                index[file]["ids"] = self.insert_documents(
-                    index[file]["documents"]
-                )  # insert new version
+        # files are parsed in worker processes, chunks of finished ones are inserted meanwhile
+        batch: list[tuple[str, int, Document]] = []  # file, chunk position, chunk to insert
+        for file, file_data in knowledge_import.load_knowledge(
+            log_item, self._get_knowledge_sources(kn_dirs), index, workers
+        ):
+            index[file] = file_data
+            if file_data["state"] == "removed" and file_data.get("ids", []):
+                await self.delete_documents_by_ids(file_data["ids"])
+            elif file_data["state"] == "changed":
+                batch = await self._import_knowledge_chunks(index, file, batch)
+        self._insert_knowledge(index, batch)
 
         # remove index where state="removed"
         index = {k: v for k, v in index.items() if v["state"] != "removed"}
@@ -191,37 +1025,77 @@ class Memory:
         with open(index_path, "w") as f:
             json.dump(index, f)
 
-    def _preload_knowledge_folders(
+    async def _import_knowledge_chunks(
         self,
-        log_item: LogItem | None,
-        kn_dirs: list[str],
         index: dict[str, knowledge_import.KnowledgeImport],
+        file: str,
+        batch: list[tuple[str, int, Document]],
     ):
-        # load knowledge folders, subfolders by area
-        for kn_dir in kn_dirs:
-            for area in Memory.Area:
-                index = knowledge_import.load_knowledge(
-                    log_item,
-                    files.get_abs_path("knowledge", kn_dir, area.value),
-                    index,
-                    {"area": area.value},
-                )
+        # chunks are streamed from the worker, only ones with new content are inserted, in batches,
+        # chunks with the same hash keep their document, all previous documents not kept are removed
+        # entries from older versions have no hashes, all their documents are replaced
+        file_data = index[file]
+        old_ids = file_data.get("ids", [])
+        existing = self.db.existing_ids(old_ids)
+        old: dict[str, list[str]] = {}
+        for hash, id in zip(file_data.get("chunks", []), old_ids):
+            if id in existing:
+                old.setdefault(hash, []).append(id)
 
-        # load instruments descriptions
-        index = knowledge_import.load_knowledge(
-            log_item,
-            files.get_abs_path("instruments"),
-            index,
-            {"area": Memory.Area.INSTRUMENTS.value},
-            filename_pattern="**/*.md",
-        )
+        ids: list[str | None] = []
+        hashes: list[str] = []
+        kept: set[str] = set()
+        file_data["ids"] = ids  # type: ignore # new chunks get their ids when inserted
+        file_data["chunks"] = hashes
+        for doc in file_data.pop("documents"):  # type: ignore
+            hash = knowledge_import.calculate_chunk_hash(doc)
+            hashes.append(hash)
+            ids.append(old[hash].pop() if old.get(hash) else None)
+            if ids[-1] is not None:
+                kept.add(ids[-1])
+            else:
+                batch.append((file, len(ids) - 1, doc))
+                if len(batch) >= Memory.KNOWLEDGE_BATCH_SIZE:
+                    self._insert_knowledge(index, batch)
+                    batch = []
 
-        return index
+        vanished = [id for id in old_ids if id in existing and id not in kept]
+        if vanished:
+            await self.delete_documents_by_ids(vanished)
+        return batch
+
+    def _insert_knowledge(
+        self,
+        index: dict[str, knowledge_import.KnowledgeImport],
+        batch: list[tuple[str, int, Document]],
+    ):
+        # new chunks of several files embedded and inserted at once
+        ids = self.insert_documents([doc for _, _, doc in batch])
+        for (file, pos, _), id in zip(batch, ids):
+            index[file]["ids"][pos] = id
+
+    def _get_knowledge_sources(self, kn_dirs: list[str]):
+        # knowledge folders, subfolders by area
+        sources = [
+            (files.get_abs_path("knowledge", kn_dir, area.value), {"area": area.value}, "**/*")
+            for kn_dir in kn_dirs
+            for area in Memory.Area
+        ]
+
+        # instruments descriptions
+        sources.append(
+            (
+                files.get_abs_path("instruments"),
+                {"area": Memory.Area.INSTRUMENTS.value},
+                "**/*.md",
+            )
+        )
+        return sources
 
     async def search_similarity_threshold(
         self, query: str, limit: int, threshold: float, filter: str = ""
     ):
-        comparator = Memory._get_comparator(filter) if filter else None
+        comparator = compile_filter(filter) if filter else None
         return await self.db.asearch(
             query,
             search_type="similarity_score_threshold",
@@ -230,6 +1104,56 @@ class Memory:
             filter=comparator,
         )
 
+    async def search_many(
+        self, queries: list[str], per_query_filters: list[list[SearchFilter]], fetch_k: int = 20
+    ) -> list[list[list[Document]]]:
+        # results for each filter of each query, every distinct query is embedded once
+        # and all of them are searched at once over the areas any of the filters needs
+        distinct = list(dict.fromkeys(queries))
+        embeddings = await asyncio.gather(
+            *[self.db.embedding_function.aembed_query(query) for query in distinct]  # type: ignore
+        )
+
+        areas: set[str] | None = set()
+        for comparator in [compile_filter(f.filter) if f.filter else None for fs in per_query_filters for f in fs]:
+            if comparator is None or comparator.areas is None:
+                areas = None
+                break
+            areas |= comparator.areas  # type: ignore
+        limit = max([f.limit for fs in per_query_filters for f in fs], default=0)
+        if not limit:
+            return [[[] for _ in fs] for fs in per_query_filters]
+
+        candidates = await asyncio.to_thread(
+            self.db.search_candidates,
+            embeddings,
+            None if areas is None else [area for area in self.db.areas if area in areas],
+            max(limit, fetch_k),
+        )
+        by_query = dict(zip(distinct, candidates))
+
+        relevance = self.db._select_relevance_score_fn()
+        results = []
+        for query, search_filters in zip(queries, per_query_filters):
+            # sorted by the raw score, relevance may be clipped
+            candidates = sorted(
+                by_query[query],
+                key=lambda doc: doc[1],
+                reverse=self.db.index.metric_type == faiss.METRIC_INNER_PRODUCT,
+            )
+            scored = [(doc, relevance(score)) for doc, score in candidates]
+            query_results = []
+            for search_filter in search_filters:
+                comparator = compile_filter(search_filter.filter) if search_filter.filter else None
+                docs = [
+                    doc
+                    for doc, score in scored
+                    if score >= search_filter.threshold and (comparator is None or comparator(doc.metadata))
+                ]
+                query_results.append(docs[: search_filter.limit])
+            results.append(query_results)
+        return results
+
     async def delete_documents_by_query(
         self, query: str, threshold: float, filter: str = ""
     ):
@@ -303,19 +1227,82 @@ class Memory:
             self._save_db()  # persist
         return ids
 
-    def _save_db(self):
-        self.db.save_local(folder_path=self._abs_db_dir(self.memory_subdir))
+    async def upsert_batch(
+        self, texts: list[str], metadata: dict = {}, threshold: float = 0.9, filter: str = ""
+    ) -> tuple[list[str], list[Document]]:
+        # insert texts and remove existing documents too similar to any of them (like delete_documents_by_query + insert_text for each)
+        # all texts are embedded in one call, searched together and saved once
+        # duplicates are searched with query embeddings like delete_documents_by_query does,
+        # models with asymmetric embeddings would find different neighbours with the document ones
+        if not texts:
+            return [], []
+        vectors = np.array(await self.db.embedding_function.aembed_documents(texts), dtype=np.float32)  # type: ignore
+        relevance = self.db._select_relevance_score_fn()
+        comparator = compile_filter(filter) if filter else None
+        metadata = {"area": Memory.Area.MAIN.value, **metadata}
+
+        removed: dict[str, Document] = {}
+        if threshold > 0:
+            queries = np.array(
+                await asyncio.gather(
+                    *[self.db.embedding_function.aembed_query(text) for text in texts]  # type: ignore
+                ),
+                dtype=np.float32,
+            )
+            k = 100
+            pending = list(range(len(texts)))
+            while pending:
+                results = await asyncio.to_thread(
+                    self.db.similarity_search_with_score_by_vectors,
+                    queries[pending],
+                    k=k,
+                    filter=comparator,
+                    fetch_k=k,
+                )
+                found = []
+                for docs in results:
+                    found += [doc for doc, score in docs if relevance(score) >= threshold]
+                found = [doc for doc in found if doc.metadata["id"] not in removed]
+                if found:
+                    self.db.delete(ids=list({doc.metadata["id"] for doc in found}))
+                    removed.update((doc.metadata["id"], doc) for doc in found)
+                # more similar documents may be left for queries with k hits
+                pending = [
+                    i for i, docs in zip(pending, results)
+                    if len(docs) == k and relevance(docs[-1][1]) >= threshold
+                ]
+
+            # later texts replace earlier similar ones of the same batch, like when inserted one by one
+            if comparator is None or comparator(metadata):
+                scores = self.db.pairwise_scores(queries, vectors)
+                keep = [
+                    i for i in range(len(texts))
+                    if not any(relevance(scores[j][i]) >= threshold for j in range(i + 1, len(texts)))
+                ]
+                texts = [texts[i] for i in keep]
+                vectors = vectors[keep]
+
+        ids = [str(uuid.uuid4()) for _ in texts]
+        timestamp = self.get_timestamp()
+        self.db.add_embeddings(
+            text_embeddings=list(zip(texts, vectors.tolist())),
+            metadatas=[{"id": id, "timestamp": timestamp, **metadata} for id in ids],
+            ids=ids,
+        )
+        self._save_db()  # persist
+        return ids, list(removed.values())
 
     @staticmethod
-    def _get_comparator(condition: str):
-        def comparator(data: dict[str, Any]):
-            try:
-                return eval(condition, {}, data)
-            except Exception as e:
-                # print(f"Error evaluating condition: {e}")
-                return False
+    def _get_embeddings_store(path: str) -> SQLiteByteStore:
+        if Memory.embeddings_store is None:
+            Memory.embeddings_store = SQLiteByteStore(path)
+            # move the old one-file-per-embedding cache into the packed store
+            Memory.embeddings_store.migrate_dir(files.get_abs_path("memory/embeddings"))
+        return Memory.embeddings_store
 
-        return comparator
+    def _save_db(self):
+        # mutations are persisted by the write-ahead log, the full snapshot is only written from time to time
+        self.db.maybe_checkpoint()
 
     @staticmethod
     def _score_normalizer(val: float) -> float:
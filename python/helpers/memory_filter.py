@@ -0,0 +1,209 @@
+import ast
+import operator
+from functools import lru_cache
+from typing import Any, Callable
+
+# memory filters are python-like conditions over document metadata, e.g. "area == 'main' or area == 'fragments'"
+# they are compiled once into a predicate instead of eval per document
+
+_compare_ops: dict[type, Callable[[Any, Any], Any]] = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+}
+
+_unary_ops: dict[type, Callable[[Any], Any]] = {
+    ast.Not: operator.not_,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+_functions: dict[str, Callable] = {
+    "len": len,
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": bool,
+    "abs": abs,
+    "min": min,
+    "max": max,
+}
+
+_methods = {
+    "startswith",
+    "endswith",
+    "lower",
+    "upper",
+    "strip",
+    "lstrip",
+    "rstrip",
+    "casefold",
+    "find",
+    "count",
+    "isdigit",
+    "get",
+    "keys",
+    "values",
+    "items",
+}
+
+Evaluator = Callable[[dict[str, Any]], Any]
+
+
+class FilterError(Exception):
+    pass
+
+
+class MemoryFilter:
+    def __init__(self, condition: str, evaluate: Evaluator, areas: frozenset[str] | None):
+        self.condition = condition
+        self._evaluate = evaluate
+        self.areas = areas  # areas the filter is limited to, None if not limited
+
+    def __call__(self, metadata: dict[str, Any]) -> bool:
+        try:
+            return bool(self._evaluate(metadata))
+        except Exception:
+            return False  # missing keys, wrong types etc. do not match, just like with eval
+
+    def __repr__(self):
+        return f"MemoryFilter({self.condition!r})"
+
+
+def _never(metadata: dict[str, Any]) -> bool:
+    return False
+
+
+@lru_cache(maxsize=256)
+def compile_filter(condition: str) -> MemoryFilter:
+    try:
+        tree = ast.parse(condition.strip(), mode="eval")
+        evaluate = _compile(tree.body)
+    except (SyntaxError, FilterError):
+        return MemoryFilter(condition, _never, frozenset())  # invalid condition matches nothing
+    return MemoryFilter(condition, evaluate, _get_areas(tree.body))
+
+
+def _compile(node: ast.AST) -> Evaluator:
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda data: value
+
+    if isinstance(node, ast.Name):
+        name = node.id
+        return lambda data: data[name]  # KeyError for missing key, caught by MemoryFilter
+
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        items = [_compile(item) for item in node.elts]
+        if isinstance(node, ast.Set):
+            return lambda data: {item(data) for item in items}
+        return lambda data: [item(data) for item in items]
+
+    if isinstance(node, ast.BoolOp):
+        values = [_compile(value) for value in node.values]
+        if isinstance(node.op, ast.And):
+            def and_(data):
+                result = True
+                for value in values:
+                    result = value(data)
+                    if not result:
+                        return result
+                return result
+            return and_
+
+        def or_(data):
+            result = False
+            for value in values:
+                result = value(data)
+                if result:
+                    return result
+            return result
+        return or_
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _unary_ops:
+        op = _unary_ops[type(node.op)]
+        operand = _compile(node.operand)
+        return lambda data: op(operand(data))
+
+    if isinstance(node, ast.Compare) and all(type(op) in _compare_ops for op in node.ops):
+        left = _compile(node.left)
+        ops = [_compare_ops[type(op)] for op in node.ops]
+        rights = [_compile(right) for right in node.comparators]
+        if len(ops) == 1:
+            op, right = ops[0], rights[0]
+            return lambda data: op(left(data), right(data))
+
+        def chain(data):
+            a = left(data)
+            for op, right in zip(ops, rights):
+                b = right(data)
+                if not op(a, b):
+                    return False
+                a = b
+            return True
+        return chain
+
+    if isinstance(node, ast.Call) and not node.keywords:
+        args = [_compile(arg) for arg in node.args]
+        if isinstance(node.func, ast.Name) and node.func.id in _functions:
+            func = _functions[node.func.id]
+            return lambda data: func(*[arg(data) for arg in args])
+        if isinstance(node.func, ast.Attribute) and node.func.attr in _methods:
+            obj = _compile(node.func.value)
+            method = node.func.attr
+            return lambda data: getattr(obj(data), method)(*[arg(data) for arg in args])
+
+    if isinstance(node, ast.Subscript):
+        obj = _compile(node.value)
+        index = _compile(node.slice)
+        return lambda data: obj(data)[index(data)]
+
+    if isinstance(node, ast.Slice):
+        lower = _compile(node.lower) if node.lower else (lambda data: None)
+        upper = _compile(node.upper) if node.upper else (lambda data: None)
+        return lambda data: slice(lower(data), upper(data))
+
+    raise FilterError(f"Unsupported expression in memory filter: {ast.dump(node)}")
+
+
+def _get_areas(node: ast.AST) -> frozenset[str] | None:
+    # areas a matching document must be in, so the search can skip all other areas
+    if isinstance(node, ast.Compare) and len(node.ops) == 1:
+        left, op, right = node.left, node.ops[0], node.comparators[0]
+        if isinstance(right, ast.Name) and isinstance(op, ast.Eq):
+            left, right = right, left
+        if not (isinstance(left, ast.Name) and left.id == "area"):
+            return None
+        if isinstance(op, ast.Eq) and _is_str(right):
+            return frozenset([right.value])  # type: ignore
+        if (
+            isinstance(op, ast.In)
+            and isinstance(right, (ast.List, ast.Tuple, ast.Set))
+            and all(_is_str(item) for item in right.elts)
+        ):
+            return frozenset(item.value for item in right.elts)  # type: ignore
+        return None
+
+    if isinstance(node, ast.BoolOp):
+        areas = [_get_areas(value) for value in node.values]
+        if isinstance(node.op, ast.Or):
+            if any(area is None for area in areas):
+                return None
+            return frozenset().union(*areas)  # type: ignore
+        limited = [area for area in areas if area is not None]
+        if not limited:
+            return None
+        return frozenset.intersection(*limited)
+
+    return None
+
+
+def _is_str(node: ast.AST) -> bool:
+    return isinstance(node, ast.Constant) and isinstance(node.value, str)
@@ -1,7 +1,7 @@
 from collections import OrderedDict
 from typing import Any
 import uuid
-from agent import Agent, AgentConfig, AgentContext, HumanMessage, AIMessage
+from agent import Agent, AgentConfig, AgentContext, History
 from python.helpers import files
 import json
 from initialize import initialize
@@ -75,14 +75,10 @@ def _serialize_agent(agent: Agent):
     if "subordinate" in data:
         del data["subordinate"]
 
-    history = []
-    for msg in agent.history:
-        history.append({"type": msg.type, "content": msg.content})
-
     return {
         "number": agent.number,
         "data": data,
-        "history": history,
+        "history": agent.history.serialize(),
     }
 
 
@@ -135,7 +131,7 @@ def _deserialize_agents(
             context=context,
         )
         current.data = ag.get("data", {})
-        current.history = _deserialize_history(ag.get("history", []))
+        current.history = History.deserialize(ag.get("history", []))
 
         if not zero:
             zero = current
@@ -148,19 +144,6 @@ def _deserialize_agents(
     return zero or Agent(0, config, context)
 
 
-def _deserialize_history(history: list[dict[str, Any]]):
-    result = []
-    for hist in history:
-        content = hist.get("content", "")
-        msg = (
-            HumanMessage(content=content)
-            if hist.get("type") == "human"
-            else AIMessage(content=content)
-        )
-        result.append(msg)
-    return result
-
-
 def _deserialize_log(data: dict[str, Any]) -> "Log":
     log = Log()
     log.guid = data.get("guid", str(uuid.uuid4()))
@@ -168,9 +151,8 @@ def _deserialize_log(data: dict[str, Any]) -> "Log":
     log.progress_no = data.get("progress_no", 0)
 
     # Deserialize the list of LogItem objects
-    i = 0
     for item_data in data.get("logs", []):
-        log.logs.append(LogItem(
+        item = LogItem(
             log=log,  # restore the log reference
             no=item_data["no"],
             type=item_data["type"],
@@ -178,9 +160,9 @@ def _deserialize_log(data: dict[str, Any]) -> "Log":
             content=item_data.get("content", ""),
             kvps=OrderedDict(item_data["kvps"]) if item_data["kvps"] else None,
             temp=item_data.get("temp", False),
-        ))
-        log.updates.append(i)
-        i += 1
+        )
+        log.logs.append(item)
+        log.mark_updated(item)
         
     return log
 
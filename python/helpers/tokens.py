@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Sequence
+from langchain_core.messages import BaseMessage
+
+MESSAGE_OVERHEAD = 4  # role and separators added by chat formats per message
+CACHE_SIZE = 10000
+
+
+def approximate_tokens(text: str) -> int:
+    # rough estimation used when no tokenizer is available
+    return int(len(text) / 4)
+
+
+class TokenCounter:
+    def __init__(self, encode: Callable[[str], Sequence[Any]] | None = None):
+        self.encode = encode
+        # message text -> tokens, least recently used entries are evicted first
+        self._cache: OrderedDict[str, int] = OrderedDict()
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encode:
+            return len(self.encode(text))
+        return approximate_tokens(text)
+
+    def count_message(self, message: BaseMessage) -> int:
+        content = message.content
+        text = content if isinstance(content, str) else str(content)
+        tokens = self._cache.get(text)
+        if tokens is not None:
+            self._cache.move_to_end(text)
+            return tokens
+
+        tokens = self.count(text) + MESSAGE_OVERHEAD
+        self._cache[text] = tokens
+        if len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return tokens
+
+    def count_messages(self, messages: Sequence[BaseMessage]) -> int:
+        return sum(self.count_message(message) for message in messages)
+
+
+_counters: dict[str, TokenCounter] = {}
+_loading: set[str] = set()
+_loading_lock = threading.Lock()
+_approximate = TokenCounter()  # used until the tokenizer of a model is loaded
+
+
+def get_counter(model: Any = None) -> TokenCounter:
+    # never blocks, the first use of a tokenizer can download its encoding files,
+    # so it is loaded in a thread and text is estimated meanwhile
+    name = _model_name(model)
+    counter = _counters.get(name)
+    if counter is None:
+        warmup(model)
+        counter = _counters.get(name, _approximate)
+    return counter
+
+
+def set_counter(model: Any, counter: TokenCounter):
+    # plug in a custom tokenizer for a model
+    _counters[_model_name(model)] = counter
+
+
+def warmup(*models: Any) -> list[threading.Thread]:
+    # load tokenizers in background, started at boot so prompts are counted exactly from the start
+    threads = []
+    with _loading_lock:
+        for name in {_model_name(model) for model in models}:
+            if name in _counters or name in _loading:
+                continue
+            _loading.add(name)
+            thread = threading.Thread(target=_load, args=(name,), daemon=True)
+            thread.start()
+            threads.append(thread)
+    return threads
+
+
+def _load(name: str):
+    try:
+        _counters[name] = TokenCounter(_get_encoder(name))
+    finally:
+        with _loading_lock:
+            _loading.discard(name)
+
+
+def _model_name(model: Any) -> str:
+    return (getattr(model, "model_name", None) or getattr(model, "model", None) or "") if model else ""
+
+
+def _get_encoder(model_name: str) -> Callable[[str], Sequence[Any]] | None:
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")  # close enough for non-OpenAI models
+        return lambda text: encoding.encode(text, disallowed_special=())
+    except Exception:
+        return None  # encoding files not available (offline), fall back to estimation
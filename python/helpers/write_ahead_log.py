@@ -0,0 +1,112 @@
+import os
+import pickle
+import sys
+from pathlib import Path
+from typing import Any, Iterator
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+
+class LockError(Exception):
+    pass
+
+
+class WriteAheadLog:
+    # append only log of mutations, each record is a pickled (seq, record) tuple
+    # the current segment is rotated to <name>.<last seq> when a snapshot is taken,
+    # rotated segments are removed once the snapshot is on disk
+
+    def __init__(self, path: str | Path, seq: int = 0):
+        self.path = Path(path)
+        self.seq = seq  # sequence number of the last record written
+        self.count = 0  # records in the current segment
+        self.size = 0  # bytes in the current segment
+        self._file = None
+        self._lock_file = None
+
+    def lock(self):
+        # single writer, the log stays locked by this process until closed, the os releases it when the process dies
+        if self._lock_file:
+            return
+        file = open(self.path.with_name(f"{self.path.name}.lock"), "a+b")
+        try:
+            if sys.platform == "win32":
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            raise LockError(f"{self.path} is in use by another process")
+        self._lock_file = file
+
+    def append(self, record: Any) -> int:
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        self.seq += 1
+        data = pickle.dumps((self.seq, record))
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.count += 1
+        self.size += len(data)
+        return self.seq
+
+    def replay(self, after: int = 0) -> Iterator[tuple[int, Any]]:
+        # records with sequence number over after, from all segments in order
+        for segment in self._segments() + [self.path]:
+            if not segment.exists():
+                continue
+            with open(segment, "rb") as f:
+                end = 0
+                while True:
+                    try:
+                        seq, record = pickle.load(f)
+                    except Exception:
+                        break  # end of file or a record torn by a crash
+                    end = f.tell()
+                    self.seq = max(self.seq, seq)
+                    if segment == self.path:
+                        self.count += 1
+                    if seq > after:
+                        yield seq, record
+            if segment == self.path and end < segment.stat().st_size:
+                os.truncate(segment, end)  # drop the torn record, so new records can follow
+        if self.path.exists():
+            self.size = self.path.stat().st_size
+
+    def rotate(self):
+        # start a new segment, records so far go to the next snapshot
+        self._close_segment()
+        if self.path.exists() and self.path.stat().st_size:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.{self.seq}"))
+        self.count = 0
+        self.size = 0
+
+    def remove_segments(self, upto: int):
+        # remove rotated segments contained in a snapshot
+        for segment in self._segments():
+            if int(segment.suffix[1:]) <= upto:
+                segment.unlink()
+
+    def close(self):
+        self._close_segment()
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _close_segment(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _segments(self) -> list[Path]:
+        segments = [
+            file
+            for file in self.path.parent.glob(f"{self.path.name}.*")
+            if file.suffix[1:].isdigit()
+        ]
+        return sorted(segments, key=lambda file: int(file.suffix[1:]))
@@ -6,10 +6,11 @@ from ansio.input import InputEvent, get_input_event
 from agent import AgentContext
 from python.helpers.print_style import PrintStyle
 from python.helpers.files import read_file
-from python.helpers import files
+from python.helpers import files, tokens
 import python.helpers.timed_input as timed_input
 from initialize import initialize
 from python.helpers.dotenv import load_dotenv
+from python.helpers.memory import Memory
 
 
 context: AgentContext = None # type: ignore
@@ -105,6 +106,10 @@ def run():
     config = initialize()
     context = AgentContext(config)
 
+    # load memory, knowledge and tokenizers in background while waiting for the first message
+    Memory.warmup(config, context.log)
+    tokens.warmup(config.chat_model, config.utility_model)
+
     # Start the key capture thread for user intervention during agent streaming
     threading.Thread(target=capture_keys, daemon=True).start()
 
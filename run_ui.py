@@ -12,7 +12,8 @@ from python.helpers import files
 from python.helpers.files import get_abs_path
 from python.helpers.print_style import PrintStyle
 from python.helpers.dotenv import load_dotenv
-from python.helpers import persist_chat
+from python.helpers import persist_chat, tokens
+from python.helpers.memory import Memory
 
 
 # initialize the internal Flask server
@@ -21,6 +22,9 @@ app.config["JSON_SORT_KEYS"] = False  # Disable key sorting in jsonify
 
 lock = threading.Lock()
 
+EVENTS_INTERVAL = 0.5  # seconds between checks of other contexts in the push stream
+EVENTS_KEEPALIVE = 15
+
 # Set up basic authentication, name and password from .env variables
 app.config["BASIC_AUTH_USERNAME"] = (
     os.environ.get("BASIC_AUTH_USERNAME") or "admin"
@@ -307,33 +311,11 @@ async def poll():
         # context instance - get or create
         context = get_context(ctxid)
 
-        logs = context.log.output(start=from_no)
-
-        # loop AgentContext._contexts
-        ctxs = []
-        for ctx in AgentContext._contexts.values():
-            ctxs.append(
-                {
-                    "id": ctx.id,
-                    "no": ctx.no,
-                    "log_guid": ctx.log.guid,
-                    "log_version": len(ctx.log.updates),
-                    "log_length": len(ctx.log.logs),
-                    "paused": ctx.paused,
-                }
-            )
+        # log was reset or client is new, fragments of streamed text would not match its state
+        if input.get("log_guid") != context.log.guid:
+            from_no = 0
 
-        # data from this server
-        response = {
-            "ok": True,
-            "context": context.id,
-            "contexts": ctxs,
-            "logs": logs,
-            "log_guid": context.log.guid,
-            "log_version": len(context.log.updates),
-            "log_progress": context.log.progress,
-            "paused": context.paused,
-        }
+        response = get_updates(context, from_no)
 
     except Exception as e:
         response = {
@@ -348,6 +330,77 @@ async def poll():
     # return jsonify(response)
 
 
+# Web UI push updates (server-sent events), /poll stays as fallback
+@app.route("/events", methods=["GET"])
+def events():
+    ctxid = request.args.get("context", "")
+    from_no = int(request.args.get("log_from", 0))
+    log_guid = request.args.get("log_guid", "")
+
+    # context instance - get or create
+    context = get_context(ctxid)
+
+    def stream():
+        nonlocal from_no, log_guid
+        last = None
+        idle = 0.0
+        while True:
+            if context.log.guid != log_guid:
+                from_no = 0  # log was reset, client clears the chat and gets all items again
+            state = get_updates(context, from_no)
+            logs = state.pop("logs")
+            # nothing is sent if neither log nor context list changed
+            if logs or state != last:
+                last = state
+                from_no = state["log_version"]
+                log_guid = state["log_guid"]
+                idle = 0.0
+                yield f"data: {json.dumps({**state, 'logs': logs})}\n\n"
+            elif idle >= EVENTS_KEEPALIVE:
+                idle = 0.0
+                yield ": keepalive\n\n"  # detects closed connections
+            # context list and pause state of other contexts are checked at least every interval
+            if not context.log.wait(log_guid, from_no, EVENTS_INTERVAL):
+                idle += EVENTS_INTERVAL
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def get_updates(context: AgentContext, from_no: int):
+    version = context.log.version  # read first, items changed meanwhile are sent next time
+    logs = context.log.output(start=from_no, end=version)
+
+    # loop AgentContext._contexts
+    ctxs = []
+    for ctx in AgentContext._contexts.values():
+        ctxs.append(
+            {
+                "id": ctx.id,
+                "no": ctx.no,
+                "log_guid": ctx.log.guid,
+                "log_version": ctx.log.version,
+                "log_length": len(ctx.log.logs),
+                "paused": ctx.paused,
+            }
+        )
+
+    # data from this server
+    return {
+        "ok": True,
+        "context": context.id,
+        "contexts": ctxs,
+        "logs": logs,
+        "log_guid": context.log.guid,
+        "log_version": version,
+        "log_progress": context.log.progress,
+        "paused": context.paused,
+    }
+
+
 def run():
     print("Initializing framework...")
 
@@ -357,6 +410,11 @@ def run():
     # initialize contexts from persisted chats
     persist_chat.load_tmp_chats()
 
+    # load memory, knowledge and tokenizers in background while the server starts
+    config = initialize()
+    Memory.warmup(config)
+    tokens.warmup(config.chat_model, config.utility_model)
+
     # Suppress only request logs but keep the startup messages
     from werkzeug.serving import WSGIRequestHandler
 
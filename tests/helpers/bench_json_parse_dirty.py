@@ -0,0 +1,61 @@
+# Benchmark of DirtyJson on the inputs from test_json_parse_dirty.py scaled up to ~100 KB
+# run with: python -m tests.helpers.bench_json_parse_dirty
+
+import json
+import timeit
+from python.helpers.dirty_json import DirtyJson
+from tests.helpers.test_json_parse_dirty import json_parse_dirty
+
+SIZE = 100_000
+CHUNK = 64  # roughly the size of streamed LLM chunks
+REPEAT = 5
+
+
+def scale(text: str) -> str:
+    return (text * (SIZE // len(text) + 1))[:SIZE]
+
+
+def get_inputs() -> dict[str, str]:
+    value = scale("value ")
+    code = scale("echo 'print(\\'Hello, World!\\')' > hello_world.py\\n")
+    thoughts = ", ".join(['"The user wants to save the source code of their application to a file."'] * (SIZE // 75))
+    return {
+        "valid_json": '{"key": "%s"}' % value,
+        "partial_json": 'some text before {"key": "%s"} some text after' % value,
+        "no_closing_brace": '{"key": "%s"' % value,
+        "agent_response_code": '{"thoughts": ["Saving the file."], "tool_name": "code_execution_tool", '
+        '"tool_args": {"runtime": "terminal", "code": "%s"}}' % code,
+        "agent_response_thoughts": '{"thoughts": [%s], "tool_name": "response", "tool_args": {"text": "done"}}' % thoughts,
+        "multiline_string": '{"key": """%s"""}' % scale("line of text\n"),
+        "unquoted_value": "{key: %s}" % value,
+    }
+
+
+def feed_chunks(text: str):
+    parser = DirtyJson()
+    for i in range(0, len(text), CHUNK):
+        parser.feed(text[i : i + CHUNK])
+    return parser.finish()
+
+
+def measure(func, text: str) -> float:
+    return min(timeit.repeat(lambda: func(text), number=1, repeat=REPEAT)) * 1000
+
+
+def main():
+    print(f"{'input':<26}{'size':>10}{'parse ms':>12}{'stream ms':>12}{'json ms':>10}")
+    for name, text in get_inputs().items():
+        assert feed_chunks(text) == DirtyJson.parse_string(text), name
+        try:
+            json.loads(text)
+            json_ms = f"{measure(json.loads, text):10.2f}"
+        except json.JSONDecodeError:
+            json_ms = f"{'-':>10}"
+        print(
+            f"{name:<26}{len(text):>10}{measure(json_parse_dirty, text):12.2f}"
+            f"{measure(feed_chunks, text):12.2f}{json_ms}"
+        )
+
+
+if __name__ == "__main__":
+    main()
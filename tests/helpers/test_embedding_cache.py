@@ -0,0 +1,144 @@
+import asyncio
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from python.helpers.embedding_cache import CachedQueryEmbeddings, QueryEmbeddingCache, SQLiteByteStore
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.queries: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self.queries.append(text)
+        return [float(len(text)), 1.0]
+
+
+class TestSQLiteByteStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = SQLiteByteStore(Path(self.dir.name) / "embeddings.db")
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def test_bulk_get_set_delete(self):
+        pairs = [(f"model{i}", bytes([i % 256]) * 4) for i in range(1200)]
+        self.store.mset(pairs)
+        self.assertEqual(self.store.mget(["model5", "missing", "model1100"]), [pairs[5][1], None, pairs[1100][1]])
+        self.store.mdelete(["model5"])
+        self.assertEqual(self.store.mget(["model5"]), [None])
+        self.assertEqual(len(list(self.store.yield_keys(prefix="model11"))), 111)
+
+    def test_migrate_dir(self):
+        old = Path(self.dir.name) / "embeddings"
+        (old / "org").mkdir(parents=True)
+        (old / "modelabc").write_bytes(b"1")
+        (old / "org" / "modeldef").write_bytes(b"2")
+
+        self.store.migrate_dir(old)
+        self.assertEqual(self.store.mget(["modelabc", "org/modeldef"]), [b"1", b"2"])
+        self.assertFalse(old.exists())
+
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = SQLiteByteStore(Path(self.dir.name) / "embeddings.db")
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def age(self, cache: QueryEmbeddingCache, text: str, seconds: float):
+        key = cache.get_key(text)
+        timestamp, embedding = cache._cache[key]
+        cache._cache[key] = (timestamp - seconds, embedding)
+        data = struct.pack("d", timestamp - seconds) + np.array(embedding, dtype=np.float32).tobytes()
+        self.store.mset([(key, data)])
+
+    def test_lru_eviction(self):
+        cache = QueryEmbeddingCache(max_size=2)
+        cache.set("a", [1.0])
+        cache.set("b", [2.0])
+        self.assertEqual(cache.get("a"), [1.0])  # now most recently used
+        cache.set("c", [3.0])
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), [1.0])
+        self.assertEqual(cache.get("c"), [3.0])
+        self.assertEqual(cache.stats(), {"hits": 3, "misses": 1, "size": 2})
+
+    def test_evicted_entries_load_from_store(self):
+        cache = QueryEmbeddingCache("model-", self.store, max_size=1)
+        cache.set("first  query", [1.0, 2.0])
+        cache.set("second", [3.0])
+        self.assertEqual(cache.get("first query"), [1.0, 2.0])  # same key after normalizing whitespace
+        self.assertEqual(QueryEmbeddingCache("model-", self.store).get("second"), [3.0])
+        self.assertIsNone(QueryEmbeddingCache("other-", self.store).get("second"))
+
+    def test_ttl_expiry(self):
+        cache = QueryEmbeddingCache("model-", self.store, ttl_seconds=60)
+        cache.set("a", [1.0])
+        cache.set("b", [2.0])
+        self.age(cache, "a", 120)
+        self.age(cache, "b", 30)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), [2.0])
+        self.assertEqual(cache.stats()["size"], 1)  # the expired entry was dropped
+
+    def test_pending_writes(self):
+        cache = QueryEmbeddingCache("model-", self.store, max_size=1)
+        cache.set("a", [1.0], flush=False)
+        cache.set("b", [2.0], flush=False)
+        self.assertEqual(list(self.store.yield_keys()), [])
+        self.assertEqual(cache.get("a"), [1.0])  # evicted but not written yet
+        cache.flush()
+        self.assertEqual(len(list(self.store.yield_keys(prefix="model-"))), 2)
+
+
+class TestCachedQueryEmbeddings(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = SQLiteByteStore(Path(self.dir.name) / "embeddings.db")
+        self.inner = CountingEmbeddings()
+        self.embeddings = CachedQueryEmbeddings(self.inner, QueryEmbeddingCache("model-", self.store))
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def test_cache_hits(self):
+        self.assertEqual(self.embeddings.embed_query("abc"), [3.0, 1.0])
+        self.assertEqual(self.embeddings.embed_query("abc"), [3.0, 1.0])
+        self.assertEqual(asyncio.run(self.embeddings.aembed_query("abc")), [3.0, 1.0])
+        self.assertEqual(self.inner.queries, ["abc"])
+        self.assertEqual(self.embeddings.cache.stats(), {"hits": 2, "misses": 1, "size": 1})
+
+    def test_async_queries_persisted(self):
+        async def embed():
+            return await asyncio.gather(*[self.embeddings.aembed_query(text) for text in ["a", "bb", "a", "ccc"]])
+
+        self.assertEqual(asyncio.run(embed()), [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0], [3.0, 1.0]])
+        self.assertEqual(len(list(self.store.yield_keys(prefix="model-"))), 3)
+
+        cached = CachedQueryEmbeddings(self.inner, QueryEmbeddingCache("model-", self.store))
+        self.inner.queries = []
+        self.assertEqual(asyncio.run(cached.aembed_query("ccc")), [3.0, 1.0])  # from the store
+        self.assertEqual(self.inner.queries, [])
+
+    def test_documents_not_cached(self):
+        self.embeddings.embed_documents(["abc"])
+        self.embeddings.embed_documents(["abc"])
+        self.assertEqual(self.inner.queries, ["abc", "abc"])
+        self.assertEqual(self.embeddings.cache.stats()["size"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from python.helpers import extract_tools, files
+from python.helpers.print_style import PrintStyle
+
+
+class Base:
+    pass
+
+
+class TestClassRegistry(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory(dir=files.get_abs_path("tests"))
+        self.folder = os.path.relpath(self.dir.name, files.get_abs_path()).replace(os.sep, "/")
+        self.log_file_path = PrintStyle.log_file_path
+        PrintStyle.log_file_path = os.path.join(self.dir.name, "log.html")  # keep logs/ clean
+        extract_tools.clear_class_registry()
+
+    def tearDown(self):
+        PrintStyle.log_file_path = self.log_file_path
+        extract_tools.clear_class_registry()
+        self.dir.cleanup()
+
+    def write(self, name: str, source: str, mtime: int):
+        path = os.path.join(self.dir.name, name)
+        with open(path, "w") as f:
+            f.write("from tests.helpers.test_extract_tools import Base\n" + source)
+        os.utime(path, ns=(mtime, mtime))  # distinct mtimes, writes within a test are faster than the clock
+
+    def classes(self, hot_reload: bool = False) -> list[str]:
+        return [cls.__name__ for cls in extract_tools.get_classes_from_folder(self.folder, "*", Base, hot_reload)]
+
+    def log_lines(self) -> int:
+        with open(PrintStyle.log_file_path) as f:  # type: ignore
+            return f.read().count("Failed to import")
+
+    def test_scan_is_cached(self):
+        self.write("a.py", "class A(Base): pass\n", 10**18)
+        self.assertEqual(self.classes(), ["A"])
+        self.write("b.py", "class B(Base): pass\n", 2 * 10**18)
+        self.assertEqual(self.classes(), ["A"])  # without hot reload the folder is not scanned again
+        self.assertIs(
+            extract_tools.get_classes_from_folder(self.folder, "*", Base),
+            extract_tools.get_classes_from_folder(self.folder, "*", Base),
+        )
+
+    def test_hot_reload_picks_up_changes(self):
+        self.write("a.py", "class A(Base): pass\n", 10**18)
+        self.assertEqual(self.classes(hot_reload=True), ["A"])
+        self.write("a.py", "class Changed(Base): pass\n", 2 * 10**18)
+        self.write("b.py", "class B(Base): pass\n", 2 * 10**18)
+        os.utime(self.dir.name, ns=(3 * 10**18, 3 * 10**18))
+        self.assertEqual(self.classes(hot_reload=True), ["Changed", "B"])
+
+    def test_failed_import_is_reported_once(self):
+        self.write("a.py", "class A(Base): pass\n", 10**18)
+        self.write("bad.py", "raise RuntimeError('boom')\n", 10**18)
+        for _ in range(3):
+            self.assertEqual(self.classes(), ["A"])
+        self.assertEqual(self.log_lines(), 1)  # not imported again until the file changes
+
+        self.write("bad.py", "class Fixed(Base): pass\n", 2 * 10**18)
+        self.assertEqual(self.classes(), ["A", "Fixed"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from python.helpers import files
+
+
+class TestReadTemplate(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory(dir=files.get_abs_path("tests"))
+        self.folder = os.path.relpath(self.dir.name, files.get_abs_path()).replace(os.sep, "/")
+        self.check_seconds = files.TEMPLATE_CHECK_SECONDS
+        files._templates.clear()
+        files._mtimes.clear()
+
+    def tearDown(self):
+        files.TEMPLATE_CHECK_SECONDS = self.check_seconds
+        files._templates.clear()
+        files._mtimes.clear()
+        self.dir.cleanup()
+
+    def write(self, name: str, content: str, mtime: int = 10**18):
+        path = os.path.join(self.dir.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        os.utime(path, ns=(mtime, mtime))  # distinct mtimes, writes within a test are faster than the clock
+        os.utime(os.path.dirname(path), ns=(mtime, mtime))
+
+    def path(self, name: str) -> str:
+        return f"{self.folder}/{name}"
+
+    def read(self, file: str, backup_dirs=None, **kwargs) -> str:
+        template = files.read_template(self.path(file), backup_dirs, **kwargs)
+        self.assertEqual(template, files.read_file(self.path(file), backup_dirs, **kwargs))
+        return template
+
+    def test_compiled_once(self):
+        self.write("main.md", "Hello {{name}}, {{missing}} ~~~md\n{{name}}~~~")
+        self.assertEqual(self.read("main.md", name="you"), "Hello you, {{missing}} you")
+        template = files._templates[(self.path("main.md"), ())]
+        self.assertEqual(self.read("main.md", name="me"), "Hello me, {{missing}} me")
+        self.assertIs(files._templates[(self.path("main.md"), ())], template)
+
+    def test_includes(self):
+        self.write("main.md", "start {{ include 'parts/part.md' }} end {{name}}")
+        self.write("parts/part.md", "part {{name}} {{include \"inner.md\"}}")
+        self.write("parts/inner.md", "inner {{value}}")
+        self.assertEqual(self.read("main.md", name="x", value=1), "start part x inner 1 end x")
+
+    def test_backup_dirs(self):
+        self.write("default/main.md", "default {{ include 'part.md' }}")
+        self.write("default/part.md", "default part")
+        self.write("custom/part.md", "custom part")
+        backup_dirs = [self.path("default")]
+        self.assertEqual(self.read("custom/main.md", backup_dirs), "default custom part")
+
+    def test_changed_include(self):
+        files.TEMPLATE_CHECK_SECONDS = 0
+        self.write("main.md", "main {{ include 'part.md' }}")
+        self.write("part.md", "old part")
+        self.assertEqual(self.read("main.md"), "main old part")
+        self.write("part.md", "new part", 2 * 10**18)
+        self.assertEqual(self.read("main.md"), "main new part")
+
+    def test_added_override(self):
+        files.TEMPLATE_CHECK_SECONDS = 0
+        self.write("default/main.md", "main {{ include 'part.md' }}")
+        self.write("default/part.md", "default part")
+        os.makedirs(os.path.join(self.dir.name, "custom"))
+        backup_dirs = [self.path("default")]
+        self.assertEqual(self.read("custom/main.md", backup_dirs), "main default part")
+        self.write("custom/part.md", "custom part", 2 * 10**18)
+        self.assertEqual(self.read("custom/main.md", backup_dirs), "main custom part")
+
+    def test_changes_checked_on_interval(self):
+        files.TEMPLATE_CHECK_SECONDS = 3600
+        self.write("main.md", "old")
+        self.assertEqual(files.read_template(self.path("main.md")), "old")
+        self.write("main.md", "new", 2 * 10**18)
+        self.assertEqual(files.read_template(self.path("main.md")), "old")  # not checked again yet
+        files._mtimes.clear()  # interval passed
+        self.assertEqual(files.read_template(self.path("main.md")), "new")
+
+
+if __name__ == "__main__":
+    unittest.main()
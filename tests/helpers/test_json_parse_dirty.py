@@ -1,3 +1,4 @@
+import json
 import unittest
 from python.helpers.extract_tools import extract_json_object_string
 from python.helpers.dirty_json import DirtyJson
@@ -56,5 +57,47 @@ class TestJsonParseDirty(unittest.TestCase):
         self.assertEqual(json_parse_dirty(json_string), expected_result)
 
 
+class TestDirtyJsonStreaming(unittest.TestCase):
+    def feed_chunks(self, json_string: str, size: int):
+        parser = DirtyJson()
+        partials = []
+        for i in range(0, len(json_string), size):
+            partials.append(parser.feed(json_string[i:i + size]))
+        return parser.finish(), partials
+
+    def test_stream_equals_parse(self):
+        json_string = ('Sure. {"thoughts": ["first", "second"], "tool_name": "code_execution_tool", '
+                       '"tool_args": {"runtime": "python", "code": "print(\'a\')\\nprint(\\"b\\")", "n": -1.5}}')
+        expected_output = DirtyJson.parse_string(json_string)
+        for size in [1, 2, 7, 1000]:
+            result, _ = self.feed_chunks(json_string, size)
+            self.assertEqual(result, expected_output)
+
+    def test_partial_updates(self):
+        json_string = '{"tool_name": "response", "tool_args": {"text": "hello world"}}'
+        parser = DirtyJson()
+        self.assertEqual(parser.feed('{"tool_name": "resp'), {"tool_name": "resp"})
+        self.assertEqual(parser.feed('onse", "tool_args": {"text": "hel'),
+                         {"tool_name": "response", "tool_args": {"text": "hel"}})
+        self.assertEqual(parser.feed('lo world"}}'), json.loads(json_string))
+
+    def test_long_partial_string(self):
+        text = "line of text\\n" * 20000
+        expected = text.replace("\\n", "\n")
+        parser = DirtyJson()
+        parser.feed('{"code": "')
+        for i in range(0, len(text), 64):
+            partial = parser.feed(text[i:i + 64])["code"]
+            self.assertTrue(expected.startswith(partial))
+        # long values lag behind by a bounded fraction, never stall
+        self.assertGreater(len(partial), len(expected) * 0.9)
+        self.assertEqual(parser.feed('"}'), {"code": expected})
+
+    def test_text_before_json(self):
+        result, partials = self.feed_chunks('Let me think... {"key": "value"}', 3)
+        self.assertEqual(result, {"key": "value"})
+        self.assertIsNone(partials[0])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
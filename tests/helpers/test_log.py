@@ -0,0 +1,99 @@
+import json
+import unittest
+from python.helpers.dirty_json import DirtyJson
+from python.helpers.log import Log
+
+
+def merge(old, value, offset):
+    # same as mergeValue in webui/messages.js
+    if isinstance(offset, int) and offset:
+        return (old if isinstance(old, str) else "")[:offset] + value
+    if not offset or not isinstance(value, (dict, list)):
+        return value
+    if isinstance(value, list):
+        return [merge(old[i] if old and i < len(old) else None, v, offset.get(i)) for i, v in enumerate(value)]
+    return {k: merge((old or {}).get(k), v, offset.get(k)) for k, v in value.items()}
+
+
+def merge_item(previous, out):
+    offsets = out.pop("offsets", {})
+    return {**out, **{name: merge((previous or {}).get(name), out[name], offsets.get(name)) for name in ("heading", "content", "kvps")}}
+
+
+class TestLogUpdates(unittest.TestCase):
+    def test_output_since_version(self):
+        log = Log()
+        first = log.log("info", content="a")
+        second = log.log("info", content="b")
+        version = log.version
+        for i in range(100):
+            first.stream(content=str(i))
+        self.assertEqual(len(log.updates), 2)
+        self.assertEqual([o["no"] for o in log.output(start=version)], [0])
+        self.assertEqual([o["no"] for o in log.output()], [1, 0])
+
+        second.update(content="c")
+        self.assertEqual([o["no"] for o in log.output(start=version)], [0, 1])
+        self.assertEqual(log.output(start=log.version), [])
+
+    def test_streamed_fragments(self):
+        log = Log()
+        item = log.log("code_exe", heading="run", content="hello", kvps={"code": "ls"})
+        version = log.version
+        item.stream(content=" world", code=" -la")
+        out = log.output(start=version)[0]
+        self.assertEqual(out["content"], " world")
+        self.assertEqual(out["kvps"], {"code": " -la"})
+        self.assertEqual(out["heading"], "")
+        self.assertEqual(out["offsets"], {"heading": 3, "content": 5, "kvps": {"code": 2}})
+        self.assertNotIn("offsets", log.output()[0])
+
+        # replaced instead of appended, the whole field is sent
+        version = log.version
+        item.update(content="bye", heading="run again")
+        out = log.output(start=version)[0]
+        self.assertEqual(out["content"], "bye")
+        self.assertEqual(out["offsets"], {"heading": 3, "kvps": {"code": 6}})
+
+    def test_streamed_kvps(self):
+        # like Agent.log_from_stream, the parsed response grows in place and is shared with the item
+        log = Log()
+        item = log.log("agent", heading="Agent 0: Generating")
+        response = {
+            "thoughts": [f"thought number {i} " * 20 for i in range(5)],
+            "tool_name": "code_execution_tool",
+            "tool_args": {"runtime": "python", "code": "print('hello')\n" * 50},
+        }
+        text = json.dumps(response)
+        parser = DirtyJson()
+        client, version, sent, whole = None, 0, 0, 0
+        for start in range(0, len(text), 7):
+            with log.changed:
+                item.stream(content=text[start : start + 7], kvps=parser.feed(text[start : start + 7]))
+            out = log.output(start=version)[0]
+            sent += len(json.dumps(out))
+            whole += len(json.dumps(log.output()[0]))
+            client = merge_item(client, out)
+            version = log.version
+            if start > len(text) // 2:
+                self.assertEqual(out["kvps"]["thoughts"][0], "")  # finished texts are not sent again
+
+        parser.finish()
+        self.assertEqual(client["content"], text)
+        self.assertEqual(client["kvps"], response)
+        self.assertEqual(log.output()[0]["kvps"], response)
+        self.assertLess(sent * 5, whole)
+        self.assertIsNot(log.output()[0]["kvps"]["tool_args"], item.kvps["tool_args"])  # copied when sent
+
+    def test_reset(self):
+        log = Log()
+        log.log("info", content="a")
+        guid = log.guid
+        log.reset()
+        self.assertNotEqual(log.guid, guid)
+        self.assertEqual(log.version, 0)
+        self.assertEqual(log.output(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
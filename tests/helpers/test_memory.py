@@ -0,0 +1,422 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from python.helpers.memory import Memory, MyFaiss, SearchFilter
+from python.helpers.print_style import PrintStyle
+
+DIM = 16
+
+
+class CaseInsensitiveEmbedding(DeterministicFakeEmbedding):
+    # normalized, queries are embedded differently from documents like retrieval models with query prefixes
+    query_calls: int = 0
+    document_calls: int = 0
+
+    def _get_embedding(self, seed: int) -> list[float]:
+        vector = np.array(super()._get_embedding(seed))
+        return list(vector / np.linalg.norm(vector))
+
+    def embed_query(self, text: str) -> list[float]:
+        self.query_calls += 1
+        return super().embed_query(text.lower())
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.document_calls += 1
+        return super().embed_documents(texts)
+
+
+def create_db(embedding: DeterministicFakeEmbedding | None = None) -> MyFaiss:
+    return MyFaiss(
+        embedding_function=embedding or DeterministicFakeEmbedding(size=DIM),
+        index=faiss.IndexFlatL2(DIM),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+        distance_strategy=DistanceStrategy.EUCLIDEAN_DISTANCE,
+    )
+
+
+def load_db(folder: str, mmap: bool = False) -> MyFaiss:
+    db = MyFaiss.load_local(
+        folder,
+        DeterministicFakeEmbedding(size=DIM),
+        allow_dangerous_deserialization=True,
+        distance_strategy=DistanceStrategy.EUCLIDEAN_DISTANCE,
+        mmap=mmap,
+    )
+    db.open_log(folder)
+    return db
+
+
+def add_texts(db: MyFaiss, texts: list[str], area: str = "main") -> list[str]:
+    return db.add_documents(
+        [Document(text, metadata={"area": area}) for text in texts],
+        ids=[f"{area}-{text}" for text in texts],
+    )
+
+
+def search_ids(db: MyFaiss, text: str, k: int = 10) -> list[str]:
+    return [doc.page_content for doc in db.similarity_search(text, k=k)]
+
+
+class TestMyFaiss(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_small_area_ivf_pq(self):
+        db = create_db()
+        db.configure("ivf_pq", 10)
+        add_texts(db, [f"text {i}" for i in range(300)])
+        db.wait_rebuilds()
+        self.assertEqual(db.areas["main"].kind, "flat")  # too few points to train pq
+        self.assertEqual(search_ids(db, "text 7", 1), ["text 7"])
+
+    def test_changes_during_rebuild(self):
+        db = create_db()
+        db.configure("ivf", 100)
+        with db._lock:  # the rebuilt index can only be swapped in after these changes
+            ids = add_texts(db, [f"text {i}" for i in range(150)])  # starts the rebuild
+            self.assertTrue(db.areas["main"].rebuilding)
+            db.delete(ids[:20])
+            added = add_texts(db, [f"new {i}" for i in range(30)])
+            self.assertIsNotNone(db.areas["main"].delta)
+        db.wait_rebuilds()
+
+        area = db.areas["main"]
+        self.assertEqual(area.kind, "ivf")
+        self.assertEqual(len(area.ids) - area.deleted, 160)
+        self.assertEqual(db.existing_ids(ids + added), set(ids[20:] + added))
+        self.assertIn("new 5", search_ids(db, "new 5"))
+        self.assertNotIn("text 3", search_ids(db, "text 3", 50))
+
+
+    def test_replay_after_crash(self):
+        db = create_db()
+        db.open_log(self.dir.name)
+        ids = add_texts(db, [f"text {i}" for i in range(20)])
+        db.delete(ids[:5])
+        db.wal.close()  # crash, nothing but the log was written since the first snapshot
+
+        db = load_db(self.dir.name)
+        self.assertEqual(db.existing_ids(ids), set(ids[5:]))
+        self.assertEqual(search_ids(db, "text 9", 1), ["text 9"])
+
+    def test_changes_during_checkpoint(self):
+        db = create_db()
+        db.open_log(self.dir.name)
+        ids = add_texts(db, [f"text {i}" for i in range(20)])
+        with db._lock:
+            snapshot = db._take_snapshot(db.wal.seq)  # type: ignore
+            db.delete(ids[:5])  # positions must not change while the snapshot is written
+            added = add_texts(db, ["new"])
+            self.assertIsNotNone(db.areas["main"].delta)
+        indexes, _ = db._serialize_snapshot(snapshot)
+        self.assertEqual(faiss.deserialize_index(indexes["main"]).ntotal, 20)  # state when it was taken
+        db._release_snapshot(snapshot)
+        db.wait_rebuilds()  # deletes started a compaction too
+        self.assertIsNone(db.areas["main"].delta)
+        self.assertEqual(search_ids(db, "text 9", 1), ["text 9"])
+
+        db.checkpoint(background=False)
+        db.wal.close()  # type: ignore
+        db = load_db(self.dir.name)
+        self.assertEqual(db.existing_ids(ids + added), set(ids[5:] + added))
+        self.assertEqual(search_ids(db, "new", 1), ["new"])
+
+    @unittest.skipUnless(MyFaiss.MMAP_SUPPORTED, "faiss cannot map indexes")
+    def test_mapped_area_changes(self):
+        db = create_db()
+        db.open_log(self.dir.name)
+        ids = add_texts(db, [f"text {i}" for i in range(20)])
+        db.close()
+        db = load_db(self.dir.name, mmap=True)
+        db.configure("flat", 10000, mmap=True)  # moves documents to disk, same sequence as the mapped snapshot
+        area = db.areas["main"]
+        self.assertTrue(area.mapped)
+        self.assertTrue((Path(self.dir.name) / area.file).exists())
+
+        db.delete(ids[:2])
+        added = add_texts(db, ["new"])
+        self.assertIs(db.areas["main"].index, area.index)  # not copied, the addition went to the delta
+        self.assertEqual(db.areas["main"].delta.ntotal, 1)
+
+        db.checkpoint(background=False)
+        remapped = db.areas["main"]
+        self.assertTrue(remapped.mapped)
+        self.assertIsNone(remapped.delta)
+        self.assertEqual(remapped.index.ntotal, 21)
+        self.assertTrue((Path(self.dir.name) / area.file).exists())  # was mapped while writing
+        self.assertEqual(search_ids(db, "new", 1), ["new"])
+
+        add_texts(db, ["newer"])
+        db.checkpoint(background=False)
+        self.assertFalse((Path(self.dir.name) / area.file).exists())
+        db.close()
+        db = load_db(self.dir.name, mmap=True)
+        self.assertEqual(db.existing_ids(ids + added), set(ids[2:] + added))
+        self.assertEqual(search_ids(db, "newer", 1), ["newer"])
+        db.close()
+
+
+class TestUpsertBatch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.embedding = CaseInsensitiveEmbedding(size=DIM)
+        self.memory = Memory(None, create_db(self.embedding), memory_subdir=self.dir.name)  # type: ignore
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def contents(self) -> list[str]:
+        return sorted(doc.page_content for doc in self.memory.db.docstore._dict.values())  # type: ignore
+
+    def upsert(self, texts: list[str], **kwargs):
+        return asyncio.run(self.memory.upsert_batch(texts, **kwargs))
+
+    def test_replaces_similar_documents(self):
+        old = self.memory.insert_text("alpha")
+        kept = self.memory.insert_text("beta", {"area": "solutions"})
+        ids, removed = self.upsert(["Alpha", "gamma"])
+        self.assertEqual([doc.metadata["id"] for doc in removed], [old])  # found by the query embedding
+        self.assertEqual(self.contents(), ["Alpha", "beta", "gamma"])
+        self.assertEqual(set(self.memory.db.docstore._dict), {kept, *ids})  # type: ignore
+
+    def test_filter_and_threshold(self):
+        self.memory.insert_text("alpha", {"area": "solutions"})
+        _, removed = self.upsert(["alpha"], filter="area == 'main'")
+        self.assertEqual(removed, [])
+        _, removed = self.upsert(["alpha"], threshold=0)
+        self.assertEqual(removed, [])
+        self.assertEqual(self.contents(), ["alpha", "alpha", "alpha"])
+
+    def test_batch_replaces_earlier_texts(self):
+        ids, removed = self.upsert(["delta", "epsilon", "Delta"])
+        self.assertEqual(removed, [])
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(self.contents(), ["Delta", "epsilon"])  # like inserting one by one
+
+    def test_embedded_once(self):
+        self.upsert([f"text {i}" for i in range(5)])
+        self.assertEqual(self.embedding.document_calls, 1)
+        self.assertEqual(self.embedding.query_calls, 5)
+        self.assertEqual(len(self.contents()), 5)
+
+
+class TestSearchMany(unittest.TestCase):
+    def setUp(self):
+        self.embedding = CaseInsensitiveEmbedding(size=DIM)
+        db = MyFaiss(  # scored like the agent's memory
+            embedding_function=self.embedding,
+            index=faiss.IndexFlatIP(DIM),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+            distance_strategy=DistanceStrategy.COSINE,
+            relevance_score_fn=Memory._cosine_normalizer,
+        )
+        add_texts(db, [f"text {i}" for i in range(40)])
+        add_texts(db, [f"text {i}" for i in range(20)], "solutions")
+        self.memory = Memory(None, db, memory_subdir="test")  # type: ignore
+
+    def test_matches_single_searches(self):
+        queries = ["text 3", "Text 17", "text 3", "other"]
+        filters = [
+            SearchFilter("area == 'main'", 5, 0.7),
+            SearchFilter("area == 'solutions'", 3, 0.75),
+            SearchFilter("", 8, 0.7),
+        ]
+        results = asyncio.run(self.memory.search_many(queries, [filters] * len(queries)))
+        self.assertEqual(self.embedding.query_calls, 3)  # the repeated query is embedded once
+
+        for query, query_results in zip(queries, results):
+            for search_filter, docs in zip(filters, query_results):
+                expected = asyncio.run(
+                    self.memory.search_similarity_threshold(
+                        query, search_filter.limit, search_filter.threshold, search_filter.filter
+                    )
+                )
+                self.assertTrue(expected)
+                self.assertEqual([doc.metadata for doc in docs], [doc.metadata for doc in expected])
+        self.assertLess(sum(map(len, sum(results, []))), 4 * 16)  # the thresholds cut some results
+
+    def test_no_limit(self):
+        results = asyncio.run(self.memory.search_many(["text 1"], [[SearchFilter(limit=0)]]))
+        self.assertEqual(results, [[[]]])
+
+
+class TestMemoryLoading(unittest.TestCase):
+    SUBDIR = "test-loading"
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.log_file_path = PrintStyle.log_file_path
+        PrintStyle.log_file_path = os.path.join(self.dir.name, "log.html")  # keep logs/ clean
+        self.initialize = Memory.__dict__["initialize"]
+        self.release = threading.Event()
+        self.error: Exception | None = None
+        self.loads = 0
+
+        def initialize(*args):
+            self.loads += 1
+            self.release.wait(5)
+            if self.error:
+                raise self.error
+            return create_db()
+
+        Memory.initialize = staticmethod(initialize)  # type: ignore
+        config = SimpleNamespace(
+            memory_subdir=self.SUBDIR,
+            embeddings_model=None,
+            memory_index_type="flat",
+            memory_index_threshold=0,
+            memory_mmap=False,
+            knowledge_subdirs=[],
+            knowledge_import_workers=1,
+        )
+        self.agent = SimpleNamespace(config=config, context=SimpleNamespace(log=None))
+
+    def tearDown(self):
+        self.release.set()
+        Memory.initialize = self.initialize  # type: ignore
+        for state in (Memory.index, Memory.loading, Memory.load_failures):
+            state.pop(self.SUBDIR, None)
+        PrintStyle.log_file_path = self.log_file_path
+        self.dir.cleanup()
+
+    def get_ready(self) -> Memory | None:
+        return Memory.get_ready(self.agent)  # type: ignore
+
+    def wait(self):
+        future = Memory.loading[self.SUBDIR]
+        self.release.set()
+        future.exception(5)
+        self.release.clear()
+
+    def reported(self) -> int:
+        with open(PrintStyle.log_file_path) as f:  # type: ignore
+            return f.read().count("Memory initialization failed")
+
+    def test_loading_then_ready(self):
+        self.assertIsNone(self.get_ready())
+        self.assertIsNone(self.get_ready())  # still loading, not started again
+        self.wait()
+        self.assertIsNotNone(self.get_ready())
+        self.assertEqual(self.loads, 1)
+
+    def test_failed_load_retried_later(self):
+        self.error = RuntimeError("no embeddings")
+        self.assertIsNone(self.get_ready())
+        self.wait()
+        self.assertIsNone(self.get_ready())  # failed, not retried before the delay
+        self.assertEqual(self.loads, 1)
+
+        Memory.load_failures[self.SUBDIR] = (1, 0)  # delay passed
+        self.assertIsNone(self.get_ready())
+        self.wait()
+        self.assertEqual(self.loads, 2)
+        self.assertEqual(Memory.load_failures[self.SUBDIR][0], 2)
+        self.assertEqual(self.reported(), 1)  # the same failure is reported once
+
+        self.error = None
+        Memory.load_failures[self.SUBDIR] = (2, 0)
+        self.assertIsNone(self.get_ready())
+        self.wait()
+        self.assertIsNotNone(self.get_ready())
+        self.assertNotIn(self.SUBDIR, Memory.load_failures)
+
+    def test_get_retries_failed_load(self):
+        self.error = RuntimeError("no embeddings")
+        self.assertIsNone(self.get_ready())
+        self.wait()
+        self.error = None
+        self.release.set()
+        self.assertIsNotNone(asyncio.run(Memory.get(self.agent)))  # type: ignore
+        self.assertEqual(self.loads, 2)
+
+
+class KnowledgeMemory(Memory):
+    def __init__(self, db: MyFaiss, db_dir: str, kn_dir: str):
+        super().__init__(None, db, memory_subdir=db_dir)  # type: ignore
+        self.kn_dir = kn_dir
+
+    def _get_knowledge_sources(self, kn_dirs: list[str]):
+        return [(self.kn_dir, {"area": "main"}, "**/*")]
+
+    def preload(self) -> dict:
+        asyncio.run(self.preload_knowledge(None, [], self.memory_subdir, workers=1))
+        with open(Path(self.memory_subdir) / "knowledge_import.json") as f:
+            return json.load(f)
+
+
+class TestKnowledgeImport(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.kn_dir = Path(self.dir.name) / "knowledge"
+        self.kn_dir.mkdir()
+        self.memory = KnowledgeMemory(create_db(), str(Path(self.dir.name) / "db"), str(self.kn_dir))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name: str, text: str) -> str:
+        (self.kn_dir / name).write_text(text)
+        return str(self.kn_dir / name)
+
+    def stored_ids(self) -> set[str]:
+        return set(self.memory.db.docstore._dict)  # type: ignore
+
+    def test_changed_and_removed_files(self):
+        first = self.write("first.txt", "first version")
+        second = self.write("second.txt", "second file")
+        index = self.memory.preload()
+        self.assertEqual(self.stored_ids(), set(index[first]["ids"] + index[second]["ids"]))
+
+        self.write("first.txt", "first version, changed")
+        (self.kn_dir / "second.txt").unlink()
+        old = index[first]["ids"]
+        index = self.memory.preload()
+        self.assertNotIn(second, index)
+        self.assertEqual(self.stored_ids(), set(index[first]["ids"]))
+        self.assertFalse(set(old) & self.stored_ids())
+
+    def test_changed_section(self):
+        sections = [f"section {i} " + "words " * 500 for i in range(3)]  # one chunk each
+        first = self.write("first.txt", "\n\n".join(sections))
+        old = self.memory.preload()[first]["ids"]
+        self.assertEqual(len(old), 3)
+
+        sections[1] = "section 1 rewritten " + "words " * 400
+        self.write("first.txt", "\n\n".join(sections))
+        ids = self.memory.preload()[first]["ids"]
+        self.assertEqual([ids[0], ids[2]], [old[0], old[2]])
+        self.assertNotEqual(ids[1], old[1])
+        self.assertEqual(self.stored_ids(), set(ids))
+        self.assertIn("rewritten", self.memory.db.docstore.search(ids[1]).page_content)  # type: ignore
+
+    def test_changed_legacy_entry(self):
+        first = self.write("first.txt", "first version")
+        index = self.memory.preload()
+        del index[first]["chunks"]  # written by a version without chunk hashes
+        with open(Path(self.memory.memory_subdir) / "knowledge_import.json", "w") as f:
+            json.dump(index, f)
+
+        self.write("first.txt", "first version, changed")
+        index = self.memory.preload()
+        self.assertEqual(self.stored_ids(), set(index[first]["ids"]))
+        self.assertEqual(len(self.stored_ids()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
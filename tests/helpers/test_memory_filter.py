@@ -0,0 +1,46 @@
+import unittest
+from python.helpers.memory_filter import compile_filter
+
+
+class TestMemoryFilter(unittest.TestCase):
+    def setUp(self):
+        self.doc = {"area": "main", "timestamp": "2024-05-01 10:00:00", "id": "abc", "tags": ["x", "y"]}
+
+    def test_same_result_as_eval(self):
+        conditions = [
+            "area == 'main'",
+            "area=='fragments'",
+            "area == 'main' or area == 'fragments'",
+            "area == 'main' and timestamp < '2024-01-01 00:00:00'",
+            "timestamp.startswith('2024-05')",
+            "not area == 'solutions'",
+            "area in ['main', 'solutions']",
+            "'x' in tags and len(tags) == 2",
+            "'2024' <= timestamp[:4] <= '2025'",
+            "area != 'main'",
+        ]
+        for condition in conditions:
+            self.assertEqual(compile_filter(condition)(self.doc), bool(eval(condition, {}, self.doc)), condition)
+
+    def test_missing_key_does_not_match(self):
+        self.assertFalse(compile_filter("knowledge_source == True")(self.doc))
+        self.assertTrue(compile_filter("area == 'main' or knowledge_source")(self.doc))
+
+    def test_invalid_and_unsafe_conditions_match_nothing(self):
+        for condition in ["area ==", "__import__('os').system('echo')", "(lambda: 1)()", "area.__class__"]:
+            filter = compile_filter(condition)
+            self.assertFalse(filter(self.doc), condition)
+            self.assertEqual(filter.areas, frozenset(), condition)
+
+    def test_areas(self):
+        self.assertEqual(compile_filter("area == 'main'").areas, {"main"})
+        self.assertEqual(compile_filter("area == 'main' or area == 'fragments'").areas, {"main", "fragments"})
+        self.assertEqual(compile_filter("area in ('main', 'solutions')").areas, {"main", "solutions"})
+        self.assertEqual(compile_filter("area == 'main' and timestamp < '2024'").areas, {"main"})
+        self.assertIsNone(compile_filter("area == 'main' or timestamp < '2024'").areas)
+        self.assertIsNone(compile_filter("area != 'main'").areas)
+        self.assertIsNone(compile_filter("timestamp.startswith('2022-01-01')").areas)
+
+
+if __name__ == "__main__":
+    unittest.main()
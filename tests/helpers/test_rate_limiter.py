@@ -0,0 +1,83 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from python.helpers import rate_limiter
+from python.helpers.print_style import PrintStyle
+
+WINDOW = 0.2
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.log_file_path = PrintStyle.log_file_path
+        PrintStyle.log_file_path = os.path.join(self.dir.name, "log.html")  # keep logs/ clean
+
+    def tearDown(self):
+        PrintStyle.log_file_path = self.log_file_path
+        rate_limiter._limiters.clear()
+        self.dir.cleanup()
+
+    async def timed_call(self, limiter: rate_limiter.RateLimiter, input_tokens: int = 0):
+        start = time.monotonic()
+        record = await limiter.limit_call_and_input(input_tokens)
+        return record, time.monotonic() - start
+
+    def test_limiters_shared_per_model_endpoint(self):
+        model = SimpleNamespace(model_name="gpt", base_url="http://a")
+        limiter = rate_limiter.get_limiter(model, 10, 0, 0)
+        same = rate_limiter.get_limiter(SimpleNamespace(model_name="gpt", base_url="http://a"), 5, 100, 0)
+        self.assertIs(same, limiter)
+        self.assertEqual((limiter.max_calls, limiter.max_input_tokens), (5, 100))  # latest configuration
+        for other in [SimpleNamespace(model_name="gpt", base_url="http://b"), SimpleNamespace(model_name="o", base_url="http://a")]:
+            self.assertIsNot(rate_limiter.get_limiter(other, 5, 0, 0), limiter)
+
+    async def test_calls_wait_for_window(self):
+        limiter = rate_limiter.RateLimiter(2, 0, 0, WINDOW)  # type: ignore
+        for _ in range(2):
+            _, waited = await self.timed_call(limiter)
+            self.assertLess(waited, WINDOW / 2)
+        _, waited = await self.timed_call(limiter)
+        self.assertGreaterEqual(waited, WINDOW * 0.9)
+        self.assertEqual(len(limiter.call_records), 1)  # the earlier calls left the window
+
+    async def test_input_tokens_wait_for_window(self):
+        limiter = rate_limiter.RateLimiter(0, 100, 0, WINDOW)  # type: ignore
+        _, waited = await self.timed_call(limiter, 150)
+        self.assertLess(waited, WINDOW / 2)  # over the limit alone, waiting would not help
+        _, waited = await self.timed_call(limiter, 60)
+        self.assertGreaterEqual(waited, WINDOW * 0.9)
+        _, waited = await self.timed_call(limiter, 40)
+        self.assertLess(waited, WINDOW / 2)
+        self.assertEqual(limiter.input_tokens, 100)
+
+    async def test_concurrent_calls_do_not_overshoot(self):
+        limiter = rate_limiter.RateLimiter(2, 0, 0, WINDOW)  # type: ignore
+        results = await asyncio.gather(*[self.timed_call(limiter) for _ in range(4)])
+        waits = sorted(waited for _, waited in results)
+        self.assertLess(waits[1], WINDOW / 2)
+        self.assertGreaterEqual(waits[2], WINDOW * 0.9)
+
+    async def test_output_tokens_charged_to_record(self):
+        limiter = rate_limiter.RateLimiter(0, 0, 100, WINDOW)  # type: ignore
+        first = await limiter.limit_call_and_input(10)
+        second = await limiter.limit_call_and_input(10)
+        limiter.set_output_tokens(first, 60)
+        limiter.set_output_tokens(first, 40)  # streamed in parts
+        self.assertEqual((first.output_tokens, second.output_tokens), (100, 0))
+        self.assertEqual(limiter.output_tokens, 100)
+
+        _, waited = await self.timed_call(limiter)
+        self.assertGreaterEqual(waited, WINDOW * 0.9)
+        self.assertFalse(first.active)
+        self.assertEqual(limiter.output_tokens, 0)
+        limiter.set_output_tokens(first, 50)  # finished after leaving the window
+        limiter.set_output_tokens(second, 5)
+        self.assertEqual(limiter.output_tokens, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
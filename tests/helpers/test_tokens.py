@@ -0,0 +1,88 @@
+import sys
+import threading
+import unittest
+from types import SimpleNamespace
+from langchain_core.messages import AIMessage, HumanMessage
+from python.helpers import tokens
+
+
+class TestTokenCounter(unittest.TestCase):
+    def setUp(self):
+        self.encoded: list[str] = []
+
+    def encode(self, text: str) -> list[str]:
+        self.encoded.append(text)
+        return text.split()
+
+    def test_messages_cached_by_text(self):
+        counter = tokens.TokenCounter(self.encode)
+        self.assertEqual(counter.count_message(HumanMessage("one two three")), 3 + tokens.MESSAGE_OVERHEAD)
+        self.assertEqual(counter.count_message(AIMessage("one two three")), 3 + tokens.MESSAGE_OVERHEAD)
+        messages = [HumanMessage("one two three"), HumanMessage("four")]
+        self.assertEqual(counter.count_messages(messages), 4 + 2 * tokens.MESSAGE_OVERHEAD)
+        self.assertEqual(self.encoded, ["one two three", "four"])
+
+    def test_least_recently_used_evicted(self):
+        cache_size = tokens.CACHE_SIZE
+        tokens.CACHE_SIZE = 2
+        try:
+            counter = tokens.TokenCounter(self.encode)
+            counter.count_messages([HumanMessage("a"), HumanMessage("b"), HumanMessage("a"), HumanMessage("c")])
+            self.assertEqual(list(counter._cache), ["a", "c"])
+            counter.count_messages([HumanMessage("a"), HumanMessage("b")])
+            self.assertEqual(self.encoded, ["a", "b", "c", "b"])
+        finally:
+            tokens.CACHE_SIZE = cache_size
+
+    def test_estimate_without_encoder(self):
+        counter = tokens.TokenCounter()
+        self.assertEqual(counter.count("x" * 40), 10)
+        self.assertEqual(counter.count(""), 0)
+
+
+class TestGetCounter(unittest.TestCase):
+    def setUp(self):
+        self.get_encoder = tokens._get_encoder
+        self.model = SimpleNamespace(model_name="test-tokens")
+
+    def tearDown(self):
+        tokens._get_encoder = self.get_encoder
+        tokens._counters.pop("test-tokens", None)
+
+    def test_estimates_while_loading(self):
+        release = threading.Event()
+
+        def get_encoder(name: str):
+            release.wait(5)  # downloading the encoding
+            return str.split
+
+        tokens._get_encoder = get_encoder
+        [thread] = tokens.warmup(self.model, self.model)
+        self.assertEqual(tokens.warmup(self.model), [])  # already loading
+        self.assertIs(tokens.get_counter(self.model), tokens._approximate)
+
+        release.set()
+        thread.join(5)
+        counter = tokens.get_counter(self.model)
+        self.assertIsNot(counter, tokens._approximate)
+        self.assertEqual(counter.count("one two three"), 3)
+
+    def test_fallback_without_tiktoken(self):
+        tiktoken = sys.modules.get("tiktoken")
+        sys.modules["tiktoken"] = None  # type: ignore # import fails
+        try:
+            self.assertIsNone(tokens._get_encoder("test-tokens"))
+            for thread in tokens.warmup(self.model):
+                thread.join(5)
+        finally:
+            if tiktoken is None:
+                del sys.modules["tiktoken"]
+            else:
+                sys.modules["tiktoken"] = tiktoken
+        counter = tokens.get_counter(self.model)
+        self.assertIsNone(counter.encode)
+        self.assertEqual(counter.count("x" * 40), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from python.helpers.write_ahead_log import LockError, WriteAheadLog
+
+
+class TestWriteAheadLog(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.dir.name) / "index.wal"
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_replay_after_snapshot(self):
+        wal = WriteAheadLog(self.path)
+        for i in range(3):
+            wal.append(("add", i))
+        wal.rotate()
+        wal.append(("delete", 0))
+        wal.close()
+
+        wal = WriteAheadLog(self.path)
+        self.assertEqual(list(wal.replay(after=2)), [(3, ("add", 2)), (4, ("delete", 0))])
+        self.assertEqual(wal.seq, 4)
+        self.assertEqual(wal.count, 1)
+
+        wal.remove_segments(upto=3)
+        self.assertEqual(list(WriteAheadLog(self.path).replay()), [(4, ("delete", 0))])
+
+    def test_torn_record_is_dropped(self):
+        wal = WriteAheadLog(self.path)
+        wal.append(("add", 1))
+        wal.close()
+        with open(self.path, "ab") as f:
+            f.write(b"\x80\x04torn")
+
+        wal = WriteAheadLog(self.path)
+        self.assertEqual(list(wal.replay()), [(1, ("add", 1))])
+        wal.append(("add", 2))
+        wal.close()
+        self.assertEqual([seq for seq, _ in WriteAheadLog(self.path).replay()], [1, 2])
+
+    def test_single_writer(self):
+        wal = WriteAheadLog(self.path)
+        wal.lock()
+        wal.append(("add", 1))
+        wal.rotate()  # still locked
+        with self.assertRaises(LockError):
+            WriteAheadLog(self.path).lock()  # separate open files conflict like other processes do
+        wal.close()
+
+        other = WriteAheadLog(self.path)
+        other.lock()
+        other.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
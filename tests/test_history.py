@@ -0,0 +1,184 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from agent import Agent, AgentConfig, AgentContext, History, Summary
+from python.helpers import tokens
+from python.helpers.print_style import PrintStyle
+
+
+def build_history() -> History:
+    history = History()
+    for i in range(3):
+        history.add_message(f"task {i}", human=True)
+        for j in range(8):
+            history.add_message(f"answer {i}.{j}", human=False)
+            history.add_message(f"result {i}.{j}", human=True)
+        history.start_monologue()
+    return history
+
+
+def contents(history: History) -> list[str]:
+    return [str(message.content) for message in history.output()]
+
+
+class TestHistory(unittest.TestCase):
+    def test_merged_output_is_cached(self):
+        history = History()
+        history.summaries.append(Summary(1, "earlier"))
+        history.add_message("question", human=True)
+        first = history.output()
+        self.assertEqual(len(first), 1)
+        self.assertIs(history.output()[0], first[0])
+
+        history.add_message("more", human=True)
+        self.assertEqual(history.output()[0].content, "earlier\n\nquestion\n\nmore")
+
+    def test_finished_monologue_keeps_summaries(self):
+        history = History()
+        history.add_message("task", human=True)
+        for j in range(8):
+            history.add_message(f"answer {j}", human=False)
+            history.add_message(f"result {j}", human=True)
+        compaction = history.get_compaction(keep_start=1, keep_end=1)
+        self.assertTrue(history.apply_compaction(compaction, "chunk summary"))  # type: ignore
+        history.start_monologue()
+        history.add_message("next task", human=True)
+
+        compaction = history.get_compaction(keep_start=1, keep_end=1)
+        self.assertFalse(any(isinstance(item, Summary) for item in compaction.items))  # type: ignore
+        self.assertTrue(history.apply_compaction(compaction, "monologue summary"))  # type: ignore
+        self.assertEqual(
+            [summary.content for summary in history.summaries],
+            ["chunk summary", "monologue summary"],
+        )
+
+    def test_serialization_keeps_order_through_compaction(self):
+        history = build_history()
+        for j in range(8):
+            history.add_message(f"current {j}", human=j % 2 == 0)
+        steps = 0
+        while compaction := history.get_compaction(keep_start=1, keep_end=2):
+            self.assertTrue(history.apply_compaction(compaction, f"summary {steps}"))
+            steps += 1
+            restored = History.deserialize(history.serialize())
+            self.assertEqual(contents(restored), contents(history))
+        self.assertEqual(
+            contents(history),
+            ["summary 0\n\nsummary 1\n\nsummary 2\n\ncurrent 0\n\nsummary 3\n\ncurrent 6", "current 7"],
+        )
+
+
+class TestBackgroundCompaction(unittest.IsolatedAsyncioTestCase):
+    # messages of about 100 tokens against a budget of 1000
+    MESSAGE = "x" * 396
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.log_file_path = PrintStyle.log_file_path
+        PrintStyle.log_file_path = os.path.join(self.dir.name, "log.html")
+        model = SimpleNamespace(model_name="stub")
+        config = AgentConfig(
+            chat_model=model,  # type: ignore
+            utility_model=model,  # type: ignore
+            embeddings_model=None,  # type: ignore
+            msgs_max_tokens=1000,
+            msgs_keep_start=1,
+            msgs_keep_end=2,
+        )
+        self.context = AgentContext(config)
+        self.agent = self.context.agent0
+        self.summaries = 0
+        self.release = asyncio.Event()
+        self.release.set()
+        self.fail = False
+
+        async def summarize(compaction, interruptible=True):
+            await self.release.wait()
+            if self.fail:
+                raise RuntimeError("utility model down")
+            self.summaries += 1
+            return f"summary {self.summaries}"
+
+        self.agent._summarize = summarize  # type: ignore
+
+    def tearDown(self):
+        self.context.kill()
+        AgentContext.remove(self.context.id)
+        PrintStyle.log_file_path = self.log_file_path
+        self.dir.cleanup()
+
+    def history_tokens(self) -> int:
+        return tokens.get_counter(self.agent.config.chat_model).count_messages(self.agent.history.output())
+
+    async def append(self, count: int):
+        for i in range(count):
+            await self.agent.append_message(f"{i} {self.MESSAGE}", human=i % 2 == 0)
+
+    async def test_scheduled_at_threshold(self):
+        self.release.clear()
+        await self.append(7)
+        self.assertLess(self.history_tokens(), 800)
+        self.assertIsNone(self.agent.compaction_task)
+        await self.append(1)
+        self.assertGreater(self.history_tokens(), 800)
+        self.assertIsNotNone(self.agent.compaction_task)
+
+    async def test_summary_applied_at_iteration_boundary(self):
+        await self.append(8)
+        task = self.agent.compaction_task
+        await asyncio.wait([task])  # type: ignore
+        self.assertNotIn("summary 1", str(self.agent.history.output()))  # not swapped in while the loop runs
+
+        await self.agent.apply_history_compaction()
+        self.assertIn("summary 1", str(self.agent.history.output()))
+        self.assertLess(self.history_tokens(), 800)
+
+    async def test_stale_compaction_is_dropped(self):
+        await self.append(8)
+        await asyncio.wait([self.agent.compaction_task])  # type: ignore
+        self.agent.history = History.deserialize(self.agent.history.serialize())  # e.g. chat loaded meanwhile
+        self.release.clear()  # the next attempt stays pending
+        before = [message.content for message in self.agent.history.output()]
+        await self.agent.apply_history_compaction()
+        self.assertEqual([message.content for message in self.agent.history.output()], before)
+        self.assertIsNotNone(self.agent.compaction_task)  # scheduled again for the current history
+
+    async def test_over_budget_waits_for_summaries(self):
+        self.release.clear()
+        await self.append(20)  # way over the budget before anything finished
+        self.assertGreater(self.history_tokens(), 1000)
+        asyncio.get_running_loop().call_later(0.01, self.release.set)
+        await self.agent.apply_history_compaction()
+        self.assertLessEqual(self.history_tokens(), 1000)
+        self.assertGreater(self.summaries, 1)
+
+    async def test_failure_backs_off(self):
+        self.fail = True
+        await self.append(8)
+        await asyncio.wait([self.agent.compaction_task])  # type: ignore
+        await self.agent.apply_history_compaction()
+        self.assertEqual(self.agent.compaction_failures, 1)
+        await self.append(4)
+        self.assertIsNone(self.agent.compaction_task)  # not retried on every message
+
+        self.fail = False
+        self.agent.compaction_retry_at = 0
+        await self.append(1)
+        await self.agent.apply_history_compaction()
+        self.assertEqual(self.agent.compaction_failures, 0)
+        self.assertIn("summary 1", str(self.agent.history.output()))
+
+    async def test_reset_cancels_compaction(self):
+        self.release.clear()
+        await self.append(8)
+        task = self.agent.compaction_task
+        self.context.reset()
+        await asyncio.wait([task])  # type: ignore
+        self.assertTrue(task.cancelled())  # type: ignore
+        self.assertEqual(self.context.log.logs, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -179,51 +179,59 @@ function generateGUID() {
 
 let lastLogVersion = 0;
 let lastLogGuid = ""
+const logItems = new Map() // full log items by no, streamed updates only carry the new text
 
 async function poll() {
     let updated = false
     try {
-        const response = await sendJsonData("/poll", { log_from: lastLogVersion, context });
+        const response = await sendJsonData("/poll", { log_from: lastLogVersion, log_guid: lastLogGuid, context });
         //console.log(response)
 
-        if (response.ok) {
+        if (response.ok) updated = applyUpdates(response)
 
-            if (!context) setContext(response.context)
-            if (response.context != context) return //skip late polls after context change
+    } catch (error) {
+        console.error('Error:', error);
+        const statusAD = Alpine.$data(statusSection);
+        statusAD.connected = false;
+    }
 
-            if (lastLogGuid != response.log_guid) {
-                chatHistory.innerHTML = ""
-                lastLogVersion = 0
-            }
+    return updated
+}
 
-            if (lastLogVersion != response.log_version) {
-                updated = true
-                for (const log of response.logs) {
-                    setMessage(log.no, log.type, log.heading, log.content, log.temp, log.kvps);
-                }
-            }
+// same payload comes from /poll and from the /events push stream
+function applyUpdates(response) {
+    let updated = false
 
-            updateProgress(response.log_progress)
+    if (!context) setContext(response.context)
+    if (response.context != context) return false //skip late polls after context change
 
-            //set ui model vars from backend
-            const inputAD = Alpine.$data(inputSection);
-            inputAD.paused = response.paused;
-            const statusAD = Alpine.$data(statusSection);
-            statusAD.connected = response.ok;
-            const chatsAD = Alpine.$data(chatsSection);
-            chatsAD.contexts = response.contexts;
+    if (lastLogGuid != response.log_guid) {
+        chatHistory.innerHTML = ""
+        logItems.clear()
+        lastLogVersion = 0
+    }
 
-            lastLogVersion = response.log_version;
-            lastLogGuid = response.log_guid;
+    if (lastLogVersion != response.log_version) {
+        updated = true
+        for (const log of response.logs) {
+            const item = msgs.mergeLogItem(logItems.get(log.no), log)
+            logItems.set(item.no, item)
+            setMessage(item.no, item.type, item.heading, item.content, item.temp, item.kvps);
+        }
+    }
 
+    updateProgress(response.log_progress)
 
-        }
+    //set ui model vars from backend
+    const inputAD = Alpine.$data(inputSection);
+    inputAD.paused = response.paused;
+    const statusAD = Alpine.$data(statusSection);
+    statusAD.connected = response.ok;
+    const chatsAD = Alpine.$data(chatsSection);
+    chatsAD.contexts = response.contexts;
 
-    } catch (error) {
-        console.error('Error:', error);
-        const statusAD = Alpine.$data(statusSection);
-        statusAD.connected = false;
-    }
+    lastLogVersion = response.log_version;
+    lastLogGuid = response.log_guid;
 
     return updated
 }
@@ -300,6 +308,7 @@ const setContext = function (id) {
     lastLogVersion = 0
     const chatsAD = Alpine.$data(chatsSection);
     chatsAD.selected = id
+    if (eventSource && eventsContext != id) startEvents() // stream the new context
 }
 
 window.toggleAutoScroll = async function (_autoScroll) {
@@ -538,6 +547,43 @@ chatInput.addEventListener('input', adjustTextareaHeight);
 
 // setInterval(poll, 250);
 
+let eventSource = null
+let eventsContext = null
+let eventsFailures = 0
+
+// push updates from the server, polling is only used when the stream does not work
+function startEvents() {
+    if (eventSource) eventSource.close()
+    const params = new URLSearchParams({ context, log_from: lastLogVersion, log_guid: lastLogGuid })
+    eventsContext = context
+    let received = false
+    const source = eventSource = new EventSource("/events?" + params)
+
+    source.onmessage = (event) => {
+        received = true
+        eventsFailures = 0
+        const response = JSON.parse(event.data)
+        eventsContext = response.context
+        applyUpdates(response)
+    }
+
+    source.onerror = () => {
+        source.close()
+        if (eventSource != source) return // replaced by a stream of another context
+        eventSource = null
+        const statusAD = Alpine.$data(statusSection);
+        statusAD.connected = false;
+        if (!received) eventsFailures++
+        if (eventsFailures >= 3) startPolling() // push not available, e.g. a buffering proxy
+        else setTimeout(startEvents, 1000) // reconnect from the last version received
+    }
+}
+
+function startUpdates() {
+    if (window.EventSource) startEvents()
+    else startPolling()
+}
+
 async function startPolling() {
     const shortInterval = 25
     const longInterval = 250
@@ -563,4 +609,4 @@ async function startPolling() {
     _doPoll();
 }
 
-document.addEventListener("DOMContentLoaded", startPolling);
+document.addEventListener("DOMContentLoaded", startUpdates);
@@ -27,6 +27,27 @@ export function getHandler(type) {
     }
 }
 
+// streamed texts of a log item arrive as the text after their offset, offsets mirror the item,
+// the text before it is taken from the previous state of the same item, also in nested kvps
+export function mergeLogItem(previous, log) {
+    const offsets = log.offsets
+    if (!offsets) return log
+    const item = { ...log }
+    delete item.offsets
+    for (const field of ["heading", "content", "kvps"]) {
+        item[field] = mergeValue(previous?.[field], log[field], offsets[field])
+    }
+    return item
+}
+
+function mergeValue(old, value, offset) {
+    if (typeof offset === "number") return (typeof old === "string" ? old : "").slice(0, offset) + value
+    if (!offset || !value || typeof value !== "object") return value
+    const merged = Array.isArray(value) ? [] : {}
+    for (const [key, v] of Object.entries(value)) merged[key] = mergeValue(old?.[key], v, offset[key])
+    return merged
+}
+
 export function _drawMessage(messageContainer, heading, content, temp, followUp, kvps = null, messageClasses = [], contentClasses = []) {
 
 